@@ -1,4 +1,6 @@
 from benchmarks.htap.lib.controller import HTAPController
+from s64da_benchmark_toolkit.distributed import add_agent_arguments
+from s64da_benchmark_toolkit.drivers import DRIVERS
 
 
 def add_parser(subparsers):
@@ -48,6 +50,22 @@ def add_parser(subparsers):
         required=False, help=('Use server-side cursors for executing the queries')
     )
 
+    parser.add_argument('--connection-mode', choices=['query', 'session'], default='query',
+        help=('Whether the OLAP streams open a new connection for every query ("query") or keep '
+        'one connection per stream and reset its state between queries ("session"), '
+        'default: query.'
+    ))
+
+    parser.add_argument('--plan-capture', choices=['off', 'once', 'sample'], default='off',
+        help=('When to capture query plans with an additional EXPLAIN if --explain-analyze did not '
+        'produce one: never ("off"), once per query text ("once") or for every n-th run of a '
+        'query ("sample"), default: off.'
+    ))
+
+    parser.add_argument('--plan-sample-interval', type=int, default=10, help=(
+        'Capture the plan of every n-th run of a query with --plan-capture=sample, default: 10.'
+    ))
+
     parser.add_argument('--dont-wait-until-enough-data', default=False, action='store_true',
         required=False, help=('Do NOT wait until there is enough data for OLAP queries to run with a constant dataset size')
     )
@@ -70,6 +88,26 @@ def add_parser(subparsers):
         'Optional list of ignored queries for the OLAP workload.'
     ))
 
+    parser.add_argument('--driver', choices=list(DRIVERS), default='psycopg2', help=(
+        'The database driver of the OLTP workers. "psycopg" (psycopg 3, installed separately) '
+        'supports sending several transactions at once with --oltp-pipeline-depth, '
+        'default: psycopg2.'
+    ))
+
+    parser.add_argument('--oltp-pipeline-depth', type=int, default=1, help=(
+        'Number of OLTP transactions an OLTP worker sends in one libpq pipeline before waiting '
+        'for their results. New-order transactions are never pipelined as they commit or roll '
+        'back depending on their result. Requires --driver=psycopg, default: 1.'
+    ))
+
+    parser.add_argument('--wait-event-interval', type=float, default=None, help=(
+        'Sample the wait events of the running OLAP queries and their parallel workers from '
+        'pg_stat_activity on --dsn every this many seconds and report the top wait events per '
+        'query. The queries are tagged with a comment to attribute them, default: off.'
+    ))
+
+    add_agent_arguments(parser)
+
 def run(args):
     controller = HTAPController(args)
     controller.run()
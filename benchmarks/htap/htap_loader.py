@@ -1,8 +1,6 @@
 from datetime import datetime
 from io import StringIO, SEEK_SET
 
-from psycopg2.extras import execute_values
-
 from s64da_benchmark_toolkit.dbconn import DBConn
 
 from benchmarks.htap.lib.helpers import (
@@ -14,8 +12,9 @@ from benchmarks.htap.lib.helpers import (
 COPY_SIZE=16384
 
 class Loader():
-    def __init__(self, dsn, warehouse_id = 0, start_date=None):
+    def __init__(self, dsn, warehouse_id = 0, start_date=None, driver='psycopg2'):
         self.dsn = dsn
+        self.driver = driver
         self.warehouse_id = warehouse_id
         self.random = Random(seed=warehouse_id)
         self.oltp_text = OLTPText(self.random)
@@ -30,17 +29,23 @@ class Loader():
         self.delivery_offset = (TPCH_DATE_RANGE[1] - TPCH_DATE_RANGE[0]) * (1-fraction_delivered)
 
     def insert_data(self, table, data):
-        with DBConn(self.dsn) as conn:
-            sql = f'INSERT INTO {table} VALUES %s'
-            execute_values(conn.cursor, sql, data)
+        with DBConn(self.dsn, pooled=True, driver=self.driver) as conn:
+            self.copy(conn, table, data)
 
     def row_for_copy(self, row):
         return '\t'.join([str(v) for v in row]) + '\n'
 
+    def copy(self, conn, table, rows, columns=None):
+        if conn.driver.supports_binary_copy:
+            conn.driver.copy_rows(conn.conn, table, rows, columns)
+        else:
+            it = StringIteratorIO(self.row_for_copy(row) for row in rows)
+            conn.cursor.copy_from(it, table, null='None', columns=columns, size=COPY_SIZE)
+
     def load_region(self):
         print('Loading regions')
         assert self.warehouse_id == 0
-        with DBConn(self.dsn) as conn:
+        with DBConn(self.dsn, pooled=True, driver=self.driver) as conn:
             for i in range(NUM_REGIONS):
                 region_key, name = REGIONS[i]
                 self.insert_data('region', [[region_key, name, self.olap_text.random_length_text(31, 115)]])
@@ -48,7 +53,7 @@ class Loader():
     def load_nation(self):
         print('Loading nation')
         assert self.warehouse_id == 0
-        with DBConn(self.dsn) as conn:
+        with DBConn(self.dsn, pooled=True, driver=self.driver) as conn:
             for i in range(NUM_NATIONS):
                 nation_key, name, region_key = NATIONS[i]
                 self.insert_data('nation', [[nation_key, name, region_key, self.olap_text.random_length_text(31, 114)]])
@@ -72,7 +77,7 @@ class Loader():
         )
 
     def generate_district(self, d_id):
-        return self.row_for_copy([
+        return [
             d_id,
             self.warehouse_id,
             self.oltp_text.string(5, prefix='name-'),
@@ -84,16 +89,15 @@ class Loader():
             self.random.sample() * 0.2,
             30000,
             NUM_ORDERS + 1,
-        ])
+        ]
 
     def load_district(self):
         print(f'Loading district ({self.warehouse_id})')
-        with DBConn(self.dsn) as conn:
-            it = StringIteratorIO((
+        with DBConn(self.dsn, pooled=True, driver=self.driver) as conn:
+            self.copy(conn, 'district', (
                 self.generate_district(d_id)
                 for d_id in range(1, DIST_PER_WARE + 1)
             ))
-            conn.cursor.copy_from(it, 'district', null='None', size=COPY_SIZE)
 
 
     def generate_customer(self, d_id, c_id):
@@ -102,7 +106,7 @@ class Loader():
 
         state = self.oltp_text.state()
 
-        return self.row_for_copy([
+        return [
             c_id, d_id, self.warehouse_id,
             ord(state[0]),
             self.oltp_text.string(self.random.randint_inclusive(2, 10), prefix='first-'),
@@ -116,38 +120,36 @@ class Loader():
             'GC' if self.random.randint_inclusive(1, 100) > 10 else 'BC', 50000,
             self.random.sample() * 0.5, -10, 10, 1, 0,
             self.oltp_text.string(self.random.randint_inclusive(300, 500))
-        ])
+        ]
 
     def load_customer(self):
         print(f'Loading customer ({self.warehouse_id})')
-        with DBConn(self.dsn) as conn:
-            it = StringIteratorIO((
+        with DBConn(self.dsn, pooled=True, driver=self.driver) as conn:
+            self.copy(conn, 'customer', (
                 self.generate_customer(d_id, c_id)
                 for d_id in range(1, DIST_PER_WARE + 1)
                 for c_id in range(1, CUST_PER_DIST + 1)
             ))
-            conn.cursor.copy_from(it, 'customer', null='None', size=COPY_SIZE)
 
     def generate_history(self, d_id, c_id):
-        return self.row_for_copy([
+        return [
             c_id, d_id, self.warehouse_id, d_id, self.warehouse_id, self.start_date, 10,
             self.oltp_text.string(self.random.randint_inclusive(12, 24))
-        ])
+        ]
 
     def load_history(self):
         print(f'Loading history ({self.warehouse_id})')
         copy_columns=('h_c_id', 'h_c_d_id', 'h_c_w_id', 'h_d_id', 'h_w_id', 'h_date', 'h_amount', 'h_data')
 
-        with DBConn(self.dsn) as conn:
-            it = StringIteratorIO((
+        with DBConn(self.dsn, pooled=True, driver=self.driver) as conn:
+            self.copy(conn, 'history', (
                 self.generate_history(d_id, c_id)
                 for d_id in range(1, DIST_PER_WARE + 1)
                 for c_id in range(1, CUST_PER_DIST + 1)
-            ))
-            conn.cursor.copy_from(it, 'history', null='None', columns=copy_columns, size=COPY_SIZE)
+            ), columns=copy_columns)
 
     def generate_stock(self, s_id):
-        return self.row_for_copy([
+        return [
             s_id, self.warehouse_id,
             self.random.randint_inclusive(10, 100),
             self.oltp_text.string(24),
@@ -161,33 +163,32 @@ class Loader():
             self.oltp_text.string(24),
             self.oltp_text.string(24), 0, 0, 0,
             self.oltp_text.string(self.random.randint_inclusive(26, 50))
-        ])
+        ]
 
     def load_stock(self):
         print(f'Loading stock ({self.warehouse_id})')
-        with DBConn(self.dsn) as conn:
-            it = StringIteratorIO((
+        with DBConn(self.dsn, pooled=True, driver=self.driver) as conn:
+            self.copy(conn, 'stock', (
                 self.generate_stock(s_id)
                 for s_id in range(1, STOCKS + 1)
             ))
-            conn.cursor.copy_from(it, 'stock', null='None', size=COPY_SIZE)
 
     def generate_order(self, d_id, o_id):
         entry_date = self.timestamp_generator.next()
         o_ol_cnt = self.random.randint_inclusive(5, 15)
         self.order_lines.append((d_id, o_id, o_ol_cnt, entry_date))
 
-        return self.row_for_copy([
+        return [
             o_id, d_id, self.warehouse_id, self.c_ids[o_id - 1], entry_date,
             self.random.randint_inclusive(1, 10) if o_id < FIRST_UNPROCESSED_O_ID else None,
             o_ol_cnt, 1
-        ])
+        ]
     
     def generate_order_lines(self, order_line):
         d_id, o_id, order_line_count, entry_date = order_line
-        rows = ""
+        rows = []
         for ol_id in range(1, order_line_count + 1):
-            rows += self.row_for_copy([
+            rows.append([
                 o_id, d_id, self.warehouse_id, ol_id,
                 self.random.randint_inclusive(1, MAX_ITEMS), self.warehouse_id,
                 (entry_date + self.delivery_offset) if o_id < FIRST_UNPROCESSED_O_ID else None,
@@ -203,16 +204,15 @@ class Loader():
         self.c_ids = list(range(1, NUM_ORDERS + 1))
         self.random.shuffle(self.c_ids)
 
-        with DBConn(self.dsn) as conn:
-            it = StringIteratorIO((
+        with DBConn(self.dsn, pooled=True, driver=self.driver) as conn:
+            self.copy(conn, 'orders', (
                 self.generate_order(d_id, o_id)
                 # generate in the order that a higher order number means a later transaction
                 for o_id in range(1, NUM_ORDERS + 1)
                 for d_id in range(1, DIST_PER_WARE + 1)
             ))
-            conn.cursor.copy_from(it, 'orders', null='None', size=COPY_SIZE)
 
-        with DBConn(self.dsn) as conn:
+        with DBConn(self.dsn, pooled=True, driver=self.driver) as conn:
             conn.cursor.execute(
                 f'''
                 INSERT INTO new_orders(no_o_id, no_d_id, no_w_id)
@@ -223,12 +223,12 @@ class Loader():
 
 
         print(f'Loading order_line ({self.warehouse_id})')
-        with DBConn(self.dsn) as conn:
-            it = StringIteratorIO((
-                self.generate_order_lines(order_line)
+        with DBConn(self.dsn, pooled=True, driver=self.driver) as conn:
+            self.copy(conn, 'order_line', (
+                row
                 for order_line in self.order_lines
+                for row in self.generate_order_lines(order_line)
             ))
-            conn.cursor.copy_from(it, 'order_line', null='None', size=COPY_SIZE)
 
     def generate_item(self, i_id):
         i_im_id = self.random.randint_inclusive(1, 10000)
@@ -242,17 +242,16 @@ class Loader():
         else:
             i_data = self.oltp_text.data(26, 50)
 
-        return self.row_for_copy([i_id, i_im_id, i_name[0:24], i_price, i_data])
+        return [i_id, i_im_id, i_name[0:24], i_price, i_data]
 
     def load_item(self):
         print(f'Loading items')
         assert self.warehouse_id == 0
-        with DBConn(self.dsn) as conn:
-            it = StringIteratorIO((
+        with DBConn(self.dsn, pooled=True, driver=self.driver) as conn:
+            self.copy(conn, 'item', (
                 self.generate_item(i_id)
                 for i_id in range(1, MAX_ITEMS + 1)
             ))
-            conn.cursor.copy_from(it, 'item', null='None', size=COPY_SIZE)
 
     def generate_supplier(self, su_id):
         nation_key = ord(self.oltp_text.alnumstring(1))
@@ -263,26 +262,25 @@ class Loader():
         else:
             comment = self.olap_text.random_length_text(25, 100)
 
-        return self.row_for_copy([
+        return [
             su_id, 'supplier-{:09d}'.format(su_id),
             self.oltp_text.string(self.random.randint_inclusive(2, 32), prefix='address-'),
             nation_key, self.olap_text.random_phone_number(su_id),
             self.random.randint_inclusive(-99999, 999999) / 100, comment
-        ])
+        ]
 
     def load_supplier(self):
         print(f'Loading suppliers')
         assert self.warehouse_id == 0
-        with DBConn(self.dsn) as conn:
-            it = StringIteratorIO((
+        with DBConn(self.dsn, pooled=True, driver=self.driver) as conn:
+            self.copy(conn, 'supplier', (
                 self.generate_supplier(su_id)
                 for su_id in range(NUM_SUPPLIERS)
             ))
-            conn.cursor.copy_from(it, 'supplier', null='None', size=COPY_SIZE)
 
 
-def load_warehouse(dsn, warehouse_id, start_date):
-    loader = Loader(dsn, warehouse_id, start_date)
+def load_warehouse(dsn, warehouse_id, start_date, driver='psycopg2'):
+    loader = Loader(dsn, warehouse_id, start_date, driver)
     loader.load_customer()
     loader.load_district()
     loader.load_history()
@@ -291,21 +289,21 @@ def load_warehouse(dsn, warehouse_id, start_date):
     loader.load_warehouse()
 
 
-def load_item(dsn):
-    loader = Loader(dsn)
+def load_item(dsn, driver='psycopg2'):
+    loader = Loader(dsn, driver=driver)
     loader.load_item()
 
 
-def load_region(dsn):
-    loader = Loader(dsn)
+def load_region(dsn, driver='psycopg2'):
+    loader = Loader(dsn, driver=driver)
     loader.load_region()
 
 
-def load_nation(dsn):
-    loader = Loader(dsn)
+def load_nation(dsn, driver='psycopg2'):
+    loader = Loader(dsn, driver=driver)
     loader.load_nation()
 
 
-def load_supplier(dsn):
-    loader = Loader(dsn)
+def load_supplier(dsn, driver='psycopg2'):
+    loader = Loader(dsn, driver=driver)
     loader.load_supplier()
@@ -13,7 +13,8 @@ import yaml
 
 from benchmarks.htap.lib.helpers import Random, TPCH_DATE_RANGE, WANTED_RANGE
 
-from s64da_benchmark_toolkit.db import Status, DB, Timing
+from s64da_benchmark_toolkit.db import Status, DB, Timing, PlanCapture
+from s64da_benchmark_toolkit.waitevents import tag_query
 
 TEMPLATE_DIR = path.join('benchmarks', 'htap', 'queries')
 
@@ -49,7 +50,8 @@ def is_ignored_query(ignored_queries, query_id):
 
 
 class AnalyticalStream:
-    def __init__(self, stream_id, args, min_timestamp, latest_timestamp, stats_queue):
+    def __init__(self, stream_id, args, min_timestamp, latest_timestamp, stats_queue,
+                 events=None):
         self.random = Random(stream_id)
         self.stream_id = stream_id
         with open('benchmarks/htap/queries/streams.yaml', 'r') as streams_file:
@@ -66,6 +68,10 @@ class AnalyticalStream:
             self.dsn = args.olap_dsns[stream_id % len(args.olap_dsns)]
         else:
             self.dsn = args.dsn
+        self.db = DB(self.dsn, PlanCapture(args.plan_capture, args.plan_sample_interval))
+        self.session = None
+        # the optional EventLog of the query starts and finishes
+        self.events = events
 
     def tpch_date_to_benchmark_date(self, tpch_date):
         current_date = datetime.fromtimestamp(self.latest_timestamp.value)
@@ -137,6 +143,15 @@ class AnalyticalStream:
                 processed += processed_child
         return (planned, processed)
 
+    def get_row_counts(self, plan):
+        """The planned and processed rows of a JSON plan, None without a usable plan."""
+        if not plan:
+            return None, None
+        try:
+            return self.parse_plan(json.loads(plan)[0]["Plan"])
+        except (ValueError, LookupError, TypeError):
+            # e.g. the error message of a failed EXPLAIN
+            return None, None
 
     def run_next_query(self):
 
@@ -160,6 +175,8 @@ class AnalyticalStream:
             _report_if_last_query()
             return
         sql = self.get_query(query_id)
+        if self.args.wait_event_interval:
+            sql = tag_query(sql, self.stream_id, query_id)
 
         if not self.args.dont_wait_until_enough_data:
             self.wait_until_enough_data(query_id)
@@ -170,19 +187,23 @@ class AnalyticalStream:
             'iteration': len(self.stream_acc_time),
             'status': 'Running'
         }))
+        if self.events:
+            self.events.query_started(self.stream_id, query_id, len(self.stream_acc_time))
 
         if not self.args.dry_run:
-            db = DB(self.dsn)
-            timing, _, plan = DB(self.dsn).run_query(
+            if self.args.connection_mode == 'session' and self.session is None:
+                # the stream lives as long as its worker, so the session is never closed
+                self.session = self.db.session(self.args.olap_timeout).__enter__()
+
+            timing, _, plan = self.db.run_query(
                     sql, self.args.olap_timeout,
-                    self.args.explain_analyze, self.args.use_server_side_cursors)
+                    self.args.explain_analyze, self.args.use_server_side_cursors, self.session)
             runtime = timing.stop - timing.start
+            if self.events:
+                self.events.query_finished(self.stream_id, query_id, len(self.stream_acc_time),
+                                           timing.status.name, runtime)
             # sum up rows processed
-            try:
-                planned_rows, processed_rows = self.parse_plan(json.loads(plan)[0]["Plan"])
-            except:
-                planned_rows = 0
-                processed_rows = 0
+            planned_rows, processed_rows = self.get_row_counts(plan)
 
             iteration = len(self.stream_acc_time)
             self.stats_queue.put(('olap', {
@@ -191,6 +212,7 @@ class AnalyticalStream:
                 'iteration': iteration,
                 'status': timing.status.name,
                 'runtime': runtime,
+                'connection_time': timing.connect,
                 'planned_rows': planned_rows,
                 'processed_rows': processed_rows
             }))
@@ -198,15 +220,19 @@ class AnalyticalStream:
             _report_if_last_query()
 
             # save plan output
-            plan_file =  f'{self.stream_id}_{iteration}_{query_id}.txt'
-            plan_dir = f'results/query_plans'
-            os.makedirs(plan_dir, exist_ok=True)
-            with open(f'{plan_dir}/{plan_file}', 'w') as f:
-                f.write(plan)
+            if plan:
+                plan_file =  f'{self.stream_id}_{iteration}_{query_id}.txt'
+                plan_dir = f'results/query_plans'
+                os.makedirs(plan_dir, exist_ok=True)
+                with open(f'{plan_dir}/{plan_file}', 'w') as f:
+                    f.write(plan)
         else:
             # Artificially slow down queries in dry-run mode to allow monitoring to keep up
             runtime = 0.01
             time.sleep(runtime)
+            if self.events:
+                self.events.query_finished(self.stream_id, query_id, len(self.stream_acc_time),
+                                           'OK', runtime)
             self.stats_queue.put(('olap', {
                 'query': query_id,
                 'stream': self.stream_id,
@@ -1,3 +1,4 @@
+import argparse
 import os
 import signal
 import time
@@ -13,7 +14,21 @@ from benchmarks.htap.lib.helpers import nullcontext, WANTED_RANGE
 from benchmarks.htap.lib.monitoring import Monitor
 from benchmarks.htap.lib.stats import Stats
 from benchmarks.htap.lib.transactional import TransactionalWorker
-from s64da_benchmark_toolkit.dbconn import DBConn
+from s64da_benchmark_toolkit.dbconn import DBConn, log_pool_stats
+from s64da_benchmark_toolkit.distributed import AgentJob, Coordinator, split_range
+from s64da_benchmark_toolkit.drivers import get_driver
+from s64da_benchmark_toolkit.events import EventLog
+from s64da_benchmark_toolkit.journal import RunJournal
+from s64da_benchmark_toolkit.waitevents import WaitEventSampler, report as report_wait_events
+
+
+def worker_init():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def exit_worker(signum, frame):
+    raise SystemExit(0)
+
 
 class HTAPController:
     # have the shared-memory primitives static as otherwise the multiprocessing
@@ -25,6 +40,8 @@ class HTAPController:
 
     def __init__(self, args):
         self.args = args
+        if args.oltp_pipeline_depth > 1 and not get_driver(args.driver).supports_pipeline:
+            raise ValueError(f'The {args.driver} driver does not support pipelining')
         self.next_tsx_timestamp.value = time.time()
         self.tsx_timestamp_increment = 1.0 / self.args.target_tps if self.args.target_tps is not None else 0
         self.num_warehouses = self._query_num_warehouses()
@@ -39,7 +56,10 @@ class HTAPController:
                 self.range_delivery_date[0]
         )
 
+        self.events = EventLog(RunJournal.make_run_dir('results'), source='htap')
+
         print(f'Warehouses: {self.num_warehouses}')
+        print(f'OLAP query events are logged to {self.events.path}.')
 
     def oltp_sleep(self):
         with self.next_tsx_timestamp.get_lock():
@@ -52,21 +72,28 @@ class HTAPController:
     def oltp_worker(self, worker_id):
         # do NOT introduce timeouts for the oltp queries! this will make that
         # the workload gets inbalanaced and eventually the whole benchmark stalls
-        with DBConn(self.args.dsn) as conn:
-            oltp_worker = TransactionalWorker(worker_id, self.num_warehouses, self.latest_timestamp, conn, self.args.dry_run)
+        # the pool terminates its workers, exit through the finally below instead of dying
+        # with the pipelined transactions that were not sent yet
+        signal.signal(signal.SIGTERM, exit_worker)
+        with DBConn(self.args.dsn, driver=self.args.driver) as conn:
+            oltp_worker = TransactionalWorker(worker_id, self.num_warehouses, self.latest_timestamp, conn,
+                                              self.args.dry_run, self.args.oltp_pipeline_depth)
             next_reporting_time = time.time() + 0.1
-            while True:
-                self.oltp_sleep()
-                oltp_worker.next_transaction()
-                if next_reporting_time <= time.time():
-                    # its beneficial to send in chunks so try to batch the stats by accumulating 0.1s of samples
-                    self.stats_queue.put(('oltp', oltp_worker.stats()))
-                    next_reporting_time += 0.1
+            try:
+                while True:
+                    self.oltp_sleep()
+                    oltp_worker.next_transaction()
+                    if next_reporting_time <= time.time():
+                        # its beneficial to send in chunks so try to batch the stats by accumulating 0.1s of samples
+                        self.stats_queue.put(('oltp', oltp_worker.stats()))
+                        next_reporting_time += 0.1
+            finally:
+                oltp_worker.flush()
 
 
     def olap_worker(self, worker_id):
         stream = AnalyticalStream(worker_id, self.args, self.range_delivery_date[0],
-                          self.latest_timestamp, self.stats_queue)
+                          self.latest_timestamp, self.stats_queue, self.events)
         while True:
             stream.run_next_query()
 
@@ -92,7 +119,7 @@ class HTAPController:
         sys.exit(-1)
 
     def _query_range_delivery_date(self):
-        with DBConn(self.args.dsn) as conn:
+        with DBConn(self.args.dsn, pooled=True) as conn:
             try:
                 conn.cursor.execute('SELECT min(ol_delivery_d), max(ol_delivery_d) FROM order_line')
                 return conn.cursor.fetchone()
@@ -100,7 +127,7 @@ class HTAPController:
                 self._sql_error('Could not query the latest delivery date.')
 
     def _query_num_warehouses(self):
-        with DBConn(self.args.dsn) as conn:
+        with DBConn(self.args.dsn, pooled=True) as conn:
             try:
                 conn.cursor.execute('SELECT count(distinct(w_id)) from warehouse')
                 return conn.cursor.fetchone()[0]
@@ -117,7 +144,7 @@ class HTAPController:
             except DuplicateDatabase:
                 pass
 
-        with DBConn(self.args.stats_dsn) as conn:
+        with DBConn(self.args.stats_dsn, pooled=True) as conn:
             stats_schema_path = os.path.join('benchmarks', 'htap', 'stats_schema.sql')
             with open(stats_schema_path, 'r') as schema:
                 schema_sql = schema.read()
@@ -126,6 +153,43 @@ class HTAPController:
                 except DuplicateTable:
                     pass
 
+    def make_agent_assignments(self):
+        # every agent paces its own OLTP workers, so the target TPS is split between them
+        assignments = []
+        for address, (oltp_first, oltp_count), (olap_first, olap_count) in zip(
+                self.args.agents,
+                split_range(0, self.args.oltp_workers, len(self.args.agents)),
+                split_range(0, self.args.olap_workers, len(self.args.agents))):
+            if oltp_count == 0 and olap_count == 0:
+                continue
+
+            target_tps = self.args.target_tps
+            if target_tps is not None and oltp_count > 0:
+                target_tps = target_tps * oltp_count / self.args.oltp_workers
+            agent_args = argparse.Namespace(**{
+                **vars(self.args), 'target_tps': target_tps, 'agents': None,
+                'agent_authkey': None
+            })
+            assignments.append((address, HTAPAgentJob(
+                agent_args, range(oltp_first, oltp_first + oltp_count),
+                range(olap_first, olap_first + olap_count))))
+        return assignments
+
+    def run_workers(self, oltp_worker_ids, olap_worker_ids, queue, stop):
+        """Runs the given workers on an agent and forwards their stats until stop is set."""
+        num_workers = len(oltp_worker_ids) + len(olap_worker_ids)
+        with Pool(num_workers, worker_init) as pool:
+            oltp_workers = pool.map_async(self.oltp_worker, oltp_worker_ids)
+            olap_workers = pool.map_async(self.olap_worker, olap_worker_ids)
+            while not stop.wait(0.1):
+                if len(oltp_worker_ids) > 0 and oltp_workers.ready():
+                    oltp_workers.get()
+                if len(olap_worker_ids) > 0 and olap_workers.ready():
+                    olap_workers.get()
+
+                while not self.stats_queue.empty():
+                    queue.put(self.stats_queue.get())
+
     def run(self):
         begin = datetime.now()
         elapsed = timedelta()
@@ -139,15 +203,28 @@ class HTAPController:
             print(f'Database statistics collection is disabled.')
             stats_conn_holder = nullcontext()
 
-        def worker_init():
-            signal.signal(signal.SIGINT, signal.SIG_IGN)
+        # with agents the OLTP and OLAP workers run there and only ANALYZE runs here
+        coordinator = None
+        local_oltp_workers = range(self.args.oltp_workers)
+        local_olap_workers = range(self.args.olap_workers)
+        if self.args.agents:
+            coordinator = Coordinator(self.args.agents, self.args.agent_authkey,
+                                      self.latest_timestamp)
+            local_oltp_workers, local_olap_workers = range(0), range(0)
+
+        sampler = None
+        if self.args.wait_event_interval:
+            sampler = WaitEventSampler(self.args.dsn, self.args.wait_event_interval)
+            sampler.start()
 
-        num_total_workers = self.args.oltp_workers + self.args.olap_workers + 1
+        num_total_workers = len(local_oltp_workers) + len(local_olap_workers) + 1
         with stats_conn_holder as stats_conn:
             with Pool(num_total_workers, worker_init) as pool:
-                oltp_workers = pool.map_async(self.oltp_worker, range(self.args.oltp_workers))
-                olap_workers = pool.map_async(self.olap_worker, range(self.args.olap_workers))
+                oltp_workers = pool.map_async(self.oltp_worker, local_oltp_workers)
+                olap_workers = pool.map_async(self.olap_worker, local_olap_workers)
                 analyze_worker = pool.apply_async(self.analyze_worker)
+                if coordinator:
+                    coordinator.start(self.make_agent_assignments(), self.stats_queue)
 
                 try:
                     update_interval = timedelta(seconds=min(self.args.monitoring_interval, self.args.csv_interval))
@@ -164,6 +241,8 @@ class HTAPController:
                             olap_workers.get()
                         if analyze_worker.ready():
                             analyze_worker.get()
+                        if coordinator:
+                            coordinator.check()
 
                         while datetime.now() < next_update:
                             self.stats.process_queue(self.stats_queue)
@@ -187,7 +266,48 @@ class HTAPController:
                 except KeyboardInterrupt:
                     pass
                 finally:
+                    if coordinator:
+                        coordinator.stop()
+                        coordinator.join()
+                        self.stats.process_queue(self.stats_queue)
                     if burnin_duration == None:
                         burnin_duration = elapsed
                     self.monitor.display_summary(elapsed, burnin_duration)
                     self.stats.write_summary(self.args.csv_file, elapsed)
+                    if sampler:
+                        report_wait_events(sampler.stop(), self.args.output, self.args.csv_file)
+                    log_pool_stats()
+
+
+class HTAPAgentJob(AgentJob):
+    """
+    The OLTP and OLAP workers of one agent. The latest record timestamp is advanced by the
+    OLTP workers of all agents, so the local advance is summed up on the coordinator.
+    """
+    def __init__(self, args, oltp_worker_ids, olap_worker_ids):
+        self.args = args
+        self.oltp_worker_ids = oltp_worker_ids
+        self.olap_worker_ids = olap_worker_ids
+        self.latest_timestamp = None
+        self.synced_timestamp = None
+
+    def run(self, queue, stop):
+        controller = HTAPController(self.args)
+        self.synced_timestamp = controller.latest_timestamp.value
+        self.latest_timestamp = controller.latest_timestamp
+        controller.run_workers(self.oltp_worker_ids, self.olap_worker_ids, queue, stop)
+
+    def take_sync_delta(self):
+        if self.latest_timestamp is None:
+            return None
+
+        with self.latest_timestamp.get_lock():
+            delta = self.latest_timestamp.value - self.synced_timestamp
+            self.synced_timestamp = self.latest_timestamp.value
+        return delta
+
+    def apply_sync(self, value):
+        with self.latest_timestamp.get_lock():
+            # keep the advance since the delta was taken, it is part of the next one
+            self.latest_timestamp.value = value + self.latest_timestamp.value - self.synced_timestamp
+            self.synced_timestamp = value
@@ -79,14 +79,15 @@ class Monitor:
 
     def get_olap_row(self, query_id):
         row = f'Query {query_id:2d} |'
-        max_planned = 0
-        max_processed = 0
+        max_planned = None
+        max_processed = None
         for stream_id in range(self.num_olap_workers):
             stats = self.stats.olap_stats_for_stream_id(stream_id).get('queries').get(query_id)
             if stats and stats['runtime'] > 0:
-                # output last result
-                max_planned = max(max_planned, int(stats['planned_rows']/1000))
-                max_processed = max(max_processed, int(stats['processed_rows']/1000))
+                # output last result, the row counts are unknown without a plan
+                if stats['planned_rows'] is not None:
+                    max_planned = max(max_planned or 0, int(stats['planned_rows']/1000))
+                    max_processed = max(max_processed or 0, int(stats['processed_rows']/1000))
                 row += '{:7.2f} {:3}|'.format(stats['runtime'], stats['status'][:3].upper())
             elif stats:
                 # output a state
@@ -94,7 +95,10 @@ class Monitor:
             else:
                 row += f' {" ":9} |'
 
-        row += f' {max_planned:12}K | {max_processed:13}K |'
+        if max_planned is None:
+            row += f' {"-":>13} | {"-":>14} |'
+        else:
+            row += f' {max_planned:12}K | {max_processed:13}K |'
         return row
 
     def get_olap_sum(self):
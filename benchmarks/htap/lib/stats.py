@@ -175,7 +175,7 @@ class Stats:
         if not self.csv_dbstats:
             self.csv_dbstats = open('results/dbstats.csv', 'w')
         if not self.conn:
-            self.conn = DBConn(self.dsn, use_dict_cursor = True)
+            self.conn = DBConn(self.dsn, use_dict_cursor = True, pooled=True)
             self._update_cached_stats()
 
         self.updates += 1
@@ -7,8 +7,12 @@ from .helpers import Random, OLTPText, TimestampGenerator
 from .helpers import MAX_ITEMS, DIST_PER_WARE, CUST_PER_DIST, NUM_ORDERS, STOCKS, NAMES
 
 class TransactionalWorker:
-    def __init__(self, seed, num_warehouses, latest_timestamp, conn, dry_run):
+    def __init__(self, seed, num_warehouses, latest_timestamp, conn, dry_run, pipeline_depth=1):
         self.conn = conn
+        # with a pipelining driver, up to pipeline_depth autocommit transactions are sent
+        # together and wait for their results once
+        self.pipeline_depth = pipeline_depth
+        self.pending = []
         self.random = Random(seed)
         self.oltp_text = OLTPText(self.random)
         self.num_warehouses = num_warehouses
@@ -50,16 +54,31 @@ class TransactionalWorker:
     def execute_sql(self, sql, args, query_type):
         if self.dry_run:
             return
-        start = time.time()
+        self.pending.append((sql, args, query_type))
+        if len(self.pending) >= self.pipeline_depth:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
         # do not catch timeouts because we want that to stop the benchmark.
         # if we get timeouts the benchmark gets inbalanced and we eventually get
         # to a complete halt.
-        self.conn.cursor.execute(sql, args)
-        self.add_stats(query_type, 'ok', start)
+        # the transactions of a pipeline start when it is sent, the time they were queued
+        # includes the pacing of the worker between them, and finish together
+        start = time.time()
+        with self.conn.driver.pipeline(self.conn.conn):
+            for sql, args, _ in self.pending:
+                self.conn.cursor.execute(sql, args)
+        for _, _, query_type in self.pending:
+            self.add_stats(query_type, 'ok', start)
+        self.pending = []
 
     def execute_sql_new_order(self, sql, args):
         if self.dry_run:
             return
+        # committing or rolling back depends on the result, so it cannot be pipelined
+        self.flush()
         old_autocommit = self.conn.conn.autocommit
         self.conn.conn.autocommit = False
         start = time.time()
@@ -41,10 +41,10 @@ class PrepareBenchmark(PrepareBenchmarkFactory):
             if table in ['item', 'region', 'nation', 'supplier']:
                 func_name = 'load_{}'.format(table)
                 func = getattr(loader, func_name)
-                return [(func, dsn)]
+                return [(func, dsn, self.args.driver)]
             elif table == 'warehouse':
                 warehouses = range(1, self.args.scale_factor*WAREHOUSES_SF_RATIO + 1)
-                return [(loader.load_warehouse, dsn, w_id, start_date)
+                return [(loader.load_warehouse, dsn, w_id, start_date, self.args.driver)
                         for w_id in warehouses]
 
             raise ValueError(f'Unknown table {table}')
@@ -11,6 +11,8 @@ class DateValue:
 
 class EmptyArgs:
     dsn = 'empty'
+    plan_capture = 'off'
+    plan_sample_interval = 10
 
 def test_tpch_date_to_benchmark_date():
     stream = AnalyticalStream(0, EmptyArgs, None, DateValue(), None)
@@ -20,3 +22,13 @@ def test_tpch_date_to_benchmark_date():
     assert stream.tpch_date_to_benchmark_date(isoparse('2211-01-01')) == isoparse('2411-01-01')
     assert stream.tpch_date_to_benchmark_date(isoparse('1801-01-01')) == isoparse('2001-01-01')
 
+
+
+def test_get_row_counts():
+    stream = AnalyticalStream(0, EmptyArgs, None, DateValue(), None)
+    plan = '[{"Plan": {"Plan Rows": 10, "Actual Rows": 8, "Plans": [{"Plan Rows": 5}]}}]'
+
+    assert stream.get_row_counts(plan) == (15, 8)
+    # no plan captured, or a failed EXPLAIN
+    assert stream.get_row_counts(None) == (None, None)
+    assert stream.get_row_counts('{"Explain Output failed": "canceled"}') == (None, None)
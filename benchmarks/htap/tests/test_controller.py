@@ -0,0 +1,36 @@
+import argparse
+
+from multiprocessing import Value
+
+from benchmarks.htap.lib.controller import HTAPAgentJob, HTAPController
+
+
+def test_make_agent_assignments():
+    controller = HTAPController.__new__(HTAPController)
+    controller.args = argparse.Namespace(
+        oltp_workers=5, olap_workers=1, target_tps=100, agents=[('host1', 1), ('host2', 2)])
+
+    assignments = controller.make_agent_assignments()
+
+    assert [address for address, _ in assignments] == [('host1', 1), ('host2', 2)]
+    jobs = [job for _, job in assignments]
+    assert [job.oltp_worker_ids for job in jobs] == [range(0, 3), range(3, 5)]
+    assert [job.olap_worker_ids for job in jobs] == [range(0, 1), range(1, 1)]
+    assert [job.args.target_tps for job in jobs] == [60, 40]
+    assert not any(job.args.agents for job in jobs)
+
+
+def test_agent_job_sync():
+    job = HTAPAgentJob(None, range(1), range(0))
+    assert job.take_sync_delta() is None
+
+    job.latest_timestamp = Value('d', 100)
+    job.synced_timestamp = 100
+    job.latest_timestamp.value = 110
+    assert job.take_sync_delta() == 10
+
+    # the other agents advanced by 20 in the meantime, this one by 5 more
+    job.latest_timestamp.value = 115
+    job.apply_sync(130)
+    assert job.latest_timestamp.value == 135
+    assert job.take_sync_delta() == 5
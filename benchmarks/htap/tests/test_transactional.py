@@ -0,0 +1,63 @@
+from benchmarks.htap.lib.transactional import TransactionalWorker
+
+
+def make_worker(mocker, pipeline_depth):
+    conn = mocker.MagicMock()
+    conn.cursor.fetchone.return_value = (True,)
+    return TransactionalWorker(1, 1, 0, conn, False, pipeline_depth)
+
+
+def test_execute_sql_unpipelined(mocker):
+    worker = make_worker(mocker, 1)
+
+    worker.payment(0)
+
+    worker.conn.cursor.execute.assert_called_once()
+    assert [stat['query'] for stat in worker.stats()] == ['payment']
+
+
+def test_execute_sql_pipelined(mocker):
+    clock = [10.0]
+    mocker.patch('time.time', side_effect=lambda: clock[0])
+    worker = make_worker(mocker, 3)
+
+    def execute(sql, args):
+        clock[0] += 1.0
+
+    worker.conn.cursor.execute.side_effect = execute
+
+    worker.payment(0)
+    # the worker is paced between its transactions
+    clock[0] += 5.0
+    worker.stock_level()
+    clock[0] += 5.0
+    assert worker.conn.cursor.execute.call_count == 0
+
+    worker.delivery(0)
+    assert worker.conn.cursor.execute.call_count == 3
+    worker.conn.driver.pipeline.assert_called_once_with(worker.conn.conn)
+    stats = worker.stats()
+    assert [stat['query'] for stat in stats] == ['payment', 'stock_level', 'delivery']
+    # the transactions are timed from sending the pipeline, not including the pacing
+    assert [stat['runtime'] for stat in stats] == [3.0, 3.0, 3.0]
+
+
+def test_new_order_flushes_pipeline(mocker):
+    worker = make_worker(mocker, 3)
+
+    worker.payment(0)
+    worker.new_order(0)
+
+    assert worker.conn.cursor.execute.call_count == 2
+    assert [stat['query'] for stat in worker.stats()] == ['payment', 'new_order']
+    worker.conn.conn.commit.assert_called_once()
+
+
+def test_flush_sends_pending(mocker):
+    worker = make_worker(mocker, 3)
+
+    worker.payment(0)
+    worker.flush()
+
+    assert worker.conn.cursor.execute.call_count == 1
+    assert worker.pending == []
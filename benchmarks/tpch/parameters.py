@@ -0,0 +1,146 @@
+import os
+
+from datetime import date
+from random import Random
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_DIR = os.path.join(BASE_DIR, 'queries', 'templates')
+
+# n_name and the r_name of its n_regionkey, as loaded by dbgen
+NATIONS = {
+    'ALGERIA': 'AFRICA', 'ARGENTINA': 'AMERICA', 'BRAZIL': 'AMERICA', 'CANADA': 'AMERICA',
+    'EGYPT': 'MIDDLE EAST', 'ETHIOPIA': 'AFRICA', 'FRANCE': 'EUROPE', 'GERMANY': 'EUROPE',
+    'INDIA': 'ASIA', 'INDONESIA': 'ASIA', 'IRAN': 'MIDDLE EAST', 'IRAQ': 'MIDDLE EAST',
+    'JAPAN': 'ASIA', 'JORDAN': 'MIDDLE EAST', 'KENYA': 'AFRICA', 'MOROCCO': 'AFRICA',
+    'MOZAMBIQUE': 'AFRICA', 'PERU': 'AMERICA', 'CHINA': 'ASIA', 'ROMANIA': 'EUROPE',
+    'SAUDI ARABIA': 'MIDDLE EAST', 'VIETNAM': 'ASIA', 'RUSSIA': 'EUROPE',
+    'UNITED KINGDOM': 'EUROPE', 'UNITED STATES': 'AMERICA'
+}
+
+
+def read_distributions(dists_file):
+    """The value lists of the distributions in a dbgen dists.dss file, by name."""
+    distributions = {}
+    name = None
+    with open(dists_file, 'r') as dists:
+        for line in dists:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+
+            keyword = line.split(' ')[0].lower()
+            if keyword == 'begin':
+                name = line.split(' ', 1)[1]
+                distributions[name] = []
+            elif keyword == 'end':
+                name = None
+            elif name is not None:
+                value = line.rsplit('|', 1)[0]
+                if value.lower() != 'count':
+                    distributions[name].append(value)
+
+    return distributions
+
+
+def first_of_month(start_year, start_month, months):
+    year, month = divmod(start_month - 1 + months, 12)
+    return date(start_year + year, month + 1, 1)
+
+
+class QueryParameters:
+    """
+    Substitution parameters for the TPC-H query templates, drawn from the domains of the
+    TPC-H specification, clause 2.4.
+    """
+    def __init__(self, scale_factor, seed=0):
+        self.scale_factor = scale_factor
+        self.seed = seed
+        distributions = read_distributions(os.path.join(BASE_DIR, 'dists.dss'))
+        self.colors = distributions['colors']
+        self.containers = distributions['p_cntr']
+        self.segments = distributions['msegmnt']
+        self.shipmodes = distributions['smode']
+        self.types = distributions['p_types']
+        self.q13_words1 = distributions['Q13a']
+        self.q13_words2 = distributions['Q13b']
+
+    def make_random(self, stream_id, query_id, iteration=1):
+        # seeded per stream, query and iteration, so that each of them draws different
+        # parameters, but reruns with the same seed draw the same ones
+        return Random(f'{self.seed}-{stream_id}-{query_id}-{iteration}')
+
+    @staticmethod
+    def random_brand(rng):
+        return f'Brand#{rng.randint(1, 5)}{rng.randint(1, 5)}'
+
+    def generate(self, query_id, rng):
+        nations = sorted(NATIONS)
+        year = rng.randint(1993, 1997)
+
+        if query_id == 1:
+            return {'delta': rng.randint(60, 120)}
+        elif query_id == 2:
+            return {'size': rng.randint(1, 50),
+                    'type': rng.choice(sorted({t.split(' ')[2] for t in self.types})),
+                    'region': rng.choice(sorted(set(NATIONS.values())))}
+        elif query_id == 3:
+            return {'segment': rng.choice(self.segments),
+                    'date': date(1995, 3, rng.randint(1, 31))}
+        elif query_id in (4, 15):
+            return {'date': first_of_month(1993, 1, rng.randint(0, 57))}
+        elif query_id == 5:
+            return {'region': rng.choice(sorted(set(NATIONS.values()))), 'date': date(year, 1, 1)}
+        elif query_id == 6:
+            return {'date': date(year, 1, 1), 'discount': f'{rng.randint(2, 9) / 100:.2f}',
+                    'quantity': rng.randint(24, 25)}
+        elif query_id == 7:
+            nation1, nation2 = rng.sample(nations, 2)
+            return {'nation1': nation1, 'nation2': nation2}
+        elif query_id == 8:
+            nation = rng.choice(nations)
+            return {'nation': nation, 'region': NATIONS[nation], 'type': rng.choice(self.types)}
+        elif query_id == 9:
+            return {'color': rng.choice(self.colors)}
+        elif query_id == 10:
+            return {'date': first_of_month(1993, 2, rng.randint(0, 23))}
+        elif query_id == 11:
+            return {'nation': rng.choice(nations), 'fraction': f'{0.0001 / self.scale_factor:.10f}'}
+        elif query_id == 12:
+            shipmode1, shipmode2 = rng.sample(self.shipmodes, 2)
+            return {'shipmode1': shipmode1, 'shipmode2': shipmode2, 'date': date(year, 1, 1)}
+        elif query_id == 13:
+            return {'word1': rng.choice(self.q13_words1), 'word2': rng.choice(self.q13_words2)}
+        elif query_id == 14:
+            return {'date': first_of_month(1993, 1, rng.randint(0, 59))}
+        elif query_id == 16:
+            type_prefix = ' '.join(rng.choice(self.types).split(' ')[:2])
+            sizes = rng.sample(range(1, 51), 8)
+            return {'brand': QueryParameters.random_brand(rng), 'type': type_prefix,
+                    **{f'size{idx + 1}': size for idx, size in enumerate(sizes)}}
+        elif query_id == 17:
+            return {'brand': QueryParameters.random_brand(rng),
+                    'container': rng.choice(self.containers)}
+        elif query_id == 18:
+            return {'quantity': rng.randint(312, 315)}
+        elif query_id == 19:
+            return {'brand1': QueryParameters.random_brand(rng),
+                    'brand2': QueryParameters.random_brand(rng),
+                    'brand3': QueryParameters.random_brand(rng),
+                    'quantity1': rng.randint(1, 10), 'quantity2': rng.randint(10, 20),
+                    'quantity3': rng.randint(20, 30)}
+        elif query_id == 20:
+            return {'color': rng.choice(self.colors), 'date': date(year, 1, 1),
+                    'nation': rng.choice(nations)}
+        elif query_id == 21:
+            return {'nation': rng.choice(nations)}
+        elif query_id == 22:
+            codes = rng.sample(range(10, 35), 7)
+            return {f'i{idx + 1}': code for idx, code in enumerate(codes)}
+
+        raise ValueError(f'Unknown TPC-H query {query_id}')
+
+    def get_parameters(self, stream_id, query_id, iteration=1):
+        return self.generate(int(query_id), self.make_random(stream_id, query_id, iteration))
+
+    def get_template_path(self, query_id):
+        return os.path.join(TEMPLATE_DIR, f'{query_id}.sql.template')
@@ -0,0 +1,140 @@
+import logging
+import os
+import subprocess
+import tempfile
+import time
+
+import psycopg2
+
+from s64da_benchmark_toolkit.dbconn import DBConn
+from s64da_benchmark_toolkit.db import Status
+from s64da_benchmark_toolkit.reporting import QueryMetric, REFRESH_STREAM_ID
+
+LOG = logging.getLogger()
+
+
+class StripTrailingDelimiter:
+    """
+    File wrapper for COPY that removes the '|' dbgen may write at the end of each row.
+    """
+    def __init__(self, data_file):
+        self.data_file = data_file
+
+    def read(self, size=-1):
+        lines = self.data_file.readlines(size if size and size > 0 else -1)
+        return ''.join(f'{StripTrailingDelimiter.strip(line)}\n' for line in lines)
+
+    @staticmethod
+    def strip(line):
+        # only the delimiter, trailing blanks and empty last columns are data
+        line = line.rstrip('\n')
+        return line[:-1] if line.endswith('|') else line
+
+
+class RefreshStream:
+    """
+    The TPC-H refresh functions. RF1 inserts new orders and their lineitems, RF2 deletes old
+    ones, both from the update sets generated with `dbgen -U`. Each pair of refresh functions
+    uses its own update set and runs in one transaction per function.
+
+    The pairs use the update sets from first_set on, so that a later run can continue with
+    the ones the database has not seen yet. completed holds the (stream id, query id, update
+    set) of the functions journaled before resuming, they are not run again.
+    """
+    def __init__(self, dsn, scale_factor, num_pairs, timeout=0, first_set=1, completed=()):
+        self.dsn = dsn
+        self.scale_factor = scale_factor
+        self.num_pairs = num_pairs
+        self.timeout = timeout
+        self.first_set = first_set
+        self.completed = set(completed)
+        self.base_dir = os.path.dirname(os.path.abspath(__file__))
+
+    @property
+    def update_sets(self):
+        return range(self.first_set, self.first_set + self.num_pairs)
+
+    def generate(self, data_dir):
+        # dbgen always starts with the first update set
+        last_set = self.update_sets[-1]
+        LOG.info(f'generating {last_set} update sets for scale factor {self.scale_factor}')
+        subprocess.run([
+            os.path.join(self.base_dir, 'dbgen'), '-q', '-f', '-s', str(self.scale_factor),
+            '-U', str(last_set), '-b', os.path.join(self.base_dir, 'dists.dss')
+        ], cwd=data_dir, env={**os.environ, 'DSS_PATH': data_dir}, check=True)
+
+    def get_functions(self, update_set):
+        """The refresh functions of the pair of update_set that did not finish before."""
+        return [(query_id, function) for query_id, function in (
+            ('RF1', RefreshStream.rf1), ('RF2', RefreshStream.rf2)
+        ) if (REFRESH_STREAM_ID, query_id, update_set) not in self.completed]
+
+    @staticmethod
+    def read_delete_keys(delete_file):
+        with open(delete_file, 'r') as keys_file:
+            return [int(line.strip().rstrip('|')) for line in keys_file if line.strip()]
+
+    @staticmethod
+    def rf1(cursor, data_dir, update_set):
+        for table in ('orders', 'lineitem'):
+            with open(os.path.join(data_dir, f'{table}.tbl.u{update_set}'), 'r') as data_file:
+                cursor.copy_expert(f"COPY {table} FROM STDIN WITH DELIMITER '|'",
+                                   StripTrailingDelimiter(data_file))
+
+    @staticmethod
+    def rf2(cursor, data_dir, update_set):
+        keys = RefreshStream.read_delete_keys(os.path.join(data_dir, f'delete.{update_set}'))
+        cursor.execute('DELETE FROM lineitem WHERE l_orderkey = ANY(%s)', (keys,))
+        cursor.execute('DELETE FROM orders WHERE o_orderkey = ANY(%s)', (keys,))
+
+    def run_function(self, conn, function, data_dir, update_set):
+        status = Status.ERROR
+        start = time.time()
+        try:
+            conn.cursor.execute('BEGIN')
+            function(conn.cursor, data_dir, update_set)
+            conn.cursor.execute('COMMIT')
+            status = Status.OK
+
+        except psycopg2.extensions.QueryCanceledError:
+            status = Status.TIMEOUT
+            conn.cursor.execute('ROLLBACK')
+
+        except psycopg2.Error:
+            LOG.exception('Refresh function failed')
+            conn.cursor.execute('ROLLBACK')
+
+        return start, time.time(), status
+
+    def run(self, reporting_queue, deadline=None):
+        update_sets = [update_set for update_set in self.update_sets
+                       if self.get_functions(update_set)]
+        if not update_sets:
+            LOG.info('all refresh function pairs finished before resuming.')
+            return
+
+        with tempfile.TemporaryDirectory(prefix='tpch-refresh-') as data_dir:
+            self.generate(data_dir)
+
+            with DBConn(self.dsn, statement_timeout=self.timeout) as conn:
+                for update_set in update_sets:
+                    if deadline and time.time() >= deadline:
+                        break
+
+                    for query_id, function in self.get_functions(update_set):
+                        LOG.info(f'running  {query_id} with update set {update_set}.')
+                        start, stop, status = self.run_function(conn, function, data_dir,
+                                                                update_set)
+                        LOG.info(f'finished {query_id} with update set {update_set}: '
+                                 f'{stop - start:.2f}s {status.name}')
+
+                        reporting_queue.put(QueryMetric(
+                            stream_id=REFRESH_STREAM_ID,
+                            query_id=query_id,
+                            iteration=update_set,
+                            timestamp_start=start,
+                            timestamp_stop=stop,
+                            status=status.name,
+                            result=None,
+                            plan=None
+                        ))
@@ -0,0 +1,93 @@
+import os
+
+from string import Template
+
+import pytest
+
+from benchmarks.tpch.parameters import QueryParameters, read_distributions, BASE_DIR
+
+QUERY_IDS = range(1, 23)
+
+# the parameters of the shipped query files
+FIXED_PARAMETERS = {
+    1: {'delta': 70},
+    2: {'size': 41, 'type': 'BRASS', 'region': 'AMERICA'},
+    3: {'segment': 'HOUSEHOLD', 'date': '1995-03-07'},
+    4: {'date': '1994-01-01'},
+    5: {'region': 'ASIA', 'date': '1993-01-01'},
+    6: {'date': '1993-01-01', 'discount': '0.05', 'quantity': 24},
+    7: {'nation1': 'IRAQ', 'nation2': 'ETHIOPIA'},
+    8: {'nation': 'IRAQ', 'region': 'MIDDLE EAST', 'type': 'SMALL BURNISHED BRASS'},
+    9: {'color': 'cyan'},
+    10: {'date': '1993-07-01'},
+    11: {'nation': 'ROMANIA', 'fraction': '0.0001000000'},
+    12: {'shipmode1': 'TRUCK', 'shipmode2': 'AIR', 'date': '1996-01-01'},
+    13: {'word1': 'special', 'word2': 'accounts'},
+    14: {'date': '1996-06-01'},
+    15: {'date': '1995-10-01'},
+    16: {'brand': 'Brand#32', 'type': 'LARGE BRUSHED', 'size1': 44, 'size2': 41, 'size3': 13,
+         'size4': 46, 'size5': 36, 'size6': 43, 'size7': 31, 'size8': 33},
+    17: {'brand': 'Brand#24', 'container': 'WRAP JAR'},
+    18: {'quantity': 314},
+    19: {'brand1': 'Brand#55', 'brand2': 'Brand#25', 'brand3': 'Brand#45', 'quantity1': 6,
+         'quantity2': 16, 'quantity3': 25},
+    20: {'color': 'salmon', 'date': '1994-01-01', 'nation': 'RUSSIA'},
+    21: {'nation': 'ETHIOPIA'},
+    22: {'i1': 32, 'i2': 27, 'i3': 31, 'i4': 25, 'i5': 26, 'i6': 24, 'i7': 19},
+}
+
+
+@pytest.fixture
+def query_parameters():
+    return QueryParameters(scale_factor=1, seed=42)
+
+
+def read_template(query_parameters, query_id):
+    with open(query_parameters.get_template_path(query_id), 'r') as template_file:
+        return Template(template_file.read())
+
+
+def test_read_distributions():
+    distributions = read_distributions(os.path.join(BASE_DIR, 'dists.dss'))
+
+    assert len(distributions['colors']) == 92
+    assert len(distributions['p_types']) == 150
+    assert distributions['Q13a'] == ['special', 'pending', 'unusual', 'express']
+
+
+@pytest.mark.parametrize('query_id', QUERY_IDS)
+def test_templates_match_query_files(query_parameters, query_id):
+    sql = read_template(query_parameters, query_id).substitute(FIXED_PARAMETERS[query_id])
+
+    with open(os.path.join(BASE_DIR, 'queries', f'{query_id}.sql'), 'r') as query_file:
+        query_lines = [line for line in query_file if not line.startswith('-- using')]
+
+    # the templates start with a vim modeline instead of the qgen seed comment
+    assert sql.split('\n', 1)[1].strip() == ''.join(query_lines).strip()
+
+
+@pytest.mark.parametrize('query_id', QUERY_IDS)
+def test_generated_parameters_fill_templates(query_parameters, query_id):
+    for stream_id in range(5):
+        parameters = query_parameters.get_parameters(stream_id, query_id)
+        assert '$' not in read_template(query_parameters, query_id).substitute(parameters)
+
+
+def test_parameters_seeded_per_stream(query_parameters):
+    assert query_parameters.get_parameters(1, 16) == query_parameters.get_parameters(1, 16)
+    assert query_parameters.get_parameters(1, 16) != query_parameters.get_parameters(2, 16)
+    assert query_parameters.get_parameters(1, 16) != query_parameters.get_parameters(1, 16, 2)
+    assert QueryParameters(1, seed=1).get_parameters(1, 16) != query_parameters.get_parameters(1, 16)
+
+
+def test_parameter_domains(query_parameters):
+    for stream_id in range(50):
+        q8 = query_parameters.get_parameters(stream_id, 8)
+        q12 = query_parameters.get_parameters(stream_id, 12)
+        q22 = query_parameters.get_parameters(stream_id, 22)
+
+        assert q8['region'] in ('AFRICA', 'AMERICA', 'ASIA', 'EUROPE', 'MIDDLE EAST')
+        assert q12['shipmode1'] != q12['shipmode2']
+        assert len(set(q22.values())) == 7
+        assert all(10 <= code <= 34 for code in q22.values())
+        assert 60 <= query_parameters.get_parameters(stream_id, 1)['delta'] <= 120
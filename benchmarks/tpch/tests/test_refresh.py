@@ -0,0 +1,82 @@
+import io
+import os
+
+import psycopg2
+
+from benchmarks.tpch.refresh import RefreshStream, StripTrailingDelimiter
+from s64da_benchmark_toolkit.db import Status
+from s64da_benchmark_toolkit.reporting import REFRESH_STREAM_ID
+
+
+def test_strip_trailing_delimiter():
+    data_file = StripTrailingDelimiter(io.StringIO('1|foo|\n2|bar|\n'))
+
+    assert data_file.read(4) == '1|foo\n'
+    assert data_file.read() == '2|bar\n'
+    assert data_file.read() == ''
+
+    # an empty last column and trailing blanks are kept
+    data_file = StripTrailingDelimiter(io.StringIO('1|foo||\n2|bar |\n3|baz'))
+    assert data_file.read() == '1|foo|\n2|bar \n3|baz\n'
+
+
+def test_generate(tmp_path):
+    RefreshStream('dsn', 0.01, 2).generate(str(tmp_path))
+
+    assert {'orders.tbl.u1', 'lineitem.tbl.u1', 'delete.1', 'delete.2'} <= set(os.listdir(tmp_path))
+    assert len(RefreshStream.read_delete_keys(str(tmp_path / 'delete.1'))) > 0
+
+
+def test_rf1_rf2(mocker, tmp_path):
+    for file_name in ('orders.tbl.u1', 'lineitem.tbl.u1'):
+        (tmp_path / file_name).write_text('1|2|3|\n')
+    (tmp_path / 'delete.1').write_text('5|\n7|\n')
+    cursor = mocker.MagicMock()
+
+    RefreshStream.rf1(cursor, str(tmp_path), 1)
+    RefreshStream.rf2(cursor, str(tmp_path), 1)
+
+    assert [c[1][0] for c in cursor.copy_expert.mock_calls] == [
+        "COPY orders FROM STDIN WITH DELIMITER '|'", "COPY lineitem FROM STDIN WITH DELIMITER '|'"]
+    cursor.execute.assert_any_call('DELETE FROM orders WHERE o_orderkey = ANY(%s)', ([5, 7],))
+
+
+def test_run_function_rolls_back_on_error(mocker):
+    conn = mocker.MagicMock()
+
+    def fail(cursor, data_dir, update_set):
+        raise psycopg2.Error('duplicate key')
+
+    _, _, status = RefreshStream('dsn', 1, 1).run_function(conn, fail, 'dir', 1)
+
+    assert status == Status.ERROR
+    assert [c[1][0] for c in conn.cursor.execute.mock_calls] == ['BEGIN', 'ROLLBACK']
+
+
+def test_run_skips_completed_pairs(mocker):
+    completed = {(REFRESH_STREAM_ID, 'RF1', 3), (REFRESH_STREAM_ID, 'RF1', 4),
+                 (REFRESH_STREAM_ID, 'RF2', 4)}
+    refresh_stream = RefreshStream('dsn', 1, 3, first_set=3, completed=completed)
+    generate_mock = mocker.patch.object(refresh_stream, 'generate')
+    mocker.patch('benchmarks.tpch.refresh.DBConn')
+    run_function_mock = mocker.patch.object(refresh_stream, 'run_function',
+                                            return_value=(1.0, 2.0, Status.OK))
+    reporting_queue = mocker.MagicMock()
+
+    refresh_stream.run(reporting_queue)
+
+    generate_mock.assert_called_once()
+    assert [(c[1][1].__name__, c[1][3]) for c in run_function_mock.mock_calls] == [
+        ('rf2', 3), ('rf1', 5), ('rf2', 5)]
+    assert [c[1][0].iteration for c in reporting_queue.put.mock_calls] == [3, 5, 5]
+
+    refresh_stream.completed |= {(REFRESH_STREAM_ID, 'RF2', 3), (REFRESH_STREAM_ID, 'RF1', 5),
+                                 (REFRESH_STREAM_ID, 'RF2', 5)}
+    refresh_stream.run(reporting_queue)
+    generate_mock.assert_called_once()
+
+
+def test_generate_from_first_set(tmp_path):
+    RefreshStream('dsn', 0.01, 1, first_set=2).generate(str(tmp_path))
+
+    assert {'orders.tbl.u2', 'delete.2'} <= set(os.listdir(tmp_path))
@@ -0,0 +1,213 @@
+import argparse
+import contextlib
+import io
+import os
+import random
+import tempfile
+
+from collections import deque, namedtuple
+from datetime import datetime
+
+import numpy as np
+import pandas
+
+from benchmarks.htap.htap_loader import Loader, COPY_SIZE
+from benchmarks.htap.lib.helpers import (
+    Random, OLTPText, OLAPText, StringIteratorIO, CUST_PER_DIST)
+from benchmarks.htap.lib.stats import Stats, QUERY_TYPES
+from s64da_benchmark_toolkit.correctness import Correctness
+from s64da_benchmark_toolkit.reporting import QueryMetric, Reporting
+from s64da_benchmark_toolkit.streams import Benchmark
+
+# a case prepares its input with setup(), which is not measured, and runs the measured code
+# with run(state); ops is the number of operations (rows, calls, samples) per run. The loader
+# cases include encoding the rows for the text COPY of the default driver.
+Case = namedtuple('Case', ['name', 'setup', 'run', 'ops'])
+
+SEED = 0
+START_DATE = datetime(2020, 1, 1)
+START_SECOND = 1577836800
+
+
+def make_loader():
+    return Loader(dsn=None, warehouse_id=1, start_date=START_DATE)
+
+
+def run_generate_customer(loader):
+    for c_id in range(1, CUST_PER_DIST + 1):
+        loader.row_for_copy(loader.generate_customer(1, c_id))
+
+
+def run_generate_stock(loader):
+    for s_id in range(1, 2001):
+        loader.row_for_copy(loader.generate_stock(s_id))
+
+
+def run_generate_item(loader):
+    for i_id in range(1, 2001):
+        loader.row_for_copy(loader.generate_item(i_id))
+
+
+def setup_orders():
+    loader = make_loader()
+    loader.order_lines = []
+    loader.c_ids = list(range(1, 1001))
+    loader.random.shuffle(loader.c_ids)
+    return loader
+
+
+def run_generate_order(loader):
+    for o_id in range(1, 1001):
+        loader.row_for_copy(loader.generate_order(1, o_id))
+
+
+def setup_order_lines():
+    loader = setup_orders()
+    run_generate_order(loader)
+    return loader
+
+
+def run_generate_order_lines(loader):
+    for order_line in loader.order_lines:
+        for row in loader.generate_order_lines(order_line):
+            loader.row_for_copy(row)
+
+
+def run_random(rng):
+    for _ in range(100000):
+        rng.nurand(1023, 1, 3000)
+
+
+def run_oltp_text(oltp_text):
+    for _ in range(20000):
+        oltp_text.string(24)
+
+
+def run_olap_text(olap_text):
+    for _ in range(200):
+        olap_text.random_length_text(100, 500)
+
+
+def setup_string_iterator():
+    rng = random.Random(SEED)
+    return [''.join(rng.choices('abcdefghij\t', k=rng.randint(50, 150))) + '\n'
+            for _ in range(50000)]
+
+
+def run_string_iterator(rows):
+    reader = StringIteratorIO(iter(rows))
+    while reader.read(COPY_SIZE):
+        pass
+
+
+def make_oltp_samples(num_samples, num_seconds):
+    rng = random.Random(SEED)
+    return [{
+        'timestamp': START_SECOND + idx * num_seconds / num_samples,
+        'query': rng.choice(QUERY_TYPES),
+        'status': 'ok' if rng.random() < 0.99 else 'error',
+        'runtime': rng.expovariate(100)
+    } for idx in range(num_samples)]
+
+
+def make_stats():
+    return Stats('postgresql://postgres@localhost/htap', 1, 1, None, initial_sec=START_SECOND)
+
+
+def setup_update_oltp_stats():
+    return make_stats(), make_oltp_samples(50000, 600)
+
+
+def run_update_oltp_stats(state):
+    stats, samples = state
+    stats._update_oltp_stats(samples)
+
+
+def setup_oltp_total():
+    stats = make_stats()
+    stats._update_oltp_stats(make_oltp_samples(50000, 600))
+    return stats
+
+
+def run_oltp_total(stats):
+    stats.oltp_total()
+    for query_type in QUERY_TYPES:
+        stats.oltp_total(query_type)
+
+
+def setup_check_for_mismatches():
+    rng = np.random.default_rng(SEED)
+    num_rows = 5000
+    truth = pandas.DataFrame({
+        'key': np.arange(num_rows),
+        'name': [f'name-{idx}' for idx in range(num_rows)],
+        'price': rng.random(num_rows) * 1000,
+        'quantity': rng.integers(1, 50, num_rows)
+    })
+    result = truth.copy()
+    # every 100th row differs beyond the tolerance, so the row by row comparison runs
+    result.loc[::100, 'price'] += 1
+    return truth, result
+
+
+def run_check_for_mismatches(state):
+    truth, result = state
+    Correctness.check_for_mismatches(truth, result)
+
+
+class ListQueue:
+    def __init__(self, items):
+        self.items = deque(items)
+
+    def get(self):
+        return self.items.popleft()
+
+    def empty(self):
+        return not self.items
+
+
+def setup_run_report():
+    args = argparse.Namespace(
+        check_correctness=False, scale_factor=None, explain_analyze=False, duration=None,
+        arrival_rate=None, repetitions=1, scheduler='streams', netdata_output_file=None,
+        output=['csv'], csv_file=os.path.join(tempfile.gettempdir(), 'perf-results.csv'))
+    reporting = Reporting(Benchmark(name='tpch', base_dir='benchmarks/tpch'), args, {})
+
+    # 20 TPC-H streams
+    rng = random.Random(SEED)
+    query_metrics = []
+    for stream_id in range(1, 21):
+        start = START_SECOND
+        for query_id in range(1, 23):
+            runtime = rng.expovariate(1)
+            query_metrics.append(QueryMetric(
+                stream_id=stream_id, query_id=query_id, timestamp_start=start,
+                timestamp_stop=start + runtime, status='OK', result=None, plan=None))
+            start += runtime
+    return reporting, query_metrics
+
+
+def run_run_report(state):
+    reporting, query_metrics = state
+    with contextlib.redirect_stdout(io.StringIO()):
+        reporting.run_report(ListQueue(query_metrics))
+
+
+CASES = [
+    Case('loader.generate_customer', make_loader, run_generate_customer, CUST_PER_DIST),
+    Case('loader.generate_stock', make_loader, run_generate_stock, 2000),
+    Case('loader.generate_item', make_loader, run_generate_item, 2000),
+    Case('loader.generate_order', setup_orders, run_generate_order, 1000),
+    Case('loader.generate_order_lines', setup_order_lines, run_generate_order_lines, 1000),
+    Case('helpers.Random.nurand', lambda: Random(SEED), run_random, 100000),
+    Case('helpers.OLTPText.string', lambda: OLTPText(Random(SEED)), run_oltp_text, 20000),
+    Case('helpers.OLAPText.random_length_text', lambda: OLAPText(Random(SEED)),
+         run_olap_text, 200),
+    Case('helpers.StringIteratorIO.read', setup_string_iterator, run_string_iterator, 50000),
+    Case('stats.Stats._update_oltp_stats', setup_update_oltp_stats, run_update_oltp_stats,
+         50000),
+    Case('stats.Stats.oltp_total', setup_oltp_total, run_oltp_total, 1 + len(QUERY_TYPES)),
+    Case('correctness.Correctness.check_for_mismatches', setup_check_for_mismatches,
+         run_check_for_mismatches, 5000),
+    Case('reporting.Reporting.run_report', setup_run_report, run_run_report, 440),
+]
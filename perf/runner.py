@@ -0,0 +1,145 @@
+import argparse
+import json
+import os
+import re
+import time
+import tracemalloc
+import warnings
+
+from tabulate import tabulate
+
+from perf.cases import CASES
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+# peak memory increases below this are not considered regressions, small peaks are noisy
+MEMORY_SLACK_KIB = 64
+
+
+def measure(case, repeats=7):
+    """
+    Operations per second of the fastest of the timed runs, after one untimed warm-up run,
+    and the peak memory in KiB allocated by one more run traced with tracemalloc. Each run
+    gets a fresh state from setup(). The fastest run is the one least disturbed by other
+    processes, slower ones do not tell more about the code, see the timeit documentation.
+    """
+    case.run(case.setup())
+
+    timings = []
+    for _ in range(repeats):
+        state = case.setup()
+        start = time.perf_counter()
+        case.run(state)
+        timings.append(time.perf_counter() - start)
+
+    # traced separately, tracemalloc slows down allocations considerably
+    state = case.setup()
+    tracemalloc.start()
+    try:
+        case.run(state)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'ops_per_sec': case.ops / min(timings),
+        'peak_kib': peak / 1024
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Regressions of the results against the baseline: cases that got slower, or that allocate
+    more memory at peak, by more than the tolerance. Cases without a baseline are skipped.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+
+        expected = baseline[name]
+        if result['ops_per_sec'] < expected['ops_per_sec'] * (1 - tolerance):
+            regressions.append(f'{name}: {result["ops_per_sec"]:.1f} ops/s, baseline '
+                               f'{expected["ops_per_sec"]:.1f} ops/s')
+        if result['peak_kib'] > max(expected['peak_kib'] * (1 + tolerance),
+                                    expected['peak_kib'] + MEMORY_SLACK_KIB):
+            regressions.append(f'{name}: {result["peak_kib"]:.1f} KiB peak, baseline '
+                               f'{expected["peak_kib"]:.1f} KiB')
+    return regressions
+
+
+def load_baseline(baseline_file):
+    if not os.path.exists(baseline_file):
+        return {}
+    with open(baseline_file, 'r') as baseline:
+        return json.load(baseline)
+
+
+def save_baseline(baseline_file, results):
+    with open(baseline_file, 'w') as baseline:
+        json.dump(results, baseline, indent=4, sort_keys=True)
+        baseline.write('\n')
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(
+        prog='python -m perf', formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Micro-benchmarks of the Python hot paths of the toolkit.')
+
+    parser.add_argument('--filter', default=None, help=(
+        'Only run the cases whose name matches this regular expression.'
+    ))
+
+    parser.add_argument('--repeats', type=int, default=7, help=(
+        'Number of timed runs per case, the fastest one is reported.'
+    ))
+
+    parser.add_argument('--baseline', default=BASELINE_FILE, help=(
+        'JSON file with the baseline results to compare with.'
+    ))
+
+    parser.add_argument('--save-baseline', action='store_true', default=False, help=(
+        'Store the results as the new baseline instead of comparing with it.'
+    ))
+
+    parser.add_argument('--tolerance', type=float, default=0.2, help=(
+        'Relative slowdown or peak memory increase over the baseline that fails the run.'
+    ))
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    baseline = load_baseline(args.baseline)
+
+    results = {}
+    rows = []
+    for case in CASES:
+        if args.filter and not re.search(args.filter, case.name):
+            continue
+
+        with warnings.catch_warnings():
+            # e.g. pandas deprecations, printed once per call they would bury the results
+            warnings.simplefilter('ignore')
+            result = measure(case, args.repeats)
+        results[case.name] = result
+        expected = baseline.get(case.name)
+        rows.append((
+            case.name, result['ops_per_sec'], result['peak_kib'],
+            result['ops_per_sec'] / expected['ops_per_sec'] if expected else None
+        ))
+
+    print(tabulate(rows, headers=('case', 'ops/s', 'peak KiB', 'vs. baseline'),
+                   tablefmt='github', floatfmt='.2f'))
+
+    if args.save_baseline:
+        save_baseline(args.baseline, {**baseline, **results})
+        print(f'\nSaved the baseline to {args.baseline}.')
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f'\nRegressions beyond {args.tolerance:.0%}:')
+        print('\n'.join(regressions))
+        return 1
+    return 0
@@ -0,0 +1,389 @@
+import asyncio
+import csv
+import json
+import logging
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from multiprocessing import Pool
+
+import asyncpg
+
+from .db import DB, NullSink, PlanCapture, SpilledResult, Status, Timing
+from .simulation import AsyncSimulatedDB
+
+LOG = logging.getLogger()
+
+
+class AsyncDB:
+    def __init__(self, dsn, plan_capture=None, result_mode='fetch', fetch_batch_size=10000,
+                 prepared_statements=False):
+        self.dsn = dsn
+        self.plan_capture = plan_capture or PlanCapture()
+        self.result_mode = result_mode
+        self.fetch_batch_size = fetch_batch_size
+        self.prepared_statements = prepared_statements
+
+    async def connect(self, timeout):
+        return await asyncpg.connect(self.dsn, server_settings={
+            'statement_timeout': str(timeout)
+        })
+
+    @staticmethod
+    async def auto_explain_on(conn):
+        await conn.execute("LOAD 'auto_explain'")
+        for key, value in DB.AUTO_EXPLAIN_CONFIG.items():
+            await conn.execute(f'SET {key} = $${value}$$')
+
+    @staticmethod
+    async def get_explain_output(conn, sql):
+        try:
+            plan = await conn.fetchval(DB.make_explain_sql(sql))
+            return json.dumps(json.loads(plan), indent=4)
+
+        except asyncpg.PostgresError as e:
+            return f'{{"Explain Output failed": "{str(e)}"}}'
+
+        except (json.JSONDecodeError, TypeError) as e:
+            return f'{{"Explain Output failed": "{str(e)}"}}'
+
+    @staticmethod
+    async def _fetch(conn, sql, use_server_side_cursors):
+        statement = await conn.prepare(sql)
+        columns = [attribute.name for attribute in statement.get_attributes()]
+        if use_server_side_cursors:
+            async with conn.transaction():
+                cursor = statement.cursor()
+                rows = []
+                first_row_at = None
+                async for record in cursor:
+                    if first_row_at is None:
+                        first_row_at = time.time()
+                    rows.append(tuple(record))
+            first_row_at = first_row_at or time.time()
+        else:
+            records = await statement.fetch()
+            first_row_at = time.time()
+            rows = [tuple(record) for record in records]
+
+        return (columns, rows), first_row_at
+
+    @staticmethod
+    async def _prepare(conn, sql, prepared):
+        sql_hash = PlanCapture.sql_hash(sql)
+        if sql_hash in prepared:
+            return 0.0
+
+        name = f'benchmark_query_{len(prepared) + 1}'
+        await conn.execute(f'PREPARE {name} AS {DB.make_copy_query(sql)}')
+        prepared[sql_hash] = name
+        explain_output = await conn.fetchval(f'EXPLAIN (SUMMARY, FORMAT JSON) EXECUTE {name}')
+        return DB.get_planning_time(json.loads(explain_output))
+
+    @staticmethod
+    async def _execute_prepared(conn, sql, prepared):
+        execution_start = time.time()
+        query_result, first_row_at = await AsyncDB._fetch(
+            conn, f'EXECUTE {prepared[PlanCapture.sql_hash(sql)]}', False)
+        execution_time = time.time() - execution_start
+        return query_result, first_row_at, execution_time
+
+    @staticmethod
+    async def _copy_to_null(conn, sql):
+        sink = NullSink()
+
+        async def write(data):
+            sink.write(data)
+
+        await conn.copy_from_query(DB.make_copy_query(sql), output=write)
+        return SpilledResult(path=os.devnull, num_rows=sink.num_rows, num_bytes=sink.num_bytes), \
+            sink.first_write_at or time.time()
+
+    @staticmethod
+    async def _stream_to_csv(conn, sql, result_file, batch_size):
+        statement = await conn.prepare(sql)
+        num_rows = 0
+        os.makedirs(os.path.dirname(result_file), exist_ok=True)
+        with open(result_file, 'w') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow([attribute.name for attribute in statement.get_attributes()])
+            async with conn.transaction():
+                cursor = await statement.cursor()
+                rows = await cursor.fetch(batch_size)
+                first_row_at = time.time()
+                while rows:
+                    writer.writerows(tuple(record) for record in rows)
+                    num_rows += len(rows)
+                    rows = await cursor.fetch(batch_size)
+            num_bytes = csv_file.tell()
+
+        return SpilledResult(path=result_file, num_rows=num_rows, num_bytes=num_bytes), \
+            first_row_at
+
+    def session(self, timeout):
+        return AsyncDBSession(self, timeout)
+
+    async def run_query(self, sql, timeout, auto_explain=False, use_server_side_cursors=False,
+                        session=None, result_file=None):
+        if self.result_mode == 'discard':
+            result_file = os.devnull
+        elif self.result_mode != 'stream':
+            result_file = None
+
+        if session is not None:
+            await AsyncDB.reset_session(session.conn)
+            prepared = session.prepared if self.prepared_statements else None
+            return await self._run_query(session.conn, sql, auto_explain,
+                                         use_server_side_cursors, session.take_connect_time(),
+                                         result_file, prepared)
+
+        connect_start = time.time()
+        conn = await self.connect(timeout)
+        connect_time = time.time() - connect_start
+        try:
+            return await self._run_query(conn, sql, auto_explain, use_server_side_cursors,
+                                         connect_time, result_file)
+        finally:
+            await conn.close()
+
+    @staticmethod
+    async def reset_session(conn):
+        # DISCARD ALL would also drop the statements prepared and cached by asyncpg
+        await conn.execute('CLOSE ALL; RESET ALL')
+
+    async def capture_plan(self, conn, sql):
+        needs_explain, plan = self.plan_capture.lookup(sql)
+        if needs_explain:
+            plan = await AsyncDB.get_explain_output(conn, sql)
+            self.plan_capture.store(sql, plan)
+        return plan
+
+    async def explain_queries(self, sqls, timeout):
+        plans = {}
+        conn = await self.connect(timeout)
+        try:
+            for sql in sqls:
+                sql_hash = PlanCapture.sql_hash(sql)
+                if sql_hash not in plans:
+                    plans[sql_hash] = await AsyncDB.get_explain_output(conn, sql)
+        finally:
+            await conn.close()
+
+        return [plans[PlanCapture.sql_hash(sql)] for sql in sqls]
+
+    async def _run_query(self, conn, sql, auto_explain, use_server_side_cursors, connect_time,
+                         result_file=None, prepared=None):
+        status = Status.ERROR
+        query_result = None
+        plan = None
+        planning_time, execution_time = None, None
+        first_row_time, fetch_time = None, None
+        start = None
+        notices = []
+
+        def on_notice(_, message):
+            notices.append(message.message)
+
+        conn.add_log_listener(on_notice)
+        try:
+            if prepared is not None:
+                # untimed, only the execution counts towards the runtime
+                planning_time = await AsyncDB._prepare(conn, sql, prepared)
+
+            start = time.time()
+
+            if auto_explain:
+                await AsyncDB.auto_explain_on(conn)
+
+            query_start = time.time()
+            if prepared is not None:
+                query_result, first_row_at, execution_time = \
+                    await AsyncDB._execute_prepared(conn, sql, prepared)
+            elif result_file == os.devnull:
+                query_result, first_row_at = await AsyncDB._copy_to_null(conn, sql)
+            elif result_file is not None:
+                query_result, first_row_at = await AsyncDB._stream_to_csv(
+                    conn, sql, result_file, self.fetch_batch_size)
+            else:
+                query_result, first_row_at = await AsyncDB._fetch(
+                    conn, sql, use_server_side_cursors)
+            first_row_time = first_row_at - query_start
+            fetch_time = time.time() - first_row_at
+            status = Status.OK
+
+            # the first line of each auto_explain message is the "duration: ... plan:" header,
+            # the JSON plan follows on the next lines
+            plan = '\n'.join('\n'.join(notice.split('\n')[1:]) for notice in notices)
+            if plan.strip() != '':
+                plan = f'[{plan}]'
+
+        except asyncpg.exceptions.QueryCanceledError:
+            status = Status.TIMEOUT
+            query_result = None
+
+        except (asyncpg.PostgresError, UnicodeDecodeError):
+            LOG.exception('Ignoring asyncpg Error')
+            query_result = None
+
+        finally:
+            stop = time.time()
+            # the query did not start if preparing it failed
+            start = start or stop
+            if plan is None or plan.strip() == '':
+                plan = await self.capture_plan(conn, sql)
+            conn.remove_log_listener(on_notice)
+
+        return Timing(start=start, stop=stop, status=status, connect=connect_time,
+                      planning=planning_time, execution=execution_time,
+                      first_row=first_row_time, fetch=fetch_time), query_result, plan
+
+
+class AsyncDBSession:
+    """
+    The asyncio counterpart of DBSession, a connection kept open for all queries of a stream.
+    """
+    def __init__(self, db, timeout):
+        self.db = db
+        self.timeout = timeout
+        self.conn = None
+        self.connect_time = 0
+        self.prepared = {}
+
+    async def __aenter__(self):
+        connect_start = time.time()
+        self.conn = await self.db.connect(self.timeout)
+        self.connect_time = time.time() - connect_start
+        return self
+
+    async def __aexit__(self, *args):
+        await self.conn.close()
+
+    def take_connect_time(self):
+        connect_time = self.connect_time
+        self.connect_time = 0
+        return connect_time
+
+
+class AsyncStreamsExecutor:
+    """
+    Runs query streams as coroutines on top of asyncpg instead of one process per stream.
+
+    All streams of a shard share a single event loop and therefore a single process. With
+    num_processes > 1 the streams are distributed round-robin over that many processes, each
+    running its own event loop. The produced QueryMetrics are the same as the ones of the
+    process pool executor.
+    """
+    def __init__(self, streams, num_processes=1):
+        self.streams = streams
+        self.num_processes = max(num_processes, 1)
+        if streams.simulate:
+            self.db = AsyncSimulatedDB(streams.db)
+        else:
+            self.db = AsyncDB(streams.db.dsn, streams.db.plan_capture, streams.db.result_mode,
+                              streams.db.fetch_batch_size, streams.db.prepared_statements)
+
+    def make_shards(self, stream_ids):
+        shards = [stream_ids[idx::self.num_processes] for idx in range(self.num_processes)]
+        return [shard for shard in shards if shard]
+
+    def run(self, reporting_queue, stream_ids):
+        shards = self.make_shards(tuple(stream_ids))
+        if len(shards) == 1:
+            self._run_shard(reporting_queue, shards[0])
+            return
+
+        with Pool(processes=len(shards)) as pool:
+            pool.starmap(self._run_shard, ((reporting_queue, shard) for shard in shards))
+
+    def _run_shard(self, reporting_queue, stream_ids):
+        loop = asyncio.new_event_loop()
+        # the query events and metrics are written by a single thread, in order and without
+        # blocking the event loop on the file or the reporting queue
+        writer = ThreadPoolExecutor(max_workers=1)
+        try:
+            loop.run_until_complete(self._run_streams(reporting_queue, stream_ids, writer))
+        finally:
+            writer.shutdown(wait=True)
+            loop.close()
+
+    async def _run_streams(self, reporting_queue, stream_ids, writer):
+        await asyncio.gather(*(
+            self._run_stream(reporting_queue, stream_id, writer) for stream_id in stream_ids
+        ))
+
+    async def _run_stream(self, reporting_queue, stream_id, writer):
+        if self.streams.connection_mode == 'session':
+            async with self.db.session(self.streams.config.get('timeout', 0)) as session:
+                await self._run_sequence(reporting_queue, stream_id, session, writer)
+        else:
+            await self._run_sequence(reporting_queue, stream_id, None, writer)
+
+    @staticmethod
+    def _write(writer, function, *args, **kwargs):
+        return asyncio.get_event_loop().run_in_executor(writer, partial(function, *args, **kwargs))
+
+    async def _run_sequence(self, reporting_queue, stream_id, session, writer):
+        # the events are not awaited one by one, so that writing them does not delay the
+        # queries, but all of them before the stream is done
+        events = []
+        try:
+            await self._run_queries(reporting_queue, stream_id, session, writer, events)
+        finally:
+            await asyncio.gather(*events)
+
+    async def _run_queries(self, reporting_queue, stream_id, session, writer, events):
+        streams = self.streams
+        sequence = streams.get_stream_sequence(stream_id)
+        num_queries = len(sequence)
+        timeout = streams.parse_timeout(streams.config.get('timeout', 0))
+        deferred_metrics = []
+        for iteration, num_query, query_id in streams.iterate_stream(sequence, stream_id):
+            pretext = streams.make_pretext(stream_id, iteration, num_query, num_queries, query_id)
+
+            if query_id in streams.config.get('ignore', []):
+                if not streams.is_warmup(iteration):
+                    LOG.info(f'ignoring {pretext}.')
+                    await self._write(writer, reporting_queue.put, streams.make_ignored_metric(
+                        stream_id, query_id, timeout, iteration))
+                continue
+
+            LOG.info(f'running  {pretext}.')
+            query_sql = streams.get_query_sql(stream_id, query_id, iteration)
+            warmup = streams.is_warmup(iteration)
+            if streams.events:
+                events.append(self._write(writer, streams.events.query_started, stream_id,
+                                          query_id, iteration, warmup=warmup))
+            if streams.simulate:
+                timing, query_result, plan = await self.db.simulate_query(
+                    stream_id, query_id, iteration, streams.get_result_file(stream_id, query_id))
+            else:
+                timing, query_result, plan = await self.db.run_query(
+                    query_sql, streams.config.get('timeout', 0),
+                    streams.explain_analyze, streams.use_server_side_cursors, session,
+                    streams.get_result_file(stream_id, query_id))
+            runtime = timing.stop - timing.start
+            if streams.events:
+                events.append(self._write(writer, streams.events.query_finished, stream_id,
+                                          query_id, iteration, timing.status.name, runtime,
+                                          warmup=warmup))
+
+            LOG.info(f'finished {pretext}: {runtime:.2f}s {timing.status.name}')
+            if warmup:
+                continue
+
+            query_metric = streams.make_query_metric(
+                stream_id, query_id, timing, query_result, plan, timeout, iteration)
+            if self.db.plan_capture.is_deferred and not plan:
+                deferred_metrics.append(query_metric)
+            else:
+                await self._write(writer, reporting_queue.put, query_metric)
+
+        if deferred_metrics:
+            sqls = [streams.get_query_sql(stream_id, metric.query_id, metric.iteration)
+                    for metric in deferred_metrics]
+            plans = await self.db.explain_queries(sqls, streams.config.get('timeout', 0))
+            for query_metric, plan in zip(deferred_metrics, plans):
+                query_metric.plan = plan
+                await self._write(writer, reporting_queue.put, query_metric)
@@ -0,0 +1,274 @@
+import argparse
+import logging
+import math
+import os
+
+import numpy as np
+import pandas
+
+from natsort import natsort_keygen
+from tabulate import tabulate
+
+LOG = logging.getLogger()
+
+# the samples of a run, value is a runtime, a latency or a throughput
+SAMPLE_COLUMNS = ('source', 'query_id', 'stream_id', 'metric', 'value')
+HIGHER_IS_BETTER = {'tps'}
+ALL_STREAMS = 'all'
+
+OLAP_COLUMNS = ('time', 'stream_id', 'iteration', 'query_id', 'status', 'value')
+OLTP_COLUMNS = ('time', 'query_id', 'total', 'ok', 'error', 'tps', 'tps_min', 'tps_avg',
+                'tps_max', 'latency', 'latency_min', 'latency_avg', 'latency_max')
+
+TESTS = ('mann-whitney', 'bootstrap')
+COMPARISON_COLUMNS = ('run', 'source', 'query_id', 'stream_id', 'metric', 'samples', 'baseline',
+                      'median', 'change', 'p_value', 'ci_low', 'ci_high', 'verdict')
+
+
+def load_results_csv(csv_file):
+    """The runtimes of the OK queries of a Reporting results CSV."""
+    df = pandas.read_csv(csv_file, sep=';', index_col=0)
+    df = df[df['status'] == 'OK']
+    return pandas.DataFrame({
+        'source': 'results',
+        'query_id': df['query_id'].astype(str),
+        'stream_id': df['stream_id'].astype(str),
+        'metric': 'runtime',
+        'value': df['runtime'].astype(float)
+    }, columns=SAMPLE_COLUMNS)
+
+
+def load_htap_dir(results_dir):
+    """
+    The OLAP query runtimes of olap.csv and the OLTP throughput and latency per transaction
+    type of oltp.csv of an HTAP results directory. Each oltp.csv row holds the transactions
+    per second and the mean latency of the last interval, rows before any transaction
+    finished are skipped.
+    """
+    samples = []
+    olap_csv = os.path.join(results_dir, 'olap.csv')
+    if os.path.exists(olap_csv):
+        olap = pandas.read_csv(olap_csv, header=None, names=OLAP_COLUMNS, skipinitialspace=True)
+        olap = olap[olap['status'] == 'OK']
+        samples.append(pandas.DataFrame({
+            'source': 'olap',
+            'query_id': olap['query_id'].astype(str),
+            'stream_id': olap['stream_id'].astype(str),
+            'metric': 'runtime',
+            'value': olap['value'].astype(float)
+        }, columns=SAMPLE_COLUMNS))
+
+    oltp_csv = os.path.join(results_dir, 'oltp.csv')
+    if os.path.exists(oltp_csv):
+        oltp = pandas.read_csv(oltp_csv, header=None, names=OLTP_COLUMNS, skipinitialspace=True)
+        oltp = oltp[oltp['total'] > 0]
+        for metric in ('tps', 'latency'):
+            samples.append(pandas.DataFrame({
+                'source': 'oltp',
+                'query_id': oltp['query_id'].astype(str),
+                'stream_id': ALL_STREAMS,
+                'metric': metric,
+                'value': oltp[metric].astype(float)
+            }, columns=SAMPLE_COLUMNS))
+
+    if not samples:
+        raise ValueError(f'{results_dir} contains neither olap.csv nor oltp.csv')
+    return pandas.concat(samples, ignore_index=True)
+
+
+def load_run(path):
+    """The samples of a results CSV, or of an HTAP results directory."""
+    if os.path.isdir(path):
+        return load_htap_dir(path)
+    return load_results_csv(path)
+
+
+def mann_whitney_p(x, y):
+    """
+    Two-sided p-value of the Mann-Whitney U test. Exact for small samples without ties,
+    otherwise from the normal approximation with tie and continuity correction. With three
+    samples on each side the p-value is at least 0.1, so 0.05 needs four repetitions.
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    n1, n2 = len(x), len(y)
+    ranks = pandas.Series(np.concatenate([x, y])).rank(method='average').to_numpy()
+    u = ranks[:n1].sum() - n1 * (n1 + 1) / 2
+    has_ties = len(np.unique(ranks)) < len(ranks)
+
+    if not has_ties and n1 * n2 <= 400:
+        # counts[u] is the number of orderings of the values with the statistic u
+        counts = _u_counts(n1, n2)
+        u_extreme = min(u, n1 * n2 - u)
+        return min(1.0, 2 * sum(counts[:int(u_extreme) + 1]) / _binomial(n1 + n2, n1))
+
+    n = n1 + n2
+    _, tie_counts = np.unique(ranks, return_counts=True)
+    tie_term = ((tie_counts ** 3 - tie_counts).sum() / (n * (n - 1))) if n > 1 else 0.0
+    sigma = math.sqrt(n1 * n2 / 12 * ((n + 1) - tie_term))
+    if sigma == 0:
+        return 1.0
+    z = max(abs(u - n1 * n2 / 2) - 0.5, 0) / sigma
+    return math.erfc(z / math.sqrt(2))
+
+
+def _binomial(n, k):
+    # math.comb needs Python 3.8
+    return math.factorial(n) // (math.factorial(k) * math.factorial(n - k))
+
+
+def _u_counts(n1, n2):
+    """The number of orderings of n1 and n2 distinct values for each value of U."""
+    # table[m] holds the counts for m values of the first and n values of the second sample
+    table = [[1] + [0] * (n1 * n2) for _ in range(n1 + 1)]
+    for n in range(1, n2 + 1):
+        for m in range(1, n1 + 1):
+            previous = table[m]
+            table[m] = [
+                (table[m - 1][u - n] if u >= n else 0) + previous[u]
+                for u in range(n1 * n2 + 1)
+            ]
+    return table[n1]
+
+
+def bootstrap_ratio_ci(baseline, samples, confidence=0.95, num_resamples=1000, seed=0):
+    """Percentile bootstrap interval of the ratio of the medians of samples and baseline."""
+    rng = np.random.default_rng(seed)
+    baseline = np.asarray(baseline, dtype=float)
+    samples = np.asarray(samples, dtype=float)
+    baseline_medians = np.median(rng.choice(
+        baseline, size=(num_resamples, len(baseline)), replace=True), axis=1)
+    sample_medians = np.median(rng.choice(
+        samples, size=(num_resamples, len(samples)), replace=True), axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = sample_medians / baseline_medians
+    alpha = (1 - confidence) / 2
+    return np.nanquantile(ratios, alpha), np.nanquantile(ratios, 1 - alpha)
+
+
+def compare_samples(baseline, samples, metric, threshold=0.05, test='mann-whitney',
+                    alpha=0.05):
+    """
+    The comparison of the samples of one query against the baseline. change is the relative
+    change of the median, positive if it got worse whatever the direction of the metric. The
+    change has to exceed the threshold and, if both sides have at least two samples, has to
+    be significant to count as a regression or an improvement.
+    """
+    baseline_median = float(np.median(baseline))
+    median = float(np.median(samples))
+    if baseline_median == 0:
+        change = 0.0 if median == 0 else math.inf
+    else:
+        change = median / baseline_median - 1
+    if metric in HIGHER_IS_BETTER:
+        change = -change
+
+    p_value = ci_low = ci_high = None
+    significant = True
+    if len(baseline) >= 2 and len(samples) >= 2:
+        ci_low, ci_high = bootstrap_ratio_ci(baseline, samples)
+        if test == 'mann-whitney':
+            p_value = mann_whitney_p(baseline, samples)
+            significant = p_value < alpha
+        else:
+            significant = not ci_low <= 1 <= ci_high
+
+    verdict = 'unchanged'
+    if significant and change > threshold:
+        verdict = 'regression'
+    elif significant and change < -threshold:
+        verdict = 'improvement'
+
+    return {
+        'baseline': baseline_median,
+        'median': median,
+        'change': change,
+        'p_value': p_value,
+        'ci_low': ci_low,
+        'ci_high': ci_high,
+        'verdict': verdict
+    }
+
+
+def compare_runs(runs, threshold=0.05, test='mann-whitney', alpha=0.05, pool_streams=False):
+    """
+    Compares each run against the first one, aligned by source, query, stream and metric.
+    runs are (label, samples DataFrame) pairs. Returns the comparisons ranked from the worst
+    regression to the best improvement.
+    """
+    keys = ['source', 'query_id', 'stream_id', 'metric']
+    grouped = []
+    for label, samples in runs:
+        if pool_streams:
+            samples = samples.assign(stream_id=ALL_STREAMS)
+        grouped.append((label, {key: group['value'].to_numpy()
+                                for key, group in samples.groupby(keys)}))
+
+    _, baseline_groups = grouped[0]
+    comparisons = []
+    for label, groups in grouped[1:]:
+        for key in baseline_groups.keys() & groups.keys():
+            comparison = compare_samples(baseline_groups[key], groups[key], key[3], threshold,
+                                         test, alpha)
+            comparisons.append({'run': label, **dict(zip(keys, key)),
+                                'samples': len(groups[key]), **comparison})
+        for key in baseline_groups.keys() ^ groups.keys():
+            LOG.info(f'{label}: {"/".join(map(str, key))} is only in one of the runs, skipping')
+
+    comparisons = pandas.DataFrame(comparisons, columns=COMPARISON_COLUMNS)
+    # sorted instead of sort_values(key=...), which needs pandas 1.1
+    natsort_key = natsort_keygen()
+    order = sorted(comparisons.index, key=lambda idx: (
+        -comparisons.at[idx, 'change'],
+        *(natsort_key(comparisons.at[idx, column])
+          for column in ('run', 'source', 'query_id', 'stream_id'))))
+    return comparisons.loc[order].reset_index(drop=True)
+
+
+def main(argv=None):
+    args_to_parse = argparse.ArgumentParser(
+        prog='compare_results', formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description=('Compares the results of runs against the first one and exits with 1 if '
+                     'any query regressed, or with 2 if the results can not be loaded.'))
+    args_to_parse.add_argument('runs', nargs='+', help=(
+        'The baseline and the runs to compare against it, each a results CSV or an HTAP '
+        'results directory with olap.csv and oltp.csv.'))
+    args_to_parse.add_argument('--threshold', type=float, default=0.05, help=(
+        'Minimum relative change of the median to report a regression or improvement.'))
+    args_to_parse.add_argument('--test', choices=TESTS, default='mann-whitney', help=(
+        'Test whether a change is significant if both runs have at least two samples of a '
+        'query: the Mann-Whitney U test at --alpha, or whether the bootstrap confidence '
+        'interval of the ratio of the medians excludes 1.'))
+    args_to_parse.add_argument('--alpha', type=float, default=0.05, help=(
+        'Significance level of the Mann-Whitney U test.'))
+    args_to_parse.add_argument('--pool-streams', action='store_true', default=False, help=(
+        'Compare the samples of all streams of a query together instead of per stream.'))
+    args_to_parse.add_argument('--all', action='store_true', default=False, help=(
+        'Also print the unchanged queries.'))
+    args_to_parse.add_argument('--csv-file', default=None, help=(
+        'Also write all comparisons to this CSV file.'))
+    args = args_to_parse.parse_args(argv)
+
+    if len(args.runs) < 2:
+        args_to_parse.error('at least a baseline and one run to compare are required')
+
+    try:
+        runs = [(path, load_run(path)) for path in args.runs]
+    except (OSError, ValueError) as exc:
+        LOG.error(f'Cannot load the results: {exc}')
+        return 2
+
+    comparisons = compare_runs(runs, args.threshold, args.test, args.alpha, args.pool_streams)
+    if args.csv_file:
+        comparisons.to_csv(args.csv_file, sep=';', index=False)
+
+    shown = comparisons if args.all else comparisons[comparisons['verdict'] != 'unchanged']
+    # without enough samples there is no test
+    shown = shown.astype(object).where(shown.notna(), None)
+    print(tabulate(shown.to_dict('list'), headers='keys', tablefmt='github', floatfmt='.3f',
+                   missingval='-'))
+
+    verdicts = comparisons['verdict'].value_counts()
+    print(f'\n{verdicts.get("regression", 0)} regressions, '
+          f'{verdicts.get("improvement", 0)} improvements, '
+          f'{verdicts.get("unchanged", 0)} unchanged')
+    return 1 if verdicts.get('regression', 0) else 0
@@ -1,9 +1,12 @@
 
+import csv
+import hashlib
 import json
 import logging
+import os
 import time
 
-from collections import namedtuple
+from collections import defaultdict, namedtuple
 from enum import Enum
 from urllib.parse import urlparse
 
@@ -12,7 +15,21 @@ from .dbconn import DBConn
 import psycopg2
 
 LOG = logging.getLogger()
-Timing = namedtuple('Timing', ['start', 'stop', 'status'])
+Timing = namedtuple('Timing', [
+    'start', 'stop', 'status', 'connect', 'planning', 'execution', 'first_row', 'fetch'])
+# planning and execution are only known for prepared statements, first_row (the time until
+# the first row arrived) and fetch (the time to receive and convert all rows after that) only
+# for queries that completed
+Timing.__new__.__defaults__ = (None, None, None, None)
+# A query result that was written to a CSV file while it was fetched, or to os.devnull
+# if it was discarded
+SpilledResult = namedtuple('SpilledResult', ['path', 'num_rows', 'num_bytes'])
+
+
+class ConfigNotAppliedException(Exception):
+    def __init__(self, unapplied):
+        super().__init__(', '.join(f'{key} {reason}' for key, reason in unapplied.items()))
+        self.unapplied = unapplied
 
 
 class Status(Enum):
@@ -21,101 +38,392 @@ class Status(Enum):
     ERROR = 2
 
 
+class PlanCapture:
+    """
+    Decides whether a query plan is captured with an additional EXPLAIN after a query ran.
+
+    off:      never, the default, so there are no extra round trips
+    once:     once per distinct query text, later runs reuse the cached plan
+    sample:   every sample_interval-th run of a query text
+    deferred: not after the query, the caller explains all queries of a stream at its end
+    """
+    POLICIES = ('off', 'once', 'sample', 'deferred')
+
+    def __init__(self, policy='off', sample_interval=10):
+        assert policy in PlanCapture.POLICIES, f'Unknown plan capture policy {policy}'
+        self.policy = policy
+        self.sample_interval = max(sample_interval, 1)
+        self.plans = {}
+        self.executions = defaultdict(int)
+
+    @property
+    def is_deferred(self):
+        return self.policy == 'deferred'
+
+    @staticmethod
+    def sql_hash(sql):
+        return hashlib.sha1(sql.encode('utf-8')).hexdigest()
+
+    def lookup(self, sql):
+        """Returns whether the query needs to be explained and the cached plan, if any."""
+        if self.policy == 'once':
+            sql_hash = PlanCapture.sql_hash(sql)
+            if sql_hash in self.plans:
+                return False, self.plans[sql_hash]
+            return True, None
+
+        if self.policy == 'sample':
+            sql_hash = PlanCapture.sql_hash(sql)
+            num_executions = self.executions[sql_hash]
+            self.executions[sql_hash] += 1
+            return num_executions % self.sample_interval == 0, None
+
+        return False, None
+
+    def store(self, sql, plan):
+        if self.policy == 'once':
+            self.plans[PlanCapture.sql_hash(sql)] = plan
+
+
 class DB:
-    def __init__(self, dsn):
+    AUTO_EXPLAIN_CONFIG = {
+        'auto_explain.log_min_duration': 0,
+        'auto_explain.log_analyze': 'on',
+        'auto_explain.log_verbose': 'on',
+        'auto_explain.log_buffers': 'off',
+        'auto_explain.log_format': 'json',
+        'client_min_messages': 'LOG'
+    }
+
+    RESULT_MODES = ('fetch', 'stream', 'discard')
+    # how long to wait for a reload of the configuration to be visible to new connections
+    CONFIG_RELOAD_TIMEOUT = 5.0
+
+    def __init__(self, dsn, plan_capture=None, result_mode='fetch', fetch_batch_size=10000,
+                 prepared_statements=False):
         self.dsn = dsn
+        self.plan_capture = plan_capture or PlanCapture()
+        self.result_mode = result_mode
+        self.fetch_batch_size = fetch_batch_size
+        self.prepared_statements = prepared_statements
         dsn_url = urlparse(dsn)
         self.dsn_pg_db = f'{dsn_url.scheme}://{dsn_url.netloc}/postgres'
 
     def apply_config(self, config):
-        with DBConn(self.dsn_pg_db) as conn:
+        with DBConn(self.dsn_pg_db, pooled=True) as conn:
             for key, value in config.items():
                 conn.cursor.execute(f'ALTER SYSTEM SET {key} = $${value}$$')
 
             conn.cursor.execute('SELECT pg_reload_conf()')
 
+    def check_config(self, config):
+        """
+        Raises ConfigNotAppliedException unless new connections to the benchmark database see
+        the settings of an applied config, which they do not if a setting requires a restart
+        or is overridden, e.g. for the database or role.
+        """
+        deadline = time.time() + DB.CONFIG_RELOAD_TIMEOUT
+        while True:
+            with DBConn(self.dsn) as conn:
+                conn.cursor.execute(
+                    'SELECT name, setting, unit, current_setting(name), pending_restart '
+                    'FROM pg_settings WHERE name = ANY(%s)', ([key.lower() for key in config],))
+                unapplied = DB.get_unapplied_settings(config, conn.cursor.fetchall())
+            # the reload is asynchronous, the settings may not have been reloaded yet
+            if not unapplied or time.time() >= deadline:
+                break
+            time.sleep(0.1)
+
+        if unapplied:
+            raise ConfigNotAppliedException(unapplied)
+
+    @staticmethod
+    def get_unapplied_settings(config, rows):
+        """
+        The settings of config that did not take effect with the reason, given the name, setting,
+        unit, current_setting and pending_restart rows of pg_settings.
+        """
+        current = {row[0]: row[1:] for row in rows}
+        unapplied = {}
+        for key, value in config.items():
+            if key.lower() not in current:
+                unapplied[key] = 'is unknown'
+                continue
+
+            setting, unit, formatted, pending_restart = current[key.lower()]
+            if isinstance(value, bool):
+                value = 'on' if value else 'off'
+            if pending_restart:
+                unapplied[key] = 'requires a restart'
+            # the setting is in base units, e.g. 65536 with the unit kB for 64MB of work_mem
+            elif str(value).strip().lower() not in \
+                    {setting.lower(), f'{setting}{unit or ""}'.lower(), formatted.lower()}:
+                unapplied[key] = f'is {formatted} instead of {value}'
+        return unapplied
+
     def reset_config(self):
-        with DBConn(self.dsn_pg_db) as conn:
+        with DBConn(self.dsn_pg_db, pooled=True) as conn:
             conn.cursor.execute('ALTER SYSTEM RESET ALL')
             conn.cursor.execute('SELECT pg_reload_conf()')
 
-    def run_query(self, sql, timeout, auto_explain=False, use_server_side_cursors=False):
+    def session(self, timeout):
+        return DBSession(self.dsn, timeout)
+
+    def run_query(self, sql, timeout, auto_explain=False, use_server_side_cursors=False,
+                  session=None, result_file=None):
+        """
+        Runs a query and returns its Timing, result, and plan.
+
+        In the "stream" result mode the rows are written to result_file batch by batch while
+        they are fetched and a SpilledResult is returned instead of the rows. In the "discard"
+        result mode the rows are received with COPY TO STDOUT but only counted.
+
+        With prepared statements, each query is prepared once per session and executed by name
+        afterwards. The time to parse and plan it and the time to execute it are reported
+        separately.
+        """
+        if self.result_mode == 'discard':
+            result_file = os.devnull
+        elif self.result_mode != 'stream':
+            result_file = None
+
+        if session is not None:
+            DB.reset_session(session.conn, keep_prepared=self.prepared_statements)
+            prepared = session.prepared if self.prepared_statements else None
+            return self._run_query(session.conn, sql, auto_explain, use_server_side_cursors,
+                                   session.take_connect_time(), result_file, prepared)
+
+        connect_start = time.time()
+        with DBConn(self.dsn, statement_timeout=timeout) as conn:
+            connect_time = time.time() - connect_start
+            return self._run_query(conn, sql, auto_explain, use_server_side_cursors,
+                                   connect_time, result_file)
+
+    @staticmethod
+    def reset_session(conn, keep_prepared=False):
+        # a failed query can leave a server-side cursor transaction open
+        if not conn.conn.autocommit:
+            conn.conn.rollback()
+            conn.conn.autocommit = True
+
+        if keep_prepared:
+            # DISCARD ALL would also deallocate the prepared statements
+            conn.cursor.execute('CLOSE ALL; RESET ALL; DISCARD TEMP')
+        else:
+            conn.cursor.execute('DISCARD ALL')
+        del conn.conn.notices[:]
+        # named cursors can only be executed once
+        conn.server_side_cursor = conn.conn.cursor('server-side-cursor')
+
+    @staticmethod
+    def _fetch_all(conn, sql, use_server_side_cursors):
+        cursor = conn.cursor
+        if use_server_side_cursors:
+            # See https://github.com/psycopg/psycopg2/issues/941 for why
+            # starting a new connection is so weird.
+            conn.conn.rollback()
+            conn.conn.autocommit = False
+            cursor = conn.server_side_cursor
+
+        cursor.execute(sql)
+        if use_server_side_cursors:
+            # a named cursor only runs the query on the first fetch
+            rows = cursor.fetchmany(cursor.itersize)
+            first_row_at = time.time()
+            rows += cursor.fetchall()
+        else:
+            # a client-side cursor receives the complete result on execute, the rows are
+            # converted to Python objects on fetch
+            first_row_at = time.time()
+            rows = cursor.fetchall()
+
+        if use_server_side_cursors:
+            conn.conn.rollback()
+            conn.conn.autocommit = True
+
+        if rows is not None:
+            query_result_columns = [colname[0] for colname in cursor.description]
+            return (query_result_columns, rows), first_row_at
+        return None, first_row_at
+
+    @staticmethod
+    def _stream_to_csv(conn, sql, result_file, batch_size):
+        # fetching in batches requires a server-side cursor and thus a transaction
+        conn.conn.rollback()
+        conn.conn.autocommit = False
+        cursor = conn.conn.cursor('result-stream-cursor')
+        cursor.itersize = batch_size
+        cursor.execute(sql)
+
+        num_rows = 0
+        os.makedirs(os.path.dirname(result_file), exist_ok=True)
+        with open(result_file, 'w') as csv_file:
+            writer = csv.writer(csv_file)
+            rows = cursor.fetchmany(batch_size)
+            first_row_at = time.time()
+            # the description of a named cursor is only known after the first fetch
+            writer.writerow([colname[0] for colname in cursor.description or []])
+            while rows:
+                writer.writerows(rows)
+                num_rows += len(rows)
+                rows = cursor.fetchmany(batch_size)
+            num_bytes = csv_file.tell()
+
+        cursor.close()
+        conn.conn.rollback()
+        conn.conn.autocommit = True
+        return SpilledResult(path=result_file, num_rows=num_rows, num_bytes=num_bytes), \
+            first_row_at
+
+    @staticmethod
+    def get_planning_time(explain_output):
+        # EXPLAIN (SUMMARY) reports the planning time in milliseconds, before PG13 not for
+        # prepared statements
+        planning_time = explain_output[0].get('Planning Time')
+        return None if planning_time is None else planning_time / 1000
+
+    @staticmethod
+    def _prepare(conn, sql, prepared):
+        """
+        Prepares a query on the connection if it was not yet prepared and returns its planning
+        time according to EXPLAIN (SUMMARY). The EXPLAIN plans the statement and caches its plan,
+        so the timed executions do not include planning. A statement prepared before has a
+        planning time of 0.
+        """
+        sql_hash = PlanCapture.sql_hash(sql)
+        if sql_hash in prepared:
+            return 0.0
+
+        name = f'benchmark_query_{len(prepared) + 1}'
+        conn.cursor.execute(f'PREPARE {name} AS {DB.make_copy_query(sql)}')
+        prepared[sql_hash] = name
+        conn.cursor.execute(f'EXPLAIN (SUMMARY, FORMAT JSON) EXECUTE {name}')
+        return DB.get_planning_time(conn.cursor.fetchone()[0])
+
+    @staticmethod
+    def _execute_prepared(conn, sql, prepared):
+        """
+        Executes a query prepared with _prepare. Returns the result, the time the first row
+        arrived and the execution time.
+        """
+        execution_start = time.time()
+        conn.cursor.execute(f'EXECUTE {prepared[PlanCapture.sql_hash(sql)]}')
+        first_row_at = time.time()
+        rows = conn.cursor.fetchall()
+        execution_time = time.time() - execution_start
+
+        columns = [colname[0] for colname in conn.cursor.description]
+        return (columns, rows), first_row_at, execution_time
+
+    @staticmethod
+    def make_copy_query(sql):
+        # the query may end with a comment, so the closing parenthesis has to go on a new line
+        return f'\n{sql.strip().rstrip(";")}\n'
+
+    @staticmethod
+    def make_copy_sql(sql):
+        return f'COPY ({DB.make_copy_query(sql)}) TO STDOUT'
+
+    @staticmethod
+    def _copy_to_null(conn, sql):
+        sink = NullSink()
+        conn.cursor.copy_expert(DB.make_copy_sql(sql), sink)
+        return SpilledResult(path=os.devnull, num_rows=sink.num_rows, num_bytes=sink.num_bytes), \
+            sink.first_write_at or time.time()
+
+    def _run_query(self, conn, sql, auto_explain, use_server_side_cursors, connect_time,
+                   result_file=None, prepared=None):
         status = Status.ERROR
         query_result = None
         plan = None
+        planning_time, execution_time = None, None
+        first_row_time, fetch_time = None, None
+        start = None
+        try:
+            if prepared is not None:
+                # untimed, only the execution counts towards the runtime
+                planning_time = DB._prepare(conn, sql, prepared)
+
+            start = time.time()
+
+            if auto_explain:
+                DB.auto_explain_on(conn)
+
+            query_start = time.time()
+            if prepared is not None:
+                query_result, first_row_at, execution_time = \
+                    DB._execute_prepared(conn, sql, prepared)
+            elif result_file == os.devnull:
+                query_result, first_row_at = DB._copy_to_null(conn, sql)
+            elif result_file is not None:
+                query_result, first_row_at = DB._stream_to_csv(
+                    conn, sql, result_file, self.fetch_batch_size)
+            else:
+                query_result, first_row_at = DB._fetch_all(conn, sql, use_server_side_cursors)
+            first_row_time = first_row_at - query_start
+            fetch_time = time.time() - first_row_at
+            status = Status.OK
+            # each notice can take multiple lines; we just want all lines separately
+            # so we can filter easily as we don't want the lines that have "LOG:" in them
+            # but only want the real json output
+            notice_lines = '\n'.join(conn.conn.notices).split('\n')
+            plan = '\n'.join(filter(lambda line: not line.startswith("LOG:"), notice_lines))
+            # make it proper json
+            if plan.strip() != '':
+                plan = f'[{plan}]'
+
+        except psycopg2.extensions.QueryCanceledError:
+            status = Status.TIMEOUT
+            query_result = None
+
+        except (psycopg2.InternalError, psycopg2.Error, UnicodeDecodeError):
+            LOG.exception('Ignoring psycopg2 Error')
+            query_result = None
+
+        finally:
+            stop = time.time()
+            # the query did not start if preparing it failed
+            start = start or stop
+            if plan == None or plan.strip() == '':
+                plan = self.capture_plan(conn.conn, sql)
+
+        return Timing(start=start, stop=stop, status=status, connect=connect_time,
+                      planning=planning_time, execution=execution_time,
+                      first_row=first_row_time, fetch=fetch_time), query_result, plan
+
+    def capture_plan(self, connection, sql):
+        needs_explain, plan = self.plan_capture.lookup(sql)
+        if needs_explain:
+            plan = DB.get_explain_output(connection, sql)
+            self.plan_capture.store(sql, plan)
+        return plan
+
+    def explain_queries(self, sqls, timeout):
+        plans = {}
         with DBConn(self.dsn, statement_timeout=timeout) as conn:
-            try:
-                start = time.time()
-
-                if auto_explain:
-                    DB.auto_explain_on(conn)
-
-                cursor = conn.cursor
-                if use_server_side_cursors:
-                    # See https://github.com/psycopg/psycopg2/issues/941 for why
-                    # starting a new connection is so weird.
-                    conn.conn.rollback()
-                    conn.conn.autocommit = False
-                    cursor = conn.server_side_cursor
-
-                cursor.execute(sql)
-                rows = cursor.fetchall()
-
-                if use_server_side_cursors:
-                    conn.conn.rollback()
-                    conn.conn.autocommit = True
-
-                if rows is not None:
-                    query_result_columns = [colname[0] for colname in cursor.description]
-                    query_result = query_result_columns, rows
-                else:
-                    query_result = None
-                status = Status.OK
-                # each notice can take multiple lines; we just want all lines separately
-                # so we can filter easily as we don't want the lines that have "LOG:" in them
-                # but only want the real json output
-                notice_lines = '\n'.join(conn.conn.notices).split('\n')
-                plan = '\n'.join(filter(lambda line: not line.startswith("LOG:"), notice_lines))
-                # make it proper json
-                if plan.strip() != '':
-                    plan = f'[{plan}]'
-
-            except psycopg2.extensions.QueryCanceledError:
-                status = Status.TIMEOUT
-                query_result = None
-
-            except (psycopg2.InternalError, psycopg2.Error, UnicodeDecodeError):
-                LOG.exception('Ignoring psycopg2 Error')
-                query_result = None
-
-            finally:
-                stop = time.time()
-                if plan == None or plan.strip() == '':
-                    plan = DB.get_explain_output(conn.conn, sql)
-
-            return Timing(start=start, stop=stop, status=status), query_result, plan
+            for sql in sqls:
+                sql_hash = PlanCapture.sql_hash(sql)
+                if sql_hash not in plans:
+                    plans[sql_hash] = DB.get_explain_output(conn.conn, sql)
+
+        return [plans[PlanCapture.sql_hash(sql)] for sql in sqls]
 
     @staticmethod
     def auto_explain_on(conn):
-        auto_explain_config = {
-            'auto_explain.log_min_duration': 0,
-            'auto_explain.log_analyze': 'on',
-            'auto_explain.log_verbose': 'on',
-            'auto_explain.log_buffers': 'off',
-            'auto_explain.log_format': 'json',
-            'client_min_messages': 'LOG'
-        }
-
         conn.cursor.execute("LOAD 'auto_explain'")
 
-        for key, value in auto_explain_config.items():
+        for key, value in DB.AUTO_EXPLAIN_CONFIG.items():
             conn.cursor.execute(f'SET {key} = $${value}$$')
 
+    @staticmethod
+    def make_explain_sql(sql):
+        return sql.replace('-- EXPLAIN (FORMAT JSON)', 'EXPLAIN (FORMAT JSON)')
+
     @staticmethod
     def get_explain_output(connection, sql):
         try:
             with connection.cursor() as explain_plan_cursor:
-                explain_plan_cursor.execute(sql.replace('-- EXPLAIN (FORMAT JSON)', 'EXPLAIN (FORMAT JSON)'))
+                explain_plan_cursor.execute(DB.make_explain_sql(sql))
                 return json.dumps(explain_plan_cursor.fetchone()[0], indent=4)
 
         except psycopg2.Error as e:
@@ -127,3 +435,59 @@ class DB:
 
         except TypeError as e:
             return f'{{"Explain Output failed": "{str(e)}"}}'
+
+
+class NullSink:
+    """A file-like object that counts the rows and bytes of COPY TO output and drops them."""
+    def __init__(self):
+        self.num_rows = 0
+        self.num_bytes = 0
+        self.first_write_at = None
+
+    def write(self, data):
+        if self.first_write_at is None:
+            self.first_write_at = time.time()
+        self.num_bytes += len(data)
+        self.num_rows += data.count(b'\n' if isinstance(data, bytes) else '\n')
+
+
+def estimate_wire_bytes(query_result):
+    """
+    Approximate size of a fetched result in the text protocol: the column values as text,
+    a 4 byte length per value and a 7 byte header per row.
+    """
+    if query_result is None:
+        return None
+
+    num_bytes = 0
+    for row in query_result[1]:
+        num_bytes += 7 + sum(4 + (len(str(value)) if value is not None else 0) for value in row)
+    return num_bytes
+
+
+class DBSession:
+    """
+    A connection that is kept open for all queries of a stream.
+
+    The time it took to establish the connection is handed out once, to the first query run
+    in the session, so that it is reported separately from the query runtimes.
+    """
+    def __init__(self, dsn, timeout):
+        self.conn = DBConn(dsn, statement_timeout=timeout)
+        self.connect_time = 0
+        # names of the statements prepared on this connection, by query hash
+        self.prepared = {}
+
+    def __enter__(self):
+        connect_start = time.time()
+        self.conn.__enter__()
+        self.connect_time = time.time() - connect_start
+        return self
+
+    def __exit__(self, *args):
+        self.conn.__exit__(*args)
+
+    def take_connect_time(self):
+        connect_time = self.connect_time
+        self.connect_time = 0
+        return connect_time
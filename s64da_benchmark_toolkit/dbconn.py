@@ -1,15 +1,234 @@
 
 import logging
+import os
+import random
+import threading
 import time
 
-import psycopg2
-from psycopg2.extras import DictCursor
+from .drivers import get_driver
 
 LOG = logging.getLogger()
 
 
+def connect(dsn, statement_timeout=0, num_retries=120, retry_wait=0.1, max_retry_wait=2,
+            driver='psycopg2'):
+    """
+    Connects to the database, retrying up to num_retries times. The waits between the attempts
+    grow exponentially from retry_wait up to max_retry_wait and are jittered, so that many
+    workers that lost the server at the same time do not reconnect in lockstep. Returns the
+    autocommit connection, or None if all attempts failed, and the number of failed attempts.
+    """
+    driver = get_driver(driver)
+    options = f'-c statement_timeout={statement_timeout}'
+    for trial in range(num_retries):
+        try:
+            return driver.connect(dsn, options), trial
+
+        except driver.Error as exc:
+            LOG.info(f'Cannot connect to DB. Retrying. Error: {exc}')
+            time.sleep(random.uniform(0, min(max_retry_wait, retry_wait * 2 ** trial)))
+
+    return None, num_retries
+
+
+class ConnectionPool:
+    """
+    Connections to one DSN that are reused within a process.
+
+    At most max_size connections are open at a time, acquire() waits for a connection to be
+    released once all of them are in use. Released connections are reset with DISCARD ALL and
+    closed if that fails. A connection that was idle for longer than health_check_interval
+    seconds is checked with a trivial query before it is handed out again.
+    """
+    def __init__(self, dsn, statement_timeout=0, max_size=10, num_retries=120, retry_wait=0.1,
+                 max_retry_wait=2, health_check_interval=30, driver='psycopg2'):
+        self.dsn = dsn
+        self.statement_timeout = statement_timeout
+        self.driver = get_driver(driver)
+        self.max_size = max_size
+        self.num_retries = num_retries
+        self.retry_wait = retry_wait
+        self.max_retry_wait = max_retry_wait
+        self.health_check_interval = health_check_interval
+        self.condition = threading.Condition()
+        # (connection, time it was released)
+        self.idle = []
+        self.num_open = 0
+        self.closed = False
+
+        self.num_connects = 0
+        self.num_failed_attempts = 0
+        self.num_reuses = 0
+        self.num_discarded = 0
+        self.connect_time_total = 0.0
+        self.connect_time_max = 0.0
+
+    def acquire(self, timeout=None):
+        """A healthy connection, or None if none could be established."""
+        deadline = time.time() + timeout if timeout is not None else None
+        while True:
+            conn = None
+            with self.condition:
+                while True:
+                    if self.idle:
+                        conn, released_at = self.idle.pop()
+                        break
+
+                    if self.num_open < self.max_size:
+                        # reserve the slot, the connection is opened outside of the lock
+                        self.num_open += 1
+                        break
+
+                    remaining = deadline - time.time() if deadline is not None else None
+                    if remaining is not None and remaining <= 0:
+                        LOG.warning(f'All {self.max_size} connections to {self.dsn} are in use.')
+                        return None
+                    self.condition.wait(remaining)
+
+            if conn is None:
+                return self.open()
+
+            # the connection is taken out of the pool, so it is checked outside of the lock and
+            # a slow server does not hold up the other threads
+            healthy = self.is_healthy(conn, time.time() - released_at)
+            with self.condition:
+                if healthy:
+                    self.num_reuses += 1
+                    return conn
+                self.discard(conn)
+                self.condition.notify()
+
+    def open(self):
+        connect_start = time.time()
+        conn, num_failed = connect(self.dsn, self.statement_timeout, self.num_retries,
+                                   self.retry_wait, self.max_retry_wait, self.driver.name)
+        connect_time = time.time() - connect_start
+        with self.condition:
+            self.num_failed_attempts += num_failed
+            if conn is None:
+                self.num_open -= 1
+                self.condition.notify()
+                return None
+
+            self.num_connects += 1
+            self.connect_time_total += connect_time
+            self.connect_time_max = max(self.connect_time_max, connect_time)
+        return conn
+
+    def release(self, conn):
+        healthy = not self.closed and self.reset(conn)
+        with self.condition:
+            if healthy:
+                self.idle.append((conn, time.time()))
+            else:
+                self.discard(conn)
+            self.condition.notify()
+
+    def discard(self, conn):
+        self.num_open -= 1
+        self.num_discarded += 1
+        if not conn.closed:
+            conn.close()
+
+    def is_healthy(self, conn, idle_time):
+        if conn.closed:
+            return False
+        if idle_time < self.health_check_interval:
+            return True
+
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            return True
+        except self.driver.Error as exc:
+            LOG.info(f'Dropping a broken connection to {self.dsn}: {exc}')
+            return False
+
+    def reset(self, conn):
+        if conn.closed:
+            return False
+
+        try:
+            # e.g. a server-side cursor transaction
+            if not conn.autocommit:
+                conn.rollback()
+                conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute('DISCARD ALL')
+            self.driver.clear_notices(conn)
+            return True
+        except self.driver.Error as exc:
+            LOG.info(f'Cannot reset a connection, closing it. Error: {exc}')
+            return False
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            while self.idle:
+                conn, _ = self.idle.pop()
+                self.discard(conn)
+
+    def stats(self):
+        with self.condition:
+            return {
+                'dsn': self.dsn,
+                'open': self.num_open,
+                'idle': len(self.idle),
+                'connects': self.num_connects,
+                'failed_attempts': self.num_failed_attempts,
+                'reuses': self.num_reuses,
+                'discarded': self.num_discarded,
+                'connect_time_mean': (self.connect_time_total / self.num_connects
+                                      if self.num_connects else None),
+                'connect_time_max': self.connect_time_max
+            }
+
+
+# the pools of this process by (pid, dsn, statement timeout, driver), the pid keeps forked
+# workers away from the connections they inherited
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_pool(dsn, statement_timeout=0, driver='psycopg2'):
+    key = (os.getpid(), dsn, statement_timeout, driver)
+    with _POOLS_LOCK:
+        if key not in _POOLS:
+            _POOLS[key] = ConnectionPool(dsn, statement_timeout, driver=driver)
+        return _POOLS[key]
+
+
+def get_pools():
+    pid = os.getpid()
+    with _POOLS_LOCK:
+        return [pool for key, pool in _POOLS.items() if key[0] == pid]
+
+
+def close_pools():
+    pid = os.getpid()
+    with _POOLS_LOCK:
+        for key in [key for key in _POOLS if key[0] == pid]:
+            _POOLS.pop(key).close()
+
+
+def log_pool_stats():
+    for pool in get_pools():
+        stats = pool.stats()
+        connect_time_mean = stats['connect_time_mean'] or 0.0
+        LOG.info(f'Connection pool {stats["dsn"]}: {stats["connects"]} connects '
+                 f'(mean {connect_time_mean:.3f}s, max {stats["connect_time_max"]:.3f}s), '
+                 f'{stats["failed_attempts"]} failed attempts, {stats["reuses"]} reuses, '
+                 f'{stats["discarded"]} discarded')
+
+
 class DBConn:
-    def __init__(self, dsn, statement_timeout=0, num_retries=120, retry_wait=1, use_dict_cursor = False):
+    """
+    A connection with a cursor and a server-side cursor. With pooled=True the connection is
+    taken from the pool of this process for the DSN and returned to it on exit instead of
+    being closed. The driver is one of drivers.DRIVERS, see there for what they support.
+    """
+    def __init__(self, dsn, statement_timeout=0, num_retries=120, retry_wait=0.1, use_dict_cursor = False,
+                 max_retry_wait=2, pooled=False, driver='psycopg2'):
         self.dsn = dsn
         self.conn = None
         self.cursor = None
@@ -17,23 +236,23 @@ class DBConn:
         self.statement_timeout = statement_timeout
         self.num_retries = num_retries
         self.retry_wait = retry_wait
+        self.max_retry_wait = max_retry_wait
         self.use_dict_cursor = use_dict_cursor
+        self.pooled = pooled
+        self.pool = None
+        self.driver = get_driver(driver)
 
     def __enter__(self):
-        options = f'-c statement_timeout={self.statement_timeout}'
-        trial = 0
-        while trial < self.num_retries:
-            try:
-                self.conn = psycopg2.connect(self.dsn, options=options)
-                self.conn.autocommit = True
-                self.cursor = self.conn.cursor(cursor_factory = DictCursor if self.use_dict_cursor else None)
-                self.server_side_cursor = self.conn.cursor('server-side-cursor')
-                break
-
-            except psycopg2.Error as exc:
-                LOG.info(f'Cannot connect to DB. Retrying. Error: {exc}')
-                trial += 1
-                time.sleep(self.retry_wait)
+        if self.pooled:
+            self.pool = get_pool(self.dsn, self.statement_timeout, self.driver.name)
+            self.conn = self.pool.acquire()
+        else:
+            self.conn, _ = connect(self.dsn, self.statement_timeout, self.num_retries,
+                                   self.retry_wait, self.max_retry_wait, self.driver.name)
+
+        if self.conn:
+            self.cursor = self.driver.cursor(self.conn, self.use_dict_cursor)
+            self.server_side_cursor = self.driver.server_side_cursor(self.conn, 'server-side-cursor')
 
         assert self.conn, 'There is no connection.'
         assert self.cursor, 'There is no cursor.'
@@ -43,4 +262,8 @@ class DBConn:
 
     def __exit__(self, *args):
         self.cursor.close()
-        self.conn.close()
+        if self.pool:
+            self.pool.release(self.conn)
+            self.pool = None
+        else:
+            self.conn.close()
@@ -0,0 +1,249 @@
+import logging
+import os
+import threading
+import traceback
+
+from multiprocessing import Manager
+from multiprocessing.connection import Client, Listener
+from queue import Empty
+
+LOG = logging.getLogger()
+
+# the agents execute the jobs they receive as is, so there is no default secret
+AUTHKEY_ENV = 'S64DA_AGENT_AUTHKEY'
+
+# how long the agent waits for new items before checking for messages of the coordinator
+POLL_INTERVAL = 0.1
+CLOSE_TIMEOUT = 10
+
+
+def parse_address(address):
+    """Parses "host:port" into the (host, port) tuple of multiprocessing.connection."""
+    host, _, port = address.rpartition(':')
+    if not host or not port.isdigit():
+        raise ValueError(f'Invalid agent address {address}, expected host:port')
+    return host, int(port)
+
+
+def read_authkey(authkey=None, authkey_file=None):
+    """
+    The shared secret of the agents and the coordinator: the given one, else the first line of
+    authkey_file, else the S64DA_AGENT_AUTHKEY environment variable.
+    """
+    if not authkey and authkey_file:
+        with open(authkey_file, 'r') as key_file:
+            authkey = key_file.readline().strip()
+    authkey = authkey or os.environ.get(AUTHKEY_ENV)
+    if not authkey:
+        raise ValueError(f'An agent authkey is required, pass it, a file with it, or set '
+                         f'{AUTHKEY_ENV}.')
+    return authkey
+
+
+def split_range(first, count, num_parts):
+    """
+    Splits the count ids starting at first into num_parts contiguous (first, count) ranges
+    whose sizes differ by at most one. Parts may be empty if there are fewer ids than parts.
+    """
+    parts = []
+    size, remainder = divmod(count, num_parts)
+    for idx in range(num_parts):
+        part_count = size + (1 if idx < remainder else 0)
+        parts.append((first, part_count))
+        first += part_count
+    return parts
+
+
+def add_agent_arguments(parser):
+    parser.add_argument('--agents', nargs='+', type=parse_address, default=None,
+        metavar='HOST:PORT', help=('Distribute the workload over agents started with '
+        '`run_agent` on these addresses instead of running it on this machine. Their metrics '
+        'are gathered into one report here.'
+    ))
+
+    parser.add_argument('--agent-authkey', default=None, help=(
+        'Shared secret to authenticate with the agents, must match the one they were started '
+        f'with. Required with --agents, unless given by --agent-authkey-file or {AUTHKEY_ENV}.'
+    ))
+
+    parser.add_argument('--agent-authkey-file', default=None, help=(
+        'File whose first line is the shared secret to authenticate with the agents.'
+    ))
+
+
+class AgentJob:
+    """
+    The part of a benchmark run handed to an agent. The coordinator pickles the job and the
+    agent calls run(), which puts the metrics into the given queue and should return when
+    the run is over or stop is set.
+
+    Jobs that share a counter across agents return its local increase since the last call
+    from take_sync_delta() and receive the sum over all agents in apply_sync().
+    """
+    def run(self, queue, stop):
+        raise NotImplementedError
+
+    def take_sync_delta(self):
+        return None
+
+    def apply_sync(self, value):
+        pass
+
+
+class Agent:
+    """
+    Runs the jobs of a coordinator, one connection and job at a time, and forwards the items
+    the job puts into its queue to the coordinator.
+    """
+    def __init__(self, address, authkey):
+        self.listener = Listener(address, authkey=authkey.encode())
+
+    @property
+    def address(self):
+        return self.listener.address
+
+    def serve(self, num_jobs=None):
+        LOG.info(f'agent listening on {self.address[0]}:{self.address[1]}.')
+        served = 0
+        try:
+            while num_jobs is None or served < num_jobs:
+                with self.listener.accept() as conn:
+                    self.handle(conn)
+                served += 1
+        finally:
+            self.listener.close()
+
+    @staticmethod
+    def _run_job(job, queue, stop, errors):
+        try:
+            job.run(queue, stop)
+        except Exception:
+            LOG.exception('Agent job failed')
+            errors.append(traceback.format_exc())
+
+    def handle(self, conn):
+        job = conn.recv()
+        LOG.info(f'running {type(job).__name__} for {self.listener.last_accepted}.')
+        stop = threading.Event()
+        errors = []
+        with Manager() as manager:
+            queue = manager.Queue()
+            runner = threading.Thread(target=Agent._run_job, args=(job, queue, stop, errors))
+            runner.start()
+            try:
+                Agent._forward(conn, job, queue, runner, stop)
+            except (EOFError, OSError):
+                LOG.error('Lost the connection to the coordinator, stopping the job')
+                stop.set()
+                runner.join()
+                return
+            runner.join()
+
+        conn.send(('done', errors[0] if errors else None))
+        # wait for the coordinator to hang up, closing with unread messages of the coordinator
+        # resets the connection and "done" may get lost
+        try:
+            while conn.poll(CLOSE_TIMEOUT):
+                conn.recv()
+        except (EOFError, OSError):
+            pass
+
+    @staticmethod
+    def _forward(conn, job, queue, runner, stop):
+        # only one sync is in flight, so the reply always includes all deltas sent before
+        sync_pending = False
+        while runner.is_alive() or not queue.empty():
+            while conn.poll():
+                message, value = conn.recv()
+                if message == 'stop':
+                    stop.set()
+                elif message == 'sync':
+                    job.apply_sync(value)
+                    sync_pending = False
+
+            if not sync_pending:
+                delta = job.take_sync_delta()
+                if delta is not None:
+                    conn.send(('sync', delta))
+                    sync_pending = True
+
+            try:
+                conn.send(('item', queue.get(timeout=POLL_INTERVAL)))
+            except Empty:
+                pass
+
+
+class Coordinator:
+    """
+    Hands one job to each agent and puts the items the agents send back into a local queue,
+    so that the usual reporting can consume them. With a shared_value, the sync deltas of
+    all agents are summed up in it and the sum is sent back to the agents.
+    """
+    def __init__(self, agents, authkey, shared_value=None):
+        self.agents = agents
+        self.authkey = authkey.encode()
+        self.shared_value = shared_value
+        self.connections = []
+        self.receivers = []
+        self.send_lock = threading.Lock()
+        self.errors = []
+
+    def start(self, assignments, queue):
+        """Sends the jobs, assignments are (agent address, job) pairs."""
+        for address, job in assignments:
+            LOG.info(f'handing {type(job).__name__} to agent {address[0]}:{address[1]}.')
+            conn = Client(address, authkey=self.authkey)
+            conn.send(job)
+            self.connections.append(conn)
+            receiver = threading.Thread(target=self._receive, args=(address, conn, queue))
+            receiver.start()
+            self.receivers.append(receiver)
+
+    def _receive(self, address, conn, queue):
+        try:
+            while True:
+                message, value = conn.recv()
+                if message == 'item':
+                    queue.put(value)
+                elif message == 'sync':
+                    with self.shared_value.get_lock():
+                        self.shared_value.value += value
+                        total = self.shared_value.value
+                    try:
+                        with self.send_lock:
+                            conn.send(('sync', total))
+                    except OSError:
+                        # the agent finished in the meantime, its "done" is still to be read
+                        pass
+                elif message == 'done':
+                    if value:
+                        self.errors.append(f'agent {address[0]}:{address[1]} failed:\n{value}')
+                    return
+
+        except (EOFError, OSError):
+            self.errors.append(f'lost the connection to agent {address[0]}:{address[1]}')
+
+        finally:
+            conn.close()
+
+    def stop(self):
+        for conn in self.connections:
+            try:
+                with self.send_lock:
+                    conn.send(('stop', None))
+            except OSError:
+                pass
+
+    def join(self):
+        for receiver in self.receivers:
+            receiver.join()
+
+    def check(self):
+        if self.errors:
+            raise RuntimeError('\n'.join(self.errors))
+
+    def run(self, assignments, queue):
+        """Runs jobs that finish by themselves and waits for all of them."""
+        self.start(assignments, queue)
+        self.join()
+        self.check()
@@ -0,0 +1,157 @@
+from contextlib import contextmanager
+from decimal import Decimal
+
+import psycopg2
+from psycopg2.extras import DictCursor
+
+try:
+    import psycopg
+    from psycopg.rows import dict_row
+except ImportError:
+    psycopg = None
+
+
+class TextCopyReader:
+    """
+    File-like object for COPY in text format that formats the rows as they are read, None is
+    written as NULL.
+    """
+    ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.remainder = ''
+
+    @staticmethod
+    def format_row(row):
+        return '\t'.join('\\N' if value is None else str(value).translate(TextCopyReader.ESCAPES)
+                         for value in row) + '\n'
+
+    def read(self, size=-1):
+        chunks, length = [self.remainder], len(self.remainder)
+        while size is None or size < 0 or length < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            line = TextCopyReader.format_row(row)
+            chunks.append(line)
+            length += len(line)
+
+        data = ''.join(chunks)
+        if size is None or size < 0:
+            self.remainder = ''
+            return data
+        self.remainder = data[size:]
+        return data[:size]
+
+
+class Psycopg2Driver:
+    """The default driver, every statement is a round trip and COPY uses the text format."""
+    name = 'psycopg2'
+    Error = psycopg2.Error
+    supports_pipeline = False
+    supports_binary_copy = False
+
+    @staticmethod
+    def connect(dsn, options):
+        conn = psycopg2.connect(dsn, options=options)
+        conn.autocommit = True
+        return conn
+
+    @staticmethod
+    def cursor(conn, dict_rows=False):
+        return conn.cursor(cursor_factory=DictCursor if dict_rows else None)
+
+    @staticmethod
+    def server_side_cursor(conn, name):
+        return conn.cursor(name)
+
+    @staticmethod
+    def clear_notices(conn):
+        del conn.notices[:]
+
+    @staticmethod
+    @contextmanager
+    def pipeline(conn):
+        yield
+
+    @staticmethod
+    def copy_rows(conn, table, rows, columns=None):
+        """COPYs rows of Python values in text format, into the given columns if any."""
+        column_list = f' ({", ".join(columns)})' if columns else ''
+        with conn.cursor() as cursor:
+            cursor.copy_expert(f'COPY {table}{column_list} FROM STDIN', TextCopyReader(rows))
+
+
+class Psycopg3Driver:
+    """
+    psycopg 3, which can send statements in libpq pipeline mode without waiting for each
+    result, and COPY rows in binary format. Notices are not collected.
+    """
+    name = 'psycopg'
+    Error = psycopg.Error if psycopg else None
+    supports_pipeline = True
+    supports_binary_copy = True
+
+    @staticmethod
+    def connect(dsn, options):
+        return psycopg.connect(dsn, options=options, autocommit=True)
+
+    @staticmethod
+    def cursor(conn, dict_rows=False):
+        return conn.cursor(row_factory=dict_row) if dict_rows else conn.cursor()
+
+    @staticmethod
+    def server_side_cursor(conn, name):
+        return conn.cursor(name=name)
+
+    @staticmethod
+    def clear_notices(conn):
+        pass
+
+    @staticmethod
+    def pipeline(conn):
+        return conn.pipeline()
+
+    @staticmethod
+    def get_column_types(conn, table, columns=None):
+        with conn.cursor() as cursor:
+            cursor.execute(
+                'SELECT a.attname, t.typname FROM pg_attribute a '
+                'JOIN pg_type t ON t.oid = a.atttypid '
+                'WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped '
+                'ORDER BY a.attnum', (table,))
+            # char(n) has the binary representation of text
+            types = {name: 'text' if typname == 'bpchar' else typname
+                     for name, typname in cursor.fetchall()}
+        return [types[column] for column in columns] if columns else list(types.values())
+
+    @staticmethod
+    def copy_rows(conn, table, rows, columns=None):
+        """COPYs rows of Python values in binary format, into the given columns if any."""
+        types = Psycopg3Driver.get_column_types(conn, table, columns)
+        # the binary numeric dumper only takes Decimals
+        numeric_columns = [idx for idx, typname in enumerate(types) if typname == 'numeric']
+        column_list = f' ({", ".join(columns)})' if columns else ''
+        with conn.cursor() as cursor:
+            with cursor.copy(f'COPY {table}{column_list} FROM STDIN (FORMAT BINARY)') as copy:
+                copy.set_types(types)
+                for row in rows:
+                    if numeric_columns:
+                        row = list(row)
+                        for idx in numeric_columns:
+                            if row[idx] is not None:
+                                row[idx] = Decimal(str(row[idx]))
+                    copy.write_row(row)
+
+
+DRIVERS = {driver.name: driver for driver in (Psycopg2Driver, Psycopg3Driver)}
+
+
+def get_driver(name):
+    if name not in DRIVERS:
+        raise ValueError(f'Unknown driver {name}, available: {", ".join(DRIVERS)}')
+    if name == Psycopg3Driver.name and psycopg is None:
+        raise ValueError('The psycopg driver requires psycopg 3, install it with '
+                         '"pip install psycopg[binary]"')
+    return DRIVERS[name]
@@ -0,0 +1,147 @@
+import glob
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import pandas
+
+from natsort import index_natsorted, order_by_index
+from tabulate import tabulate
+
+LOG = logging.getLogger()
+
+SUMMARY_COLUMNS = ('query_id', 'running', 'ok', 'failed', 'mean', 'median', 'p95', 'min', 'max')
+
+
+class EventLog:
+    """
+    Live log of the query starts and finishes of a run, one JSON line per event, so that a run
+    can be followed while it is going, e.g. with ./tail_events. Each line is written with a
+    single unbuffered append, which several processes can do on the same file and which is not
+    lost if the benchmark crashes. Unlike the journal, the lines are not synced to disk.
+    """
+    FILE_NAME = 'events.jsonl'
+
+    def __init__(self, run_dir, source='streams'):
+        self.run_dir = run_dir
+        self.path = os.path.join(run_dir, EventLog.FILE_NAME)
+        self.source = source
+
+    def append(self, event, **fields):
+        line = json.dumps({'time': time.time(), 'event': event, 'source': self.source, **fields},
+                          default=str) + '\n'
+        os.makedirs(self.run_dir, exist_ok=True)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode('utf-8'))
+        finally:
+            os.close(fd)
+
+    def query_started(self, stream_id, query_id, iteration, **fields):
+        self.append('start', stream_id=stream_id, query_id=query_id, iteration=iteration,
+                    **fields)
+
+    def query_finished(self, stream_id, query_id, iteration, status, runtime, **fields):
+        self.append('finish', stream_id=stream_id, query_id=query_id, iteration=iteration,
+                    status=status, runtime=runtime, **fields)
+
+
+class EventReader:
+    """Reads the complete lines that were appended to an event log since the last read."""
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+
+    def read(self):
+        if not os.path.exists(self.path):
+            return []
+
+        with open(self.path, 'rb') as events_file:
+            events_file.seek(self.offset)
+            data = events_file.read()
+
+        # a line without its newline is still being written
+        complete = data[:data.rfind(b'\n') + 1]
+        self.offset += len(complete)
+        events = []
+        for line in complete.decode('utf-8').splitlines():
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                LOG.warning(f'skipping a malformed line of {self.path}')
+        return events
+
+
+class EventSummary:
+    """Running per-query statistics over the finished queries of an event log."""
+    def __init__(self):
+        # (source, stream id, query id, iteration) of the queries that started but did not finish
+        self.running = set()
+        self.runtimes = {}
+        self.failed = {}
+
+    def update(self, events):
+        for event in events:
+            if event.get('warmup'):
+                continue
+
+            key = (event['source'], event['stream_id'], event['query_id'], event['iteration'])
+            query_id = event['query_id']
+            if event['event'] == 'start':
+                self.running.add(key)
+            elif event['event'] == 'finish':
+                self.running.discard(key)
+                if event['status'] == 'OK':
+                    self.runtimes.setdefault(query_id, []).append(event['runtime'])
+                else:
+                    self.failed[query_id] = self.failed.get(query_id, 0) + 1
+
+    def to_dataframe(self):
+        running = {}
+        for _, _, query_id, _ in self.running:
+            running[query_id] = running.get(query_id, 0) + 1
+
+        rows = []
+        for query_id in set(running) | set(self.runtimes) | set(self.failed):
+            runtimes = np.array(self.runtimes.get(query_id, []), dtype=float)
+            has_runtimes = len(runtimes) > 0
+            rows.append((
+                query_id, running.get(query_id, 0), len(runtimes), self.failed.get(query_id, 0),
+                runtimes.mean() if has_runtimes else None,
+                np.median(runtimes) if has_runtimes else None,
+                np.quantile(runtimes, 0.95) if has_runtimes else None,
+                runtimes.min() if has_runtimes else None,
+                runtimes.max() if has_runtimes else None
+            ))
+
+        summary = pandas.DataFrame(rows, columns=SUMMARY_COLUMNS)
+        index_sort = index_natsorted(summary['query_id'])
+        return summary.reindex(index=order_by_index(summary.index, index_sort)) \
+            .reset_index(drop=True)
+
+
+def find_latest_event_log(results_dir='results'):
+    """The event log of the latest run in results_dir, or None."""
+    # the runs of a sweep have a directory per configuration
+    paths = glob.glob(os.path.join(results_dir, 'runs', '*', EventLog.FILE_NAME)) + \
+        glob.glob(os.path.join(results_dir, 'runs', '*', '*', EventLog.FILE_NAME))
+    return max(paths, key=os.path.getmtime) if paths else None
+
+
+def print_summary(path, follow=False, interval=5.0):
+    """Prints the per-query statistics of an event log, again every interval with follow."""
+    reader = EventReader(path)
+    summary = EventSummary()
+    while True:
+        summary.update(reader.read())
+        print(f'\n{path} at {time.strftime("%H:%M:%S")}:')
+        summary_df = summary.to_dataframe()
+        # queries without a finished run have no runtimes
+        summary_df = summary_df.astype(object).where(summary_df.notna(), None)
+        print(tabulate(summary_df.to_dict('list'), headers='keys', tablefmt='github',
+                       floatfmt='.2f'))
+        if not follow:
+            return
+        time.sleep(interval)
@@ -0,0 +1,105 @@
+import logging
+
+from .dbconn import DBConn
+
+LOG = logging.getLogger()
+
+# the columns added to the results, all of them are deltas between two snapshots
+IO_COUNTERS = ('shared_blks_hit', 'shared_blks_read', 'temp_blks_read', 'temp_blks_written',
+               'wal_bytes')
+
+STATEMENTS_SQL = '''
+SELECT sum(shared_blks_hit), sum(shared_blks_read), sum(temp_blks_read), sum(temp_blks_written)
+FROM pg_stat_statements
+WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+'''
+
+# pg_stat_database has no temp blocks, only bytes, see below
+DATABASE_SQL = '''
+SELECT blks_hit, blks_read, NULL, temp_bytes
+FROM pg_stat_database
+WHERE datname = current_database()
+'''
+
+BLOCK_SIZE_SQL = "SELECT current_setting('block_size')::int"
+WAL_LSN_SQL = 'SELECT pg_current_wal_lsn()'
+WAL_DIFF_SQL = 'SELECT pg_wal_lsn_diff(%s, %s)'
+
+
+class IOStats:
+    """
+    Snapshots of the I/O counters of the database, taken on a connection of their own.
+
+    The shared buffer hits and reads and the temp blocks come from pg_stat_statements, which
+    is updated when a statement finishes, summed up over all statements of the database. If
+    the extension is not installed they come from pg_stat_database, whose counters are only
+    flushed every few hundred milliseconds, so deltas around short queries are unreliable.
+    There, the temp blocks written are estimated from the temp file bytes and temp blocks read
+    are not known. The WAL bytes are the distance between the WAL insert positions, for the
+    whole cluster.
+
+    All counters are global: a delta around a query contains the work of all queries that ran
+    concurrently, so deltas are only attributable to a query if a single stream runs.
+    """
+    def __init__(self, dsn):
+        self.dsn = dsn
+        self.conn = None
+        self.source = None
+        self.block_size = 8192
+        self.has_wal = True
+
+    def __enter__(self):
+        self.conn = DBConn(self.dsn).__enter__()
+        cursor = self.conn.cursor
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_stat_statements'")
+        self.source = STATEMENTS_SQL if cursor.fetchone() else DATABASE_SQL
+        if self.source == DATABASE_SQL:
+            LOG.warning('pg_stat_statements is not installed, the I/O counters are taken from '
+                        'pg_stat_database and lag behind.')
+        cursor.execute(BLOCK_SIZE_SQL)
+        self.block_size = cursor.fetchone()[0]
+        return self
+
+    def __exit__(self, *args):
+        self.conn.__exit__(*args)
+
+    def snapshot(self):
+        cursor = self.conn.cursor
+        cursor.execute(self.source)
+        hit, read, temp_read, temp_written = cursor.fetchone()
+        if self.source == DATABASE_SQL and temp_written is not None:
+            temp_written = temp_written // self.block_size
+
+        wal_lsn = None
+        if self.has_wal:
+            try:
+                cursor.execute(WAL_LSN_SQL)
+                wal_lsn = cursor.fetchone()[0]
+            except self.conn.driver.Error as exc:
+                # e.g. on a standby during recovery
+                LOG.warning(f'Cannot read the WAL position, not reporting WAL bytes: {exc}')
+                self.has_wal = False
+
+        return {
+            'shared_blks_hit': hit,
+            'shared_blks_read': read,
+            'temp_blks_read': temp_read,
+            'temp_blks_written': temp_written,
+            'wal_lsn': wal_lsn
+        }
+
+    def delta(self, before, after=None):
+        """The counters of IO_COUNTERS between two snapshots, after defaults to now."""
+        after = after or self.snapshot()
+        delta = {}
+        for counter in IO_COUNTERS[:-1]:
+            if before[counter] is None or after[counter] is None:
+                delta[counter] = None
+            else:
+                delta[counter] = int(after[counter] - before[counter])
+
+        delta['wal_bytes'] = None
+        if before['wal_lsn'] and after['wal_lsn']:
+            self.conn.cursor.execute(WAL_DIFF_SQL, (after['wal_lsn'], before['wal_lsn']))
+            delta['wal_bytes'] = int(self.conn.cursor.fetchone()[0])
+        return delta
@@ -0,0 +1,101 @@
+import json
+import logging
+import os
+import time
+
+from datetime import datetime
+from itertools import count
+
+from .reporting import QueryMetric
+
+LOG = logging.getLogger()
+
+
+class RunJournal:
+    """
+    Append-only log of the finished queries of a run, one JSON line per QueryMetric without its
+    result rows and plan, so that an interrupted run can be resumed from the journal.
+
+    Every line is written with a single unbuffered append before the query is considered
+    done, which survives a crash of the benchmark. The syncs to disk, which only matter if the
+    machine crashes, are grouped to at most one per sync_interval seconds and process. Several
+    processes can append to the same journal.
+    """
+    FILE_NAME = 'journal.jsonl'
+
+    def __init__(self, run_dir, sync_interval=1.0):
+        self.run_dir = run_dir
+        self.path = os.path.join(run_dir, RunJournal.FILE_NAME)
+        self.sync_interval = sync_interval
+        self.last_sync = 0.0
+
+    @staticmethod
+    def make_run_dir(results_dir):
+        """Creates the directory of a new run, named after its start and unique per run."""
+        name = datetime.now().strftime('%Y%m%d-%H%M%S')
+        for suffix in count():
+            run_dir = os.path.join(results_dir, 'runs', f'{name}-{suffix}' if suffix else name)
+            try:
+                os.makedirs(run_dir)
+                return run_dir
+            except FileExistsError:
+                pass
+
+    def append(self, query_metric):
+        line = json.dumps(query_metric.to_record(), default=str) + '\n'
+        os.makedirs(self.run_dir, exist_ok=True)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode('utf-8'))
+            if time.time() - self.last_sync >= self.sync_interval:
+                os.fsync(fd)
+                self.last_sync = time.time()
+        finally:
+            os.close(fd)
+
+    def sync(self):
+        """Syncs the lines appended since the last sync of any process to disk."""
+        if not os.path.exists(self.path):
+            return
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            self.last_sync = time.time()
+        finally:
+            os.close(fd)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return []
+
+        query_metrics = []
+        with open(self.path, 'r') as journal_file:
+            for line_number, line in enumerate(journal_file, 1):
+                try:
+                    query_metrics.append(QueryMetric.from_record(json.loads(line)))
+                except ValueError:
+                    # the last line is cut off if the run was killed while writing it
+                    LOG.warning(f'skipping incomplete line {line_number} of {self.path}')
+
+        return query_metrics
+
+    @staticmethod
+    def completed(query_metrics):
+        return {(m.stream_id, m.query_id, m.iteration) for m in query_metrics}
+
+
+class JournaledQueue:
+    """A reporting queue that journals each QueryMetric before queueing it."""
+    def __init__(self, queue, journal):
+        self.queue = queue
+        self.journal = journal
+
+    def put(self, query_metric):
+        self.journal.append(query_metric)
+        self.queue.put(query_metric)
+
+    def get(self):
+        return self.queue.get()
+
+    def empty(self):
+        return self.queue.empty()
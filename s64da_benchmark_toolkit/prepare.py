@@ -19,7 +19,7 @@ from sqlparse import split as sqlparse_split
 from subprocess import Popen, PIPE
 from urllib.parse import urlparse
 
-from .dbconn import DBConn
+from .dbconn import DBConn, close_pools, log_pool_stats
 
 s64_benchmark_toolkit_root_dir = Path(os.path.abspath(__file__)).parents[1]
 
@@ -64,7 +64,7 @@ class PrepareBenchmarkFactory:
     @property
     def swarm64da_version(self):
         try:
-            with DBConn(self.args.dsn) as conn:
+            with DBConn(self.args.dsn, pooled=True) as conn:
                 conn.cursor.execute('SELECT swarm64da.get_version()')
                 result = conn.cursor.fetchone()[0]
 
@@ -221,6 +221,7 @@ class PrepareBenchmarkFactory:
             prepare_metrics_file.write(f'optimize; {optimize_duration}')
 
 
+        log_pool_stats()
         print(f'Process complete. DSN: {self.args.dsn}')
 
     def _load_pre_schema(self, conn):
@@ -241,6 +242,8 @@ class PrepareBenchmarkFactory:
         dsn_url = urlparse(self.args.dsn)
         dbname = dsn_url.path[1:]
 
+        # pooled connections to the database would block dropping it
+        close_pools()
         with DBConn(f'{dsn_url.scheme}://{dsn_url.netloc}/postgres') as conn:
             print(f'Deleting Database {dbname} if it already exists')
             conn.cursor.execute(f'DROP DATABASE IF EXISTS {dbname}')
@@ -256,7 +259,7 @@ class PrepareBenchmarkFactory:
         with open(applied_schema_path, "w") as applied_schema_file:
             applied_schema_file.write(applied_schema)
 
-        with DBConn(self.args.dsn) as conn:
+        with DBConn(self.args.dsn, pooled=True) as conn:
             print('Adding helper functions.')
             common_file_path = os.path.join(s64_benchmark_toolkit_root_dir, 'benchmarks', 'common', 'functions.sql')
             with open(common_file_path, 'r') as common_sql:
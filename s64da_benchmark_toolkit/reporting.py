@@ -8,25 +8,38 @@ from pathlib import Path
 from uuid import uuid4
 from shutil import copyfile
 
+import numpy as np
 import pandas
 
 from natsort import index_natsorted, order_by_index
 from tabulate import tabulate
 
 from .correctness import Correctness, CorrectnessResult
+from .iostats import IO_COUNTERS
 from .netdata import Netdata
+from .waitevents import report as report_wait_events
 
 
 LOG = logging.getLogger()
 
+# stream id of the metrics of a benchmark's refresh stream, e.g. the TPC-H RF1 and RF2
+REFRESH_STREAM_ID = 'refresh'
+
 
 class QueryMetric:
     dataframe_columns = (
         'stream_id', 'query_id', 'timestamp_start', 'timestamp_stop',
-        'runtime', 'status')
+        'runtime', 'status', 'connection_time', 'rows', 'bytes', 'iteration',
+        'queue_wait', 'planning_time', 'execution_time', 'time_to_first_row', 'fetch_time',
+        *IO_COUNTERS)
+    # left out of to_record(), the result rows and the plan can be large
+    unrecorded = ('result', 'plan')
 
     def __init__(self, *, stream_id, query_id, timestamp_start, timestamp_stop,
-                 status, result, plan):
+                 status, result, plan, connection_time=0.0, result_file=None,
+                 num_rows=None, num_bytes=None, iteration=1, queue_wait=0.0,
+                 planning_time=None, execution_time=None, time_to_first_row=None,
+                 fetch_time=None, io_stats=None):
         self.stream_id = stream_id
         self.query_id = query_id
         self.timestamp_start = datetime.fromtimestamp(timestamp_start)
@@ -34,17 +47,111 @@ class QueryMetric:
         self.status = status
         self.result = result
         self.plan = plan
+        self.connection_time = connection_time
+        # set if the worker already wrote the result rows to this file
+        self.result_file = result_file
+        self.num_rows = num_rows
+        self.num_bytes = num_bytes
+        self.iteration = iteration
+        # time between the release of the query and its start, only in open-loop mode
+        self.queue_wait = queue_wait
+        # only known for prepared statements
+        self.planning_time = planning_time
+        self.execution_time = execution_time
+        self.time_to_first_row = time_to_first_row
+        self.fetch_time = fetch_time
+        # deltas of the I/O counters of iostats.IO_COUNTERS, if they were collected
+        self.io_stats = io_stats
 
     def make_file_name(self, extension):
         return f'{self.stream_id}_{self.query_id}.{extension}'
 
+    def to_record(self):
+        """
+        A JSON serializable dict of the metric without its result rows and plan, small enough
+        to be journaled for every query.
+        """
+        record = {key: value for key, value in vars(self).items()
+                  if key not in QueryMetric.unrecorded}
+        record['timestamp_start'] = self.timestamp_start.timestamp()
+        record['timestamp_stop'] = self.timestamp_stop.timestamp()
+        return record
+
+    @classmethod
+    def from_record(cls, record):
+        return cls(**dict.fromkeys(QueryMetric.unrecorded), **record)
+
     @property
-    def dataframe(self):
+    def dataframe_row(self):
+        """The values of dataframe_columns."""
         runtime = (self.timestamp_stop - self.timestamp_start).total_seconds()
-        return pandas.DataFrame(data=[[
+        io_stats = self.io_stats or {}
+        return (
             self.stream_id, self.query_id, self.timestamp_start,
-            self.timestamp_stop, runtime, self.status
-        ],], columns=QueryMetric.dataframe_columns)
+            self.timestamp_stop, runtime, self.status, self.connection_time,
+            self.num_rows, self.num_bytes, self.iteration,
+            self.queue_wait, self.planning_time, self.execution_time, self.time_to_first_row,
+            self.fetch_time, *(io_stats.get(counter) for counter in IO_COUNTERS)
+        )
+
+    @property
+    def dataframe(self):
+        return pandas.DataFrame(data=[self.dataframe_row], columns=QueryMetric.dataframe_columns)
+
+
+class MetricColumns:
+    """
+    Collects the dataframe rows of QueryMetrics column by column and turns every chunk_rows of
+    them into a typed DataFrame chunk, so that the report takes time and memory linear in the
+    number of metrics. Appending one-row DataFrames copies all previous rows each time.
+
+    The chunks are not flushed to the results CSV one by one but stay in memory until the
+    report is built: the CSV is sorted, and the correctness checks and statistics of the report
+    need all rows. The finished queries are written to disk incrementally by the RunJournal.
+    """
+    DATETIME_COLUMNS = ('timestamp_start', 'timestamp_stop')
+    FLOAT_COLUMNS = ('runtime', 'connection_time', 'queue_wait')
+
+    def __init__(self, chunk_rows=10000):
+        self.chunk_rows = chunk_rows
+        self.columns = [[] for _ in QueryMetric.dataframe_columns]
+        self.chunks = []
+
+    def append(self, query_metric):
+        for values, value in zip(self.columns, query_metric.dataframe_row):
+            values.append(value)
+        if len(self.columns[0]) >= self.chunk_rows:
+            self.close_chunk()
+
+    @staticmethod
+    def make_column(name, values):
+        if name in MetricColumns.DATETIME_COLUMNS:
+            return pandas.to_datetime(values)
+        if name in MetricColumns.FLOAT_COLUMNS:
+            return np.array(values, dtype=float)
+        column = pandas.Series(values, dtype=object)
+        # counters that can be None stay objects, as floats they would be written as 7.0
+        if any(value is None for value in values):
+            return column
+        return column.infer_objects()
+
+    def close_chunk(self):
+        if self.columns[0]:
+            self.chunks.append(pandas.DataFrame({
+                name: MetricColumns.make_column(name, values)
+                for name, values in zip(QueryMetric.dataframe_columns, self.columns)
+            }))
+            self.columns = [[] for _ in QueryMetric.dataframe_columns]
+
+    def to_dataframe(self):
+        self.close_chunk()
+        if not self.chunks:
+            return pandas.DataFrame(columns=QueryMetric.dataframe_columns)
+
+        df = pandas.concat(self.chunks, ignore_index=True) if len(self.chunks) > 1 \
+            else self.chunks[0]
+        self.chunks = []
+        return df
 
 
 class Reporting:
@@ -59,11 +166,20 @@ class Reporting:
         self.check_correctness = args.check_correctness
         self.scale_factor = args.scale_factor
         self.explain_analyze = args.explain_analyze
+        self.duration = args.duration
+        self.arrival_rate = args.arrival_rate
+        self.repetitions = args.repetitions
+        self.scheduler = args.scheduler
         self.all_query_metrics = []
         self.netdata_output_file = args.netdata_output_file
         self.config = config
         self.df = None
         self.total_runtime_seconds = 0.0
+        # set by the streams if wait events were sampled, see waitevents.WaitEventSampler
+        self.wait_events = None
+        # set by the streams when resuming, the metrics of the queries finished before. Their
+        # plans and results are not journaled, the report of the interrupted run saved them.
+        self.resumed_metrics = []
 
         self.output = args.output
         self.csv_file = args.csv_file
@@ -77,10 +193,13 @@ class Reporting:
                 LOG.exception(f'Could not create directory {self.results_root_dir}')
 
     def run_report(self, reporting_queue):
-        self.df = pandas.DataFrame(columns=QueryMetric.dataframe_columns)
+        metric_columns = MetricColumns()
         if os.path.exists(self.prepare_metrics_filename):
             self._save_prepare_metrics()
 
+        for query_metric in self.resumed_metrics:
+            metric_columns.append(query_metric)
+
         while not reporting_queue.empty():
             query_metric = reporting_queue.get()
 
@@ -89,9 +208,9 @@ class Reporting:
             if self.scale_factor:
                 self._save_query_output(query_metric)
 
-            self.df = self.df.append(query_metric.dataframe)
+            metric_columns.append(query_metric)
 
-        self.df = self.df.reset_index(drop=True)
+        self.df = metric_columns.to_dataframe()
 
         netdata_config = self.config.get('netdata')
         if netdata_config:
@@ -112,9 +231,128 @@ class Reporting:
 
             print(f'\nQuery runtime (OK + ERR): {query_runtime} ({self.query_runtime_seconds:.2f}s)')
             print(f'Total benchmark time    : {total_runtime} ({self.total_runtime_seconds:.2f}s)')
+            if self.scheduler != 'streams':
+                makespan = self.df['timestamp_stop'].max() - self.df['timestamp_start'].min()
+                print(f'Makespan ({self.scheduler:>14}): {makespan} ({makespan.total_seconds():.2f}s)')
+
+            if self.duration:
+                self._print_throughput()
+
+            if self.arrival_rate:
+                self._print_latency()
+
+            if self.repetitions > 1:
+                self._print_query_summary()
+
+            if self.wait_events is not None:
+                report_wait_events(self.wait_events, self.output, self.csv_file)
         else:
             LOG.warning("The reporting queue was found empty, which indicates that no queries were ran")
 
+    def get_query_streams_df(self):
+        return self.df[self.df['stream_id'] != REFRESH_STREAM_ID]
+
+    def get_iteration_stats(self):
+        """
+        Per stream and iteration: the wall time and whether all queries of the iteration ran.
+        The last iteration of a stream is usually cut off by the end of the duration. The refresh
+        stream has no iterations of the query streams and is left out.
+        """
+        sub_df = self.get_query_streams_df()
+        sub_df = sub_df[sub_df['status'] != 'IGNORED']
+        stats = []
+        for (stream_id, iteration), group in sub_df.groupby(['stream_id', 'iteration']):
+            stream_df = self.df[self.df['stream_id'] == stream_id]
+            stats.append({
+                'stream_id': stream_id,
+                'iteration': iteration,
+                'queries': len(group),
+                'seconds': (group['timestamp_stop'].max() - group['timestamp_start'].min()).total_seconds(),
+                'complete': iteration < stream_df['iteration'].max()
+            })
+
+        return pandas.DataFrame(stats, columns=('stream_id', 'iteration', 'queries', 'seconds', 'complete'))
+
+    def get_queries_per_hour(self):
+        sub_df = self.df[self.df['status'] != 'IGNORED']
+        if sub_df.empty:
+            return 0.0
+
+        wall_time = (sub_df['timestamp_stop'].max() - sub_df['timestamp_start'].min()).total_seconds()
+        num_ok = (sub_df['status'] == 'OK').sum()
+        return num_ok * 3600 / wall_time if wall_time > 0 else 0.0
+
+    def _print_throughput(self):
+        iteration_stats = self.get_iteration_stats()
+        complete = iteration_stats[iteration_stats['complete']]
+
+        print(f'Queries per hour        : {self.get_queries_per_hour():.2f}')
+        print(f'Completed iterations    : {len(complete)} (of {len(iteration_stats)} started)')
+        if not complete.empty:
+            print(f'Iteration time          : avg {complete["seconds"].mean():.2f}s, '
+                  f'min {complete["seconds"].min():.2f}s, max {complete["seconds"].max():.2f}s')
+
+    @staticmethod
+    def bootstrap_ci(samples, confidence=0.95, num_resamples=1000, seed=0):
+        """
+        Percentile bootstrap confidence interval of the median, with a fixed seed so that
+        the same runtimes always give the same interval.
+        """
+        rng = np.random.default_rng(seed)
+        resamples = rng.choice(samples, size=(num_resamples, len(samples)), replace=True)
+        medians = np.median(resamples, axis=1)
+        alpha = (1 - confidence) / 2
+        return np.quantile(medians, alpha), np.quantile(medians, 1 - alpha)
+
+    def get_query_summary(self):
+        # the refresh functions are not queries of the benchmark
+        sub_df = self.get_query_streams_df()
+        sub_df = sub_df[sub_df['status'] == 'OK']
+        summary = []
+        for query_id, group in sub_df.groupby('query_id'):
+            runtimes = group['runtime'].astype(float).to_numpy()
+            ci_low, ci_high = Reporting.bootstrap_ci(runtimes)
+            summary.append({
+                'query_id': query_id,
+                'samples': len(runtimes),
+                'median': np.median(runtimes),
+                'p95': np.quantile(runtimes, 0.95),
+                'std': np.std(runtimes, ddof=1) if len(runtimes) > 1 else 0.0,
+                'ci_low': ci_low,
+                'ci_high': ci_high
+            })
+
+        summary_df = pandas.DataFrame(summary, columns=(
+            'query_id', 'samples', 'median', 'p95', 'std', 'ci_low', 'ci_high'))
+        index_sort = index_natsorted(summary_df['query_id'])
+        return summary_df.reindex(index=order_by_index(summary_df.index, index_sort)) \
+            .reset_index(drop=True)
+
+    def _print_query_summary(self):
+        summary_df = self.get_query_summary()
+
+        if 'print' in self.output:
+            print(f'\nPer-query runtimes over {self.repetitions} repetitions '
+                  f'(median with 95% bootstrap confidence interval):')
+            print(tabulate(summary_df, headers='keys', tablefmt='github', floatfmt='.2f',
+                           showindex=False))
+
+        if 'csv' in self.output and self.csv_file:
+            csv_root, csv_ext = os.path.splitext(self.csv_file)
+            summary_df.to_csv(f'{csv_root}_summary{csv_ext or ".csv"}', sep=';', index=False)
+
+    def get_latency_stats(self):
+        sub_df = self.df[self.df['status'] != 'IGNORED']
+        return pandas.DataFrame({
+            'queue_wait': sub_df['queue_wait'].astype(float),
+            'runtime': sub_df['runtime'].astype(float),
+            'latency': (sub_df['queue_wait'] + sub_df['runtime']).astype(float)
+        }).describe(percentiles=[.5, .95, .99])
+
+    def _print_latency(self):
+        print(f'\nLatency at {self.arrival_rate} queries per minute (open-loop):')
+        print(tabulate(self.get_latency_stats(), headers='keys', tablefmt='github', floatfmt='.2f'))
+
     def _save_explain_plan(self, query_metric):
         if not query_metric.plan:
             return
@@ -131,6 +369,9 @@ class Reporting:
         copyfile(self.prepare_metrics_filename, os.path.join(self.results_root_dir, self.prepare_metrics_filename))
 
     def _save_query_output(self, query_metric):
+        if query_metric.result_file or query_metric.stream_id == REFRESH_STREAM_ID:
+            return
+
         query_result = query_metric.result
         if query_result is not None and query_result[1]:
             query_result_header = query_result[0]
@@ -181,6 +422,8 @@ class Reporting:
 
         self.df['correctness_check'] = None
         for stream_id in stream_ids:
+            if stream_id == REFRESH_STREAM_ID:
+                continue
             sub_df = self.df.loc[self.df['stream_id'] == stream_id]
             for index, row in sub_df.iterrows():
                 if row['status'] == 'OK':
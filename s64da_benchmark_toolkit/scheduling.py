@@ -0,0 +1,210 @@
+import logging
+import math
+import queue
+import random
+import time
+
+from collections import namedtuple
+from contextlib import ExitStack
+from itertools import zip_longest
+from multiprocessing import Manager, Pool
+
+import pandas
+
+LOG = logging.getLogger()
+
+WorkItem = namedtuple('WorkItem', ['stream_id', 'query_id', 'iteration', 'release_time'])
+
+# how often a blocked put on the work queue checks whether the workers are still alive
+WORKER_CHECK_INTERVAL = 1.0
+
+
+class ArrivalProcess:
+    """
+    Inter-arrival times for a given rate in queries per minute, either exponentially
+    distributed ("poisson") or constant ("fixed").
+    """
+    PROCESSES = ('poisson', 'fixed')
+
+    def __init__(self, rate, process='poisson', seed=None):
+        if rate <= 0:
+            raise ValueError(f'Arrival rate must be positive, got {rate}')
+        if process not in ArrivalProcess.PROCESSES:
+            raise ValueError(f'Unknown arrival process {process}')
+
+        self.rate_per_second = rate / 60
+        self.process = process
+        self.random = random.Random(seed)
+
+    def next_interval(self):
+        if self.process == 'fixed':
+            return 1 / self.rate_per_second
+        return self.random.expovariate(self.rate_per_second)
+
+
+def load_expected_runtimes(csv_file):
+    """
+    Median runtime of the successful executions of each query in a results CSV of a
+    previous run, keyed by the query id as string.
+    """
+    df = pandas.read_csv(csv_file, sep=';')
+    df = df[df['status'] == 'OK']
+    return {str(query_id): runtime for query_id, runtime in
+            df.groupby('query_id')['runtime'].median().items()}
+
+
+def order_queries(queries, policy, expected_runtimes=None):
+    """
+    Orders (stream id, query id) pairs for the shared work queue. Queries without an expected
+    runtime count as the longest ones, so they are started first with "longest-first".
+    """
+    if policy == 'fifo':
+        return list(queries)
+
+    if policy not in ('longest-first', 'shortest-first'):
+        raise ValueError(f'Unknown scheduling policy {policy}')
+
+    expected_runtimes = expected_runtimes or {}
+    unknown = sorted({str(query_id) for _, query_id in queries} - set(expected_runtimes))
+    if unknown:
+        LOG.warning(f'No expected runtime for queries {", ".join(unknown)}')
+
+    def expected_runtime(query):
+        return expected_runtimes.get(str(query[1]), math.inf)
+
+    return sorted(queries, key=expected_runtime, reverse=policy == 'longest-first')
+
+
+class WorkQueueExecutor:
+    """
+    Runs the queries of all streams on a fixed number of worker processes pulling from a
+    shared queue, in the order given by the scheduling policy.
+
+    With an arrival process the queries are released open-loop, independent of whether a
+    worker is free, and the time a query waited for a worker is reported as queue_wait.
+    Without one, the queries are released closed-loop as the workers become free, the queue
+    holds at most one query per worker and queue_wait is not reported.
+    """
+    POLICIES = ('fifo', 'longest-first', 'shortest-first')
+
+    def __init__(self, streams, num_workers, arrival_process=None, policy='fifo',
+                 expected_runtimes=None):
+        self.streams = streams
+        self.num_workers = max(num_workers, 1)
+        self.arrival_process = arrival_process
+        self.policy = policy
+        self.expected_runtimes = expected_runtimes
+
+    def get_queries(self, reporting_queue):
+        """
+        The queries of all streams interleaved round-robin and ordered by the scheduling
+        policy, ignored queries are reported right away and not queued.
+        """
+        streams = self.streams
+        ignored = streams.config.get('ignore', [])
+        timeout = streams.parse_timeout(streams.config.get('timeout', 0))
+        sequences = [
+            [(stream_id, query_id) for query_id in streams.get_stream_sequence(stream_id)]
+            for stream_id in streams.get_stream_ids()
+        ]
+
+        queries = []
+        for row in zip_longest(*sequences):
+            for stream_id, query_id in filter(None, row):
+                if query_id in ignored:
+                    if not streams.is_completed(stream_id, query_id, 1):
+                        reporting_queue.put(
+                            streams.make_ignored_metric(stream_id, query_id, timeout))
+                else:
+                    queries.append((stream_id, query_id))
+        return order_queries(queries, self.policy, self.expected_runtimes)
+
+    def run(self, reporting_queue):
+        queries = self.get_queries(reporting_queue)
+        with Manager() as manager:
+            # closed-loop, a put blocks until a worker took a query, so that a stream cycled
+            # until the deadline is not queued ahead of time
+            work_queue = manager.Queue(maxsize=0 if self.arrival_process else self.num_workers)
+            with Pool(processes=self.num_workers) as pool:
+                workers = pool.starmap_async(self._run_worker, (
+                    (reporting_queue, work_queue, worker_id)
+                    for worker_id in range(self.num_workers)))
+                try:
+                    self.dispatch(work_queue, queries, workers)
+                finally:
+                    for _ in range(self.num_workers):
+                        self.put_work(work_queue, workers, None)
+                workers.get()
+
+    @staticmethod
+    def put_work(work_queue, workers, item):
+        """
+        Puts an item on the work queue, blocking until there is room as long as the workers
+        are alive. Raises the error of the workers if they failed in the meantime.
+        """
+        while True:
+            try:
+                work_queue.put(item, timeout=WORKER_CHECK_INTERVAL)
+                return
+            except queue.Full:
+                if workers.ready():
+                    workers.get()
+                    raise RuntimeError('The workers stopped before all queries were run')
+
+    def dispatch(self, work_queue, queries, workers):
+        release_time = time.time() if self.arrival_process else None
+        for iteration, _, (stream_id, query_id) in self.streams.iterate_stream(queries):
+            if self.streams.is_completed(stream_id, query_id, iteration):
+                continue
+            if self.arrival_process:
+                # sleep until the scheduled release, so that slow puts do not lower the rate
+                time.sleep(max(release_time - time.time(), 0))
+            if self.streams.is_over():
+                break
+            self.put_work(
+                work_queue, workers, WorkItem(stream_id, query_id, iteration, release_time))
+            if self.arrival_process:
+                release_time += self.arrival_process.next_interval()
+
+    def _run_worker(self, reporting_queue, work_queue, worker_id):
+        streams = self.streams
+        timeout = streams.parse_timeout(streams.config.get('timeout', 0))
+        deferred_metrics = []
+        with ExitStack() as stack:
+            session = None
+            if streams.connection_mode == 'session':
+                session = stack.enter_context(streams.db.session(streams.config.get('timeout', 0)))
+            # only per query, the workers do not run whole streams
+            io_stats = streams.make_io_stats(stack)
+
+            for item in iter(work_queue.get, None):
+                if streams.is_over():
+                    # drain the backlog, no new queries are started after the deadline or stop
+                    continue
+
+                pretext = f'query {item.query_id:2} of stream {item.stream_id:2} on worker {worker_id:2}'
+                queue_wait = None
+                if item.release_time is None:
+                    LOG.info(f'running  {pretext}.')
+                else:
+                    queue_wait = time.time() - item.release_time
+                    LOG.info(f'running  {pretext} after waiting {queue_wait:.2f}s.')
+                io_snapshot = io_stats.snapshot() if io_stats else None
+                timing, query_result, plan = streams._run_query(
+                    item.stream_id, item.query_id, session, item.iteration)
+                runtime = timing.stop - timing.start
+                LOG.info(f'finished {pretext}: {runtime:.2f}s {timing.status.name}')
+                if streams.is_warmup(item.iteration):
+                    continue
+
+                query_metric = streams.make_query_metric(
+                    item.stream_id, item.query_id, timing, query_result, plan, timeout,
+                    item.iteration, io_stats.delta(io_snapshot) if io_stats else None)
+                query_metric.queue_wait = queue_wait
+                streams._report_metric(reporting_queue, deferred_metrics, query_metric)
+
+        for stream_id in sorted({metric.stream_id for metric in deferred_metrics}):
+            stream_metrics = [metric for metric in deferred_metrics if metric.stream_id == stream_id]
+            streams._add_deferred_plans(stream_id, stream_metrics)
+            for query_metric in stream_metrics:
+                reporting_queue.put(query_metric)
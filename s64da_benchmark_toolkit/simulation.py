@@ -0,0 +1,174 @@
+import asyncio
+import csv
+import logging
+import math
+import os
+import time
+
+from random import Random
+
+import pandas
+
+from .db import DB, SpilledResult, Status, Timing, estimate_wire_bytes
+
+LOG = logging.getLogger()
+
+
+class SimulatedSession:
+    """Stands in for DBSession and AsyncDBSession, no connection is opened."""
+    def __init__(self):
+        self.prepared = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    @staticmethod
+    def take_connect_time():
+        return 0.0
+
+
+def load_replay(csv_file):
+    """The (runtime, status) of all executed queries in a results CSV, by query id as string."""
+    df = pandas.read_csv(csv_file, sep=';')
+    df = df[df['status'].isin([status.name for status in Status])]
+    return {str(query_id): list(zip(group['runtime'], group['status']))
+            for query_id, group in df.groupby('query_id')}
+
+
+class SimulatedDB(DB):
+    """
+    Stands in for the database to measure the overhead of the toolkit itself.
+
+    Queries are not sent anywhere: simulate_query() sleeps for a runtime and returns the
+    canned result of the query from results_dir, if there is one. The runtimes and statuses
+    are replayed from the results CSV of a previous run ("replay") or sampled from an
+    exponential or a lognormal distribution with the given mean. All sleeps are multiplied
+    by time_scale.
+    """
+    DISTRIBUTIONS = ('replay', 'exponential', 'lognormal')
+    LOGNORMAL_SIGMA = 0.5
+
+    def __init__(self, distribution, dsn, plan_capture=None, result_mode='fetch',
+                 fetch_batch_size=10000, runtimes_csv=None, mean_runtime=1.0, time_scale=1.0,
+                 results_dir=None, seed=0):
+        super().__init__(dsn, plan_capture, result_mode, fetch_batch_size)
+        if distribution not in SimulatedDB.DISTRIBUTIONS:
+            raise ValueError(f'Unknown runtime distribution {distribution}')
+        if distribution == 'replay' and not runtimes_csv:
+            raise ValueError('Replaying runtimes requires a results CSV')
+
+        self.distribution = distribution
+        self.replay = load_replay(runtimes_csv) if distribution == 'replay' else {}
+        self.mean_runtime = mean_runtime
+        self.time_scale = time_scale
+        self.results_dir = results_dir
+        self.seed = seed
+        # canned results by query id, read on first use
+        self.results = {}
+
+    def apply_config(self, config):
+        LOG.info('simulated database, not applying the dbconfig.')
+
+    def check_config(self, config):
+        pass
+
+    def reset_config(self):
+        pass
+
+    def session(self, timeout):
+        return SimulatedSession()
+
+    def explain_queries(self, sqls, timeout):
+        return [None] * len(sqls)
+
+    def draw_runtime(self, stream_id, query_id, iteration):
+        """The runtime in seconds and the status name of one run of a query."""
+        # seeded like the query parameters, so reruns draw the same runtimes
+        rng = Random(f'{self.seed}-{stream_id}-{query_id}-{iteration}')
+        if self.distribution == 'replay':
+            executions = self.replay.get(str(query_id))
+            if executions:
+                return rng.choice(executions)
+            LOG.warning(f'No runtime to replay for query {query_id}, sampling one')
+
+        if self.distribution == 'lognormal':
+            # the mean of a lognormal distribution is exp(mu + sigma^2 / 2)
+            mu = math.log(self.mean_runtime) - SimulatedDB.LOGNORMAL_SIGMA ** 2 / 2
+            return rng.lognormvariate(mu, SimulatedDB.LOGNORMAL_SIGMA), Status.OK.name
+        return rng.expovariate(1 / self.mean_runtime), Status.OK.name
+
+    def get_canned_result(self, query_id):
+        if query_id not in self.results:
+            columns, rows = [], []
+            result_path = os.path.join(self.results_dir or '', f'{query_id}.csv')
+            if self.results_dir and os.path.exists(result_path):
+                with open(result_path, 'r') as result_file:
+                    reader = csv.reader(result_file)
+                    columns = next(reader, [])
+                    rows = [tuple(row) for row in reader]
+            self.results[query_id] = (columns, rows)
+        return self.results[query_id]
+
+    def make_result(self, query_id, result_file):
+        columns, rows = self.get_canned_result(query_id)
+        if self.result_mode == 'discard':
+            return SpilledResult(path=os.devnull, num_rows=len(rows),
+                                 num_bytes=estimate_wire_bytes((columns, rows)))
+
+        if self.result_mode == 'stream':
+            os.makedirs(os.path.dirname(result_file), exist_ok=True)
+            with open(result_file, 'w') as csv_file:
+                writer = csv.writer(csv_file)
+                writer.writerow(columns)
+                writer.writerows(rows)
+                num_bytes = csv_file.tell()
+            return SpilledResult(path=result_file, num_rows=len(rows), num_bytes=num_bytes)
+
+        return columns, list(rows)
+
+    def finish_query(self, query_id, start, status, result_file=None):
+        first_row_at = time.time()
+        query_result = None
+        first_row_time, fetch_time = None, None
+        if status == Status.OK.name:
+            query_result = self.make_result(query_id, result_file)
+            first_row_time = first_row_at - start
+            fetch_time = time.time() - first_row_at
+
+        return Timing(start=start, stop=time.time(), status=Status[status], connect=0.0,
+                      first_row=first_row_time, fetch=fetch_time), query_result, None
+
+    def simulate_query(self, stream_id, query_id, iteration=1, result_file=None):
+        """The simulated counterpart of run_query, returns a Timing, the result and no plan."""
+        runtime, status = self.draw_runtime(stream_id, query_id, iteration)
+        start = time.time()
+        time.sleep(runtime * self.time_scale)
+        return self.finish_query(query_id, start, status, result_file)
+
+
+class AsyncSimulatedDB:
+    """The asyncio counterpart of SimulatedDB, sleeping on the event loop."""
+    def __init__(self, db):
+        self.db = db
+        self.plan_capture = db.plan_capture
+
+    def session(self, timeout):
+        return SimulatedSession()
+
+    async def explain_queries(self, sqls, timeout):
+        return [None] * len(sqls)
+
+    async def simulate_query(self, stream_id, query_id, iteration=1, result_file=None):
+        runtime, status = self.db.draw_runtime(stream_id, query_id, iteration)
+        start = time.time()
+        await asyncio.sleep(runtime * self.db.time_scale)
+        return self.db.finish_query(query_id, start, status, result_file)
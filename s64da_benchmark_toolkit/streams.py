@@ -1,22 +1,36 @@
 # -*- coding: utf-8 -*-
 
+import argparse
+import importlib
 import logging
 import os
 import csv
+import queue
 import re
+import threading
 import time
 
 from collections import namedtuple
+from contextlib import ExitStack
 from datetime import datetime
-from multiprocessing import Manager, Pool
+from multiprocessing import Manager, Pool, Process
 from natsort import natsorted
 from pandas.io.formats.style import Styler
+from string import Template
 
 import pandas
 import yaml
 
-from .db import DB
+from .async_streams import AsyncStreamsExecutor
+from .db import DB, ConfigNotAppliedException, PlanCapture, SpilledResult, estimate_wire_bytes
+from .distributed import POLL_INTERVAL, AgentJob, Coordinator, split_range
+from .events import EventLog
+from .iostats import IOStats
+from .journal import JournaledQueue, RunJournal
 from .reporting import Reporting, QueryMetric
+from .scheduling import ArrivalProcess, WorkQueueExecutor, load_expected_runtimes
+from .simulation import SimulatedDB
+from .waitevents import WaitEventSampler, tag_query
 
 
 Benchmark = namedtuple('Benchmark', ['name', 'base_dir'])
@@ -26,7 +40,7 @@ LOG = logging.getLogger()
 
 
 class Streams:
-    def __init__(self, args, benchmark):
+    def __init__(self, args, benchmark, journal=None, keep_run_dir=True):
 
         # The Output structure:
         #
@@ -41,8 +55,19 @@ class Streams:
         # │   │   ├── 0_1.txt
         # │   │   ├── 0_2.txt
 
+        # kept to derive the arguments of the agents' share of the streams
+        self.args = args
         self.config = Streams._make_config(args, benchmark)
-        self.db = DB(args.dsn)
+        self.simulate = args.simulate is not None
+        if self.simulate:
+            self.db = SimulatedDB(
+                args.simulate, args.dsn,
+                PlanCapture(args.plan_capture, args.plan_sample_interval), args.result_mode,
+                args.fetch_batch_size, args.runtimes_csv, args.simulate_mean_runtime,
+                args.simulate_time_scale, Streams.get_canned_results_dir(args, benchmark))
+        else:
+            self.db = DB(args.dsn, PlanCapture(args.plan_capture, args.plan_sample_interval),
+                         args.result_mode, args.fetch_batch_size, args.prepared_statements)
         self.num_streams = args.streams
         self.benchmark = benchmark
         self.stream_offset = args.stream_offset
@@ -50,7 +75,44 @@ class Streams:
         self.query_dir = self._get_query_dir()
         self.explain_analyze = args.explain_analyze
         self.use_server_side_cursors = args.use_server_side_cursors
+        self.executor = args.executor
+        self.executor_processes = args.executor_processes
+        # prepared statements only live as long as the connection they were prepared on
+        self.connection_mode = 'session' if args.prepared_statements else args.connection_mode
+        self.duration = args.duration
+        self.deadline = None
+        # set to stop the streams early, shared with the processes running them
+        self.stop = None
+        self.warmup = args.warmup
+        self.repetitions = args.repetitions
+        self.arrival_rate = args.arrival_rate
+        self.arrival_process = args.arrival_process
+        self.num_workers = args.workers or max(self.num_streams, 1)
+        self.scheduler = args.scheduler
+        self.runtimes_csv = args.runtimes_csv
+        self.refresh = args.refresh
+        self.refresh_pairs = args.refresh_pairs or max(self.num_streams, 1)
+        self.refresh_start = args.refresh_start
+        self.query_parameters = None
+        if args.generate_parameters:
+            self.query_parameters = self.import_benchmark_module('parameters').QueryParameters(
+                self.scale_factor, args.parameter_seed)
         self.reporting = Reporting(benchmark, args, self.config)
+        self.resume = args.resume is not None
+        # a journal given by the caller, e.g. one per configuration of a sweep, instead of a
+        # run directory of its own. Agents keep none, the coordinator journals their queries.
+        self.journal = None
+        self.events = None
+        if keep_run_dir:
+            self.journal = journal or RunJournal(args.resume or RunJournal.make_run_dir(
+                self.reporting.results_root_dir))
+            self.events = EventLog(self.journal.run_dir)
+        # (stream id, query id, iteration) of the queries finished before resuming
+        self.completed = set()
+        self.agents = args.agents
+        self.agent_authkey = args.agent_authkey
+        self.io_stats = args.io_stats
+        self.wait_event_interval = args.wait_event_interval
 
     @staticmethod
     def _make_config(args, benchmark):
@@ -65,6 +127,13 @@ class Streams:
 
         return config
 
+    @staticmethod
+    def get_canned_results_dir(args, benchmark):
+        # the simulation returns the recorded correctness results of the scale factor
+        if args.scale_factor is None:
+            return None
+        return os.path.join('correctness_results', benchmark.name, f'sf{args.scale_factor}')
+
     def _get_query_dir(self):
         _dir = os.path.join(self.benchmark.base_dir, 'queries')
         if os.path.isdir(os.path.join(_dir, f'queries_{self.scale_factor}')):
@@ -84,25 +153,59 @@ class Streams:
 
     def run(self):
         dbconfig = self.config.get('dbconfig')
-        try:
-            mp_manager = Manager()
-            reporting_queue = mp_manager.Queue()
-
-            if dbconfig:
+        if dbconfig:
+            self.db.reset_config()
+            self.db.apply_config(dbconfig)
+            try:
+                self.db.check_config(dbconfig)
+            except ConfigNotAppliedException:
                 self.db.reset_config()
-                self.db.apply_config(dbconfig)
+                raise
 
-            self.run_streams(reporting_queue)
+        sampler = None
+        try:
+            if self.runs_in_process():
+                reporting_queue = queue.Queue()
+            else:
+                mp_manager = Manager()
+                reporting_queue = mp_manager.Queue()
+
+            if self.resume:
+                query_metrics = self.journal.load()
+                LOG.info(f'resuming from {self.journal.path} with {len(query_metrics)} '
+                         f'finished queries.')
+                self.completed = RunJournal.completed(query_metrics)
+                self.reporting.resumed_metrics = query_metrics
+
+            LOG.info(f'journaling finished queries to {self.journal.path}, '
+                     f'logging query events to {self.events.path}.')
+            if self.wait_event_interval:
+                sampler = WaitEventSampler(self.db.dsn, self.wait_event_interval)
+                sampler.start()
+            self.run_streams(JournaledQueue(reporting_queue, self.journal))
 
         except KeyboardInterrupt:
             # Reset all the stuff
             pass
 
         finally:
+            self.journal.sync()
+            if sampler:
+                self.reporting.wait_events = sampler.stop()
             self.reporting.run_report(reporting_queue)
             if dbconfig:
                 self.db.reset_config()
 
+    def runs_in_process(self):
+        """
+        Whether all queries are reported from this process, which is the case for the asyncio
+        executor on a single process without the refresh stream. Otherwise the reporting queue
+        has to be shared through a manager.
+        """
+        uses_work_queue = self.arrival_rate or self.scheduler != 'streams'
+        return self.executor == 'asyncio' and self.executor_processes <= 1 and \
+            not uses_work_queue and not self.refresh
+
     def get_stream_sequence(self, stream_id):
         streams_path = os.path.join(self.benchmark.base_dir, 'queries', 'streams.yaml')
         with open(streams_path, 'r') as streams_file:
@@ -111,62 +214,302 @@ class Streams:
             except KeyError:
                 raise ValueError(f'Stream file {streams_path} does not contain stream id {stream_id}')
 
-    def _make_run_args(self, reporting_queue):
+    def get_stream_ids(self):
         if self.num_streams == 0:
-            return ((reporting_queue, 0),)
-        else:
-            return tuple((reporting_queue, stream) for stream in
-                         range(self.stream_offset, self.num_streams + self.stream_offset))
+            return (0,)
+        return tuple(range(self.stream_offset, self.num_streams + self.stream_offset))
+
+    def _make_run_args(self, reporting_queue):
+        return tuple((reporting_queue, stream) for stream in self.get_stream_ids())
+
+    def import_benchmark_module(self, name):
+        try:
+            return importlib.import_module(f'benchmarks.{self.benchmark.name}.{name}')
+        except ModuleNotFoundError:
+            raise ValueError(f'Benchmark {self.benchmark.name} has no {name} module')
+
+    def make_refresh_stream(self):
+        return self.import_benchmark_module('refresh').RefreshStream(
+            self.db.dsn, self.scale_factor, self.refresh_pairs, self.config.get('timeout', 0),
+            self.refresh_start, self.completed)
 
     def run_streams(self, reporting_queue):
+        # set before the streams are started, so all of them share the same deadline
+        self.deadline = time.time() + self.duration if self.duration else None
+
+        refresh_process = None
+        if self.refresh:
+            refresh_process = Process(target=self.make_refresh_stream().run,
+                                      args=(reporting_queue, self.deadline))
+            refresh_process.start()
+
+        try:
+            if self.agents:
+                Coordinator(self.agents, self.agent_authkey).run(
+                    self.make_agent_assignments(), reporting_queue)
+            else:
+                self._run_query_streams(reporting_queue)
+        finally:
+            if refresh_process:
+                refresh_process.join()
+
+        if refresh_process and refresh_process.exitcode != 0:
+            raise RuntimeError(f'The refresh stream failed with exit code {refresh_process.exitcode}')
+
+    def make_agent_assignments(self):
+        """
+        Splits the streams into contiguous ranges of stream ids, one per agent. The refresh
+        stream stays on the coordinator, the arrival rate and the workers are split in
+        proportion to the number of streams of each agent.
+        """
+        num_streams = max(self.num_streams, 1)
+        assignments = []
+        for address, (stream_offset, count) in zip(self.agents, split_range(
+                self.stream_offset, num_streams, len(self.agents))):
+            if count == 0:
+                continue
+
+            share = count / num_streams
+            agent_args = argparse.Namespace(**{
+                **vars(self.args),
+                'streams': count if self.num_streams else 0,
+                'stream_offset': stream_offset,
+                'arrival_rate': self.arrival_rate * share if self.arrival_rate else None,
+                'workers': max(round(self.args.workers * share), 1) if self.args.workers else None,
+                'refresh': False,
+                'resume': None,
+                'agents': None,
+                'agent_authkey': None
+            })
+            assignments.append(
+                (address, StreamsAgentJob(agent_args, self.benchmark, self.completed)))
+        return assignments
+
+    def _run_query_streams(self, reporting_queue):
+        if self.arrival_rate or self.scheduler != 'streams':
+            arrival_process = None
+            if self.arrival_rate:
+                arrival_process = ArrivalProcess(self.arrival_rate, self.arrival_process)
+            policy = 'fifo' if self.scheduler == 'streams' else self.scheduler
+            expected_runtimes = None
+            if self.runtimes_csv:
+                expected_runtimes = load_expected_runtimes(self.runtimes_csv)
+
+            executor = WorkQueueExecutor(self, self.num_workers, arrival_process, policy,
+                                         expected_runtimes)
+            executor.run(reporting_queue)
+            return
+
+        if self.executor == 'asyncio':
+            executor = AsyncStreamsExecutor(self, self.executor_processes)
+            executor.run(reporting_queue, self.get_stream_ids())
+            return
+
         with Pool(processes=max(self.num_streams, 1)) as pool:
             map_args = self._make_run_args(reporting_queue)
             pool.starmap(self._run_stream, map_args)
 
-    def _run_query(self, stream_id, query_id):
-        query_sql = self.read_sql_file(query_id)
+    def get_query_sql(self, stream_id, query_id, iteration=1):
+        if self.query_parameters:
+            with open(self.query_parameters.get_template_path(query_id), 'r') as template_file:
+                query_sql = Template(template_file.read()).substitute(
+                    self.query_parameters.get_parameters(stream_id, query_id, iteration))
+        else:
+            query_sql = self.read_sql_file(query_id)
         query_sql = Streams.apply_sql_modifications(query_sql, (
             ('revenue0', f'revenue{stream_id}'),))
+        if self.wait_event_interval:
+            query_sql = tag_query(query_sql, stream_id, query_id)
+        return query_sql
+
+    def get_result_file(self, stream_id, query_id):
+        return os.path.join(self.reporting.query_results, f'{stream_id}_{query_id}.csv')
+
+    def _run_query(self, stream_id, query_id, session=None, iteration=1):
+        query_sql = self.get_query_sql(stream_id, query_id, iteration)
         timeout = self.config.get('timeout', 0)
-        return self.db.run_query(query_sql, timeout, self.explain_analyze, self.use_server_side_cursors)
+        warmup = Streams.is_warmup(iteration)
+        if self.events:
+            self.events.query_started(stream_id, query_id, iteration, warmup=warmup)
+        if self.simulate:
+            query_output = self.db.simulate_query(stream_id, query_id, iteration,
+                                                  self.get_result_file(stream_id, query_id))
+        else:
+            query_output = self.db.run_query(query_sql, timeout, self.explain_analyze,
+                                             self.use_server_side_cursors, session,
+                                             self.get_result_file(stream_id, query_id))
+        timing = query_output[0]
+        if self.events:
+            self.events.query_finished(stream_id, query_id, iteration, timing.status.name,
+                                       timing.stop - timing.start, warmup=warmup)
+        return query_output
+
+    def is_completed(self, stream_id, query_id, iteration):
+        return (stream_id, query_id, iteration) in self.completed
+
+    def is_over(self):
+        """Whether no new queries are started, after the deadline or once stopped."""
+        if self.stop is not None and self.stop.is_set():
+            return True
+        return bool(self.deadline) and time.time() >= self.deadline
+
+    def iterate_stream(self, sequence, stream_id=None):
+        """
+        Yields iteration, position in the sequence, and query id for each query to run.
+
+        The warm-up passes come first and have an iteration below 1, their metrics are not
+        reported. Without a duration the sequence is then run for the configured number of
+        repetitions, otherwise it is cycled until the deadline is reached. Queries running at
+        the deadline or when the run is stopped are finished, no new ones are started. Queries
+        of the stream that were finished before resuming are skipped.
+        """
+        ignored = self.config.get('ignore', [])
+        iteration = 1 - self.warmup
+        while True:
+            for idx, query_id in enumerate(sequence):
+                if self.is_over():
+                    return
+                if self.is_completed(stream_id, query_id, iteration):
+                    continue
+                yield iteration, idx + 1, query_id
+
+            if all(query_id in ignored for query_id in sequence):
+                return
+            if not self.deadline and iteration >= self.repetitions:
+                return
+            iteration += 1
+
+    @staticmethod
+    def is_warmup(iteration):
+        return iteration < 1
+
+    def make_pretext(self, stream_id, iteration, num_query, num_queries, query_id):
+        pretext = f'{num_query:2}/{num_queries:2}: query {query_id:2} of stream {stream_id:2}'
+        if Streams.is_warmup(iteration):
+            pretext += f' (warm-up {iteration + self.warmup})'
+        elif self.duration or self.repetitions > 1:
+            pretext += f' (iteration {iteration})'
+        return pretext
+
+    @staticmethod
+    def make_ignored_metric(stream_id, query_id, timeout, iteration=1):
+        return QueryMetric(
+            stream_id=stream_id,
+            query_id=query_id,
+            iteration=iteration,
+            timestamp_start=time.time(),
+            timestamp_stop=time.time() + timeout,
+            status="IGNORED",
+            result=None,
+            plan=None
+        )
+
+    @staticmethod
+    def make_query_metric(stream_id, query_id, timing, query_result, plan, timeout, iteration=1,
+                          io_stats=None):
+        timestamp_stop = timing.stop if timing.status.name == 'OK' else timing.start + timeout
+        result_file, num_rows, num_bytes = None, None, None
+        if isinstance(query_result, SpilledResult):
+            result_file, num_rows, num_bytes = query_result
+            query_result = None
+        elif query_result is not None:
+            num_rows = len(query_result[1])
+            num_bytes = estimate_wire_bytes(query_result)
+
+        return QueryMetric(
+            stream_id=stream_id,
+            query_id=query_id,
+            iteration=iteration,
+            timestamp_start=timing.start,
+            timestamp_stop=timestamp_stop,
+            status=timing.status.name,
+            result=query_result,
+            plan=plan,
+            connection_time=timing.connect,
+            planning_time=timing.planning,
+            execution_time=timing.execution,
+            time_to_first_row=timing.first_row,
+            fetch_time=timing.fetch,
+            result_file=result_file,
+            num_rows=num_rows,
+            num_bytes=num_bytes,
+            io_stats=io_stats
+        )
+
+    def make_io_stats(self, stack):
+        """IOStats entered on the ExitStack if I/O counters are collected, None otherwise."""
+        if self.io_stats == 'off':
+            return None
+        return stack.enter_context(IOStats(self.db.dsn))
+
+    def _report_metric(self, reporting_queue, deferred_metrics, query_metric):
+        if self.db.plan_capture.is_deferred and not query_metric.plan:
+            deferred_metrics.append(query_metric)
+        else:
+            reporting_queue.put(query_metric)
 
     def _run_stream(self, reporting_queue, stream_id):
         sequence = self.get_stream_sequence(stream_id)
         num_queries = len(sequence)
         timeout = Streams.parse_timeout(self.config.get('timeout', 0))
-        for idx, query_id in enumerate(sequence):
-            num_query = idx + 1
-            pretext = f'{num_query:2}/{num_queries:2}: query {query_id:2} of stream {stream_id:2}'
-
-            if query_id in self.config.get('ignore', []):
-                LOG.info(f'ignoring {pretext}.')
-                reporting_queue.put(QueryMetric(
-                    stream_id=stream_id,
-                    query_id=query_id,
-                    timestamp_start=time.time(),
-                    timestamp_stop=time.time() + timeout,
-                    status="IGNORED",
-                    result=None,
-                    plan=None
-                ))
-            else:
-                LOG.info(f'running  {pretext}.')
-                timing, query_result, plan = self._run_query(stream_id, query_id)
-
-                timestamp_stop = timing.stop if timing.status.name == 'OK' else timing.start + timeout
-                runtime = timing.stop - timing.start
-
-                LOG.info(f'finished {pretext}: {runtime:.2f}s {timing.status.name}')
-
-                reporting_queue.put(QueryMetric(
-                    stream_id=stream_id,
-                    query_id=query_id,
-                    timestamp_start=timing.start,
-                    timestamp_stop=timestamp_stop,
-                    status=timing.status.name,
-                    result=query_result,
-                    plan=plan
-                ))
+        deferred_metrics = []
+        with ExitStack() as stack:
+            session = None
+            if self.connection_mode == 'session':
+                session = stack.enter_context(self.db.session(self.config.get('timeout', 0)))
+            io_stats = self.make_io_stats(stack)
+            # with --io-stats=stream, the counters of the stream after its warm-up are added to
+            # its last query, which is held back until the stream finished
+            stream_snapshot, held_metric = None, None
+
+            for iteration, num_query, query_id in self.iterate_stream(sequence, stream_id):
+                pretext = self.make_pretext(stream_id, iteration, num_query, num_queries, query_id)
+
+                if query_id in self.config.get('ignore', []):
+                    if not Streams.is_warmup(iteration):
+                        LOG.info(f'ignoring {pretext}.')
+                        reporting_queue.put(Streams.make_ignored_metric(
+                            stream_id, query_id, timeout, iteration))
+                else:
+                    LOG.info(f'running  {pretext}.')
+                    query_snapshot = None
+                    if io_stats and not Streams.is_warmup(iteration):
+                        if self.io_stats == 'query':
+                            query_snapshot = io_stats.snapshot()
+                        elif stream_snapshot is None:
+                            stream_snapshot = io_stats.snapshot()
+                    timing, query_result, plan = self._run_query(
+                        stream_id, query_id, session, iteration)
+                    runtime = timing.stop - timing.start
+
+                    LOG.info(f'finished {pretext}: {runtime:.2f}s {timing.status.name}')
+                    if Streams.is_warmup(iteration):
+                        continue
+
+                    query_metric = Streams.make_query_metric(
+                        stream_id, query_id, timing, query_result, plan, timeout, iteration,
+                        io_stats.delta(query_snapshot) if self.io_stats == 'query' else None)
+                    if self.io_stats == 'stream':
+                        held_metric, query_metric = query_metric, held_metric
+                    if query_metric:
+                        self._report_metric(reporting_queue, deferred_metrics, query_metric)
+
+            if held_metric:
+                held_metric.io_stats = io_stats.delta(stream_snapshot)
+                self._report_metric(reporting_queue, deferred_metrics, held_metric)
+
+        if deferred_metrics:
+            self._add_deferred_plans(stream_id, deferred_metrics)
+            for query_metric in deferred_metrics:
+                reporting_queue.put(query_metric)
+
+    def _add_deferred_plans(self, stream_id, query_metrics):
+        LOG.info(f'explaining {len(query_metrics)} queries of stream {stream_id}.')
+        sqls = [self.get_query_sql(stream_id, metric.query_id, metric.iteration)
+                for metric in query_metrics]
+        plans = self.db.explain_queries(sqls, self.config.get('timeout', 0))
+        for query_metric, plan in zip(query_metrics, plans):
+            query_metric.plan = plan
 
     @staticmethod
     def parse_timeout(timeout):
@@ -182,3 +525,34 @@ class Streams:
             return int(tm) * valid_units.get(unit, 1) // 1000
 
         return None
+
+
+class StreamsAgentJob(AgentJob):
+    """The query streams of one agent, reported to the coordinator."""
+    def __init__(self, args, benchmark, completed):
+        self.args = args
+        self.benchmark = benchmark
+        self.completed = completed
+
+    def run(self, queue, stop):
+        streams = Streams(self.args, self.benchmark, keep_run_dir=False)
+        streams.completed = self.completed
+        with Manager() as manager:
+            # stop is only set in this process, the streams may run in others
+            streams.stop = manager.Event()
+            done = threading.Event()
+            forwarder = threading.Thread(
+                target=StreamsAgentJob._forward_stop, args=(stop, streams.stop, done))
+            forwarder.start()
+            try:
+                streams.run_streams(queue)
+            finally:
+                done.set()
+                forwarder.join()
+
+    @staticmethod
+    def _forward_stop(stop, shared_stop, done):
+        while not done.is_set():
+            if stop.wait(POLL_INTERVAL):
+                shared_stop.set()
+                return
@@ -0,0 +1,156 @@
+import argparse
+import logging
+import os
+import random
+
+from itertools import product
+
+import numpy as np
+import pandas
+import yaml
+
+from natsort import index_natsorted, order_by_index
+from tabulate import tabulate
+
+from .db import ConfigNotAppliedException
+from .journal import RunJournal
+from .streams import Streams
+
+LOG = logging.getLogger()
+
+SEARCHES = ('grid', 'random')
+
+
+def load_grid(sweep_file):
+    """The settings to sweep, a mapping of each setting to the list of values to try."""
+    with open(sweep_file, 'r') as grid_file:
+        grid = yaml.load(grid_file, Loader=yaml.Loader)
+
+    if not isinstance(grid, dict) or not grid:
+        raise ValueError(f'{sweep_file} has to map settings to lists of values')
+    return {key: values if isinstance(values, list) else [values] for key, values in grid.items()}
+
+
+def grid_configs(grid):
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in product(*grid.values())]
+
+
+def random_configs(grid, budget, seed=0):
+    """budget distinct configurations drawn from the grid, without enumerating it."""
+    keys = list(grid)
+    sizes = [len(grid[key]) for key in keys]
+    num_configs = int(np.prod(sizes))
+    configs = []
+    for index in random.Random(seed).sample(range(num_configs), min(budget, num_configs)):
+        config = {}
+        for key, size in zip(reversed(keys), reversed(sizes)):
+            index, value_index = divmod(index, size)
+            config[key] = grid[key][value_index]
+        configs.append({key: config[key] for key in keys})
+    return configs
+
+
+def make_configs(grid, search='grid', budget=None, seed=0):
+    if search == 'random':
+        return random_configs(grid, budget or len(grid_configs(grid)), seed)
+    configs = grid_configs(grid)
+    return configs[:budget] if budget else configs
+
+
+def config_label(config):
+    return ', '.join(f'{key}={value}' for key, value in config.items())
+
+
+def summarize(runs):
+    """
+    The best configuration per query and the configurations ranked by the sum of their
+    median query runtimes. runs are (config, results DataFrame) pairs, queries that did not
+    finish with OK in every configuration are left out of the ranking so that all sums cover
+    the same queries.
+    """
+    medians = {}
+    for config, df in runs:
+        ok_df = df[df['status'] == 'OK']
+        medians[config_label(config)] = ok_df['runtime'].astype(float) \
+            .groupby(ok_df['query_id']).median()
+    medians = pandas.DataFrame(medians)
+
+    per_query = pandas.DataFrame({
+        'query_id': medians.index,
+        'best_config': medians.idxmin(axis=1).values,
+        'best_median': medians.min(axis=1).values,
+        'worst_median': medians.max(axis=1).values
+    }).dropna(subset=['best_median'])
+    per_query['speedup'] = per_query['worst_median'] / per_query['best_median']
+    index_sort = index_natsorted(per_query['query_id'])
+    per_query = per_query.reindex(index=order_by_index(per_query.index, index_sort)) \
+        .reset_index(drop=True)
+
+    complete = medians.dropna()
+    overall = pandas.DataFrame({
+        'config': medians.columns,
+        'queries_ok': medians.count().values,
+        'total_median': complete.sum().values
+    }).sort_values('total_median', kind='stable').reset_index(drop=True)
+    return per_query, overall
+
+
+class Sweep:
+    """
+    Runs the streams once per configuration of a grid of database settings. Each configuration
+    is applied on top of the dbconfig of the benchmark config with ALTER SYSTEM and a reload,
+    so only settings that do not require a restart can be swept. Configurations whose settings
+    do not take effect are skipped.
+    """
+    def __init__(self, args, benchmark):
+        self.args = args
+        self.benchmark = benchmark
+        self.configs = make_configs(load_grid(args.sweep), args.sweep_search, args.sweep_budget,
+                                    args.sweep_seed)
+        self.csv_root, self.csv_ext = os.path.splitext(args.csv_file)
+        self.csv_ext = self.csv_ext or '.csv'
+
+    def make_streams(self, index, config, run_dir):
+        run_args = argparse.Namespace(**vars(self.args))
+        run_args.csv_file = f'{self.csv_root}_sweep{index}{self.csv_ext}'
+        streams = Streams(run_args, self.benchmark,
+                          RunJournal(os.path.join(run_dir, f'sweep{index}')))
+        streams.config['dbconfig'] = {**(streams.config.get('dbconfig') or {}), **config}
+        return streams
+
+    def run(self):
+        run_dir = RunJournal.make_run_dir('results')
+        runs = []
+        for index, config in enumerate(self.configs):
+            LOG.info(f'sweep configuration {index + 1}/{len(self.configs)}: '
+                     f'{config_label(config)}')
+            streams = self.make_streams(index, config, run_dir)
+            try:
+                streams.run()
+            except ConfigNotAppliedException as e:
+                LOG.error(f'skipping sweep configuration {config_label(config)}: {e}')
+                continue
+            if streams.reporting.df is not None:
+                runs.append((config, streams.reporting.df))
+
+        if not runs:
+            LOG.warning('No configuration of the sweep ran any queries.')
+            return
+
+        self.report(*summarize(runs))
+
+    def report(self, per_query, overall):
+        if 'print' in self.args.output:
+            print('\nBest configuration per query (median runtimes in seconds):')
+            print(tabulate(per_query, headers='keys', tablefmt='github', floatfmt='.2f',
+                           showindex=False))
+            print('\nConfigurations by the sum of the median runtimes of the queries that '
+                  'succeeded in all of them:')
+            print(tabulate(overall, headers='keys', tablefmt='github', floatfmt='.2f',
+                           showindex=False))
+
+        if 'csv' in self.args.output:
+            per_query.to_csv(f'{self.csv_root}_sweep_queries{self.csv_ext}', sep=';',
+                             index=False)
+            overall.to_csv(f'{self.csv_root}_sweep{self.csv_ext}', sep=';', index=False)
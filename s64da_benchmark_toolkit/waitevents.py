@@ -0,0 +1,138 @@
+import logging
+import os
+import queue
+import re
+import time
+
+from collections import Counter
+from multiprocessing import Event, Process, Queue
+
+import pandas
+
+from natsort import index_natsorted, order_by_index
+from tabulate import tabulate
+
+from .dbconn import DBConn
+
+LOG = logging.getLogger()
+
+TAG_PATTERN = re.compile(r'/\* s64da stream=(\S+) query=(\S+) \*/')
+CPU = 'CPU'
+
+# parallel workers are attributed to their leader's query, pg_stat_activity.leader_pid
+# only exists since PostgreSQL 13, before the workers show the leader's query text themselves
+SAMPLE_SQL = '''
+SELECT coalesce(leader.query, activity.query), activity.wait_event_type, activity.wait_event
+FROM pg_stat_activity activity
+LEFT JOIN pg_stat_activity leader ON leader.pid = {leader_pid}
+WHERE activity.state = 'active' AND activity.pid <> pg_backend_pid()
+AND coalesce(leader.query, activity.query) LIKE '%/* s64da stream=%'
+'''
+
+WAIT_EVENT_COLUMNS = ('stream_id', 'query_id', 'wait_event', 'samples', 'seconds')
+
+
+def tag_query(sql, stream_id, query_id):
+    """Prefixes the query with a comment that identifies it in pg_stat_activity."""
+    return f'/* s64da stream={stream_id} query={query_id} */\n{sql}'
+
+
+def parse_tag(query_text):
+    match = TAG_PATTERN.search(query_text or '')
+    return match.groups() if match else None
+
+
+def make_wait_event(wait_event_type, wait_event):
+    # an active backend that does not wait is running on the CPU, or waiting for something
+    # that has no wait event
+    return f'{wait_event_type}:{wait_event}' if wait_event_type else CPU
+
+
+class WaitEventSampler:
+    """
+    Polls pg_stat_activity on a process of its own and counts the wait events of the backends
+    running tagged queries, including their parallel workers, per stream and query. Each
+    sample of a backend stands for the sampling interval, so the seconds of a query are
+    summed up over its backends.
+    """
+    def __init__(self, dsn, interval):
+        self.dsn = dsn
+        self.interval = interval
+        self.stop_event = Event()
+        self.results = Queue()
+        self.process = None
+
+    def start(self):
+        self.process = Process(target=self.run, daemon=True)
+        self.process.start()
+
+    def stop(self, timeout=30):
+        """Stops sampling and returns the wait events as a DataFrame of WAIT_EVENT_COLUMNS."""
+        self.stop_event.set()
+        try:
+            counts = self.results.get(timeout=timeout)
+        except queue.Empty:
+            LOG.warning('The wait event sampler did not report any samples.')
+            counts = {}
+        self.process.join()
+        return self.make_frame(counts)
+
+    def run(self):
+        counts = Counter()
+        try:
+            with DBConn(self.dsn) as conn:
+                conn.cursor.execute("SELECT current_setting('server_version_num')::int")
+                leader_pid = 'activity.leader_pid' if conn.cursor.fetchone()[0] >= 130000 \
+                    else 'NULL'
+                sample_sql = SAMPLE_SQL.format(leader_pid=leader_pid)
+
+                next_sample = time.time()
+                while not self.stop_event.is_set():
+                    conn.cursor.execute(sample_sql)
+                    self.count(counts, conn.cursor.fetchall())
+                    next_sample += self.interval
+                    self.stop_event.wait(max(next_sample - time.time(), 0))
+
+        except Exception:
+            LOG.exception('Sampling the wait events failed')
+
+        finally:
+            self.results.put(dict(counts))
+
+    @staticmethod
+    def count(counts, rows):
+        for query_text, wait_event_type, wait_event in rows:
+            tag = parse_tag(query_text)
+            if tag:
+                counts[(*tag, make_wait_event(wait_event_type, wait_event))] += 1
+
+    def make_frame(self, counts):
+        frame = pandas.DataFrame([
+            (stream_id, query_id, wait_event, samples, samples * self.interval)
+            for (stream_id, query_id, wait_event), samples in counts.items()
+        ], columns=WAIT_EVENT_COLUMNS)
+        index_sort = index_natsorted(zip(frame['stream_id'], frame['query_id']))
+        return frame.reindex(index=order_by_index(frame.index, index_sort)) \
+            .reset_index(drop=True)
+
+
+def summarize(wait_events, top=5):
+    """The top wait events of each query over all streams, with their share of its samples."""
+    summary = wait_events.groupby(['query_id', 'wait_event'], as_index=False)['seconds'].sum()
+    summary['share'] = summary['seconds'] / summary.groupby('query_id')['seconds'].transform('sum')
+    summary = summary.sort_values('seconds', ascending=False).groupby('query_id').head(top)
+    index_sort = index_natsorted(summary['query_id'])
+    summary = summary.reindex(index=order_by_index(summary.index, index_sort))
+    return summary.reset_index(drop=True)[['query_id', 'wait_event', 'seconds', 'share']]
+
+
+def report(wait_events, output, csv_file):
+    """Prints the summary and saves the samples next to the results CSV, depending on output."""
+    if 'print' in output:
+        print('\nTop wait events per query (seconds summed over the backends of all streams):')
+        print(tabulate(summarize(wait_events), headers='keys', tablefmt='github', floatfmt='.2f',
+                       showindex=False))
+
+    if 'csv' in output and csv_file:
+        csv_root, csv_ext = os.path.splitext(csv_file)
+        wait_events.to_csv(f'{csv_root}_wait_events{csv_ext or ".csv"}', sep=';', index=False)
@@ -0,0 +1,9 @@
+import pytest
+
+from s64da_benchmark_toolkit.journal import RunJournal
+
+
+@pytest.fixture(autouse=True)
+def run_dir(monkeypatch, tmp_path):
+    """Keeps the journals and event logs of the runs in the tests out of results/."""
+    monkeypatch.setattr(RunJournal, 'make_run_dir', lambda results_dir: str(tmp_path / 'run'))
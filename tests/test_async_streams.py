@@ -0,0 +1,219 @@
+import asyncio
+import threading
+from collections import namedtuple
+
+import asyncpg
+import pytest
+
+from s64da_benchmark_toolkit import async_streams, db
+from s64da_benchmark_toolkit.events import EventReader
+from tests.test_streams import args, benchmark, reporting_queue
+from s64da_benchmark_toolkit.streams import Streams
+
+DSN = 'postgresql://postgres@nowhere:1234/foodb'
+
+Attribute = namedtuple('Attribute', ['name'])
+
+
+class FakeStatement:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def get_attributes(self):
+        return [Attribute('a'), Attribute('b')]
+
+    async def fetch(self):
+        if self.conn.error:
+            raise self.conn.error
+        return [(1, 2), (3, 4)]
+
+
+class FakeConnection:
+    def __init__(self, error=None):
+        self.error = error
+        self.prepared = []
+        self.executed = []
+        self.statements = []
+        self.explain_output = '[{"Plan": {}, "Planning Time": 100.0}]'
+        self.closed = False
+
+    def add_log_listener(self, callback):
+        pass
+
+    def remove_log_listener(self, callback):
+        pass
+
+    async def prepare(self, sql):
+        self.prepared.append(sql)
+        self.statements.append(sql)
+        return FakeStatement(self)
+
+    async def execute(self, sql):
+        self.executed.append(sql)
+        self.statements.append(sql)
+
+    async def fetchval(self, sql):
+        self.statements.append(sql)
+        return self.explain_output
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_connect(mocker):
+    def make(conn):
+        async def connect(dsn, server_settings):
+            assert server_settings == {'statement_timeout': '0'}
+            return conn
+        return mocker.patch('asyncpg.connect', side_effect=connect)
+    return make
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_async_db_run_query_ok(fake_connect):
+    conn = FakeConnection()
+    fake_connect(conn)
+
+    timing, query_result, plan = run(async_streams.AsyncDB(DSN).run_query('SELECT 1', 0))
+
+    assert timing.status == db.Status.OK
+    assert query_result == (['a', 'b'], [(1, 2), (3, 4)])
+    assert plan is None
+    assert conn.prepared == ['SELECT 1']
+    assert conn.closed
+
+
+def test_async_db_run_query_plan_once(fake_connect):
+    fake_connect(FakeConnection())
+    async_db = async_streams.AsyncDB(DSN, db.PlanCapture('once'))
+
+    _, _, plan = run(async_db.run_query('SELECT 1', 0))
+    assert '"Plan"' in plan
+    assert async_db.plan_capture.lookup('SELECT 1') == (False, plan)
+
+
+def test_async_db_run_query_timeout(fake_connect):
+    conn = FakeConnection(error=asyncpg.exceptions.QueryCanceledError('Timeout'))
+    fake_connect(conn)
+
+    timing, query_result, _ = run(async_streams.AsyncDB(DSN).run_query('SELECT 1', 0))
+
+    assert timing.status == db.Status.TIMEOUT
+    assert query_result is None
+    assert conn.closed
+
+
+def test_make_shards(args, benchmark):
+    executor = async_streams.AsyncStreamsExecutor(Streams(args, benchmark), 2)
+    assert executor.make_shards((1, 2, 3)) == [(1, 3), (2,)]
+
+    executor = async_streams.AsyncStreamsExecutor(Streams(args, benchmark), 4)
+    assert executor.make_shards((1, 2)) == [(1,), (2,)]
+
+
+def test_run_stream(mocker, fake_connect, args, benchmark, reporting_queue):
+    fake_connect(FakeConnection())
+    args.timeout = '0'
+    s = Streams(args, benchmark)
+    s.config['ignore'] = [4]
+    mocker.patch.object(s, 'get_stream_sequence', return_value=(1, 2, 4))
+    mocker.patch.object(s, 'read_sql_file', return_value='SELECT 1')
+
+    async_streams.AsyncStreamsExecutor(s).run(reporting_queue, (0, 7))
+
+    assert sorted(reporting_queue.stream_ids) == [0, 0, 0, 7, 7, 7]
+    statuses = [metric.status for metric in reporting_queue.values]
+    assert statuses.count('OK') == 4
+    assert statuses.count('IGNORED') == 2
+    # written by the event writer thread, which the executor waits for
+    logged = [(e['stream_id'], e['query_id'], e['event'])
+              for e in EventReader(s.events.path).read()]
+    assert [event for event in logged if event[0] == 7] == [
+        (7, 1, 'start'), (7, 1, 'finish'), (7, 2, 'start'), (7, 2, 'finish')]
+    assert len(logged) == 8
+
+
+def test_run_stream_reports_off_the_event_loop(mocker, fake_connect, args, benchmark,
+                                               reporting_queue):
+    fake_connect(FakeConnection())
+    args.timeout = '0'
+    s = Streams(args, benchmark)
+    mocker.patch.object(s, 'get_stream_sequence', return_value=(1, 2))
+    mocker.patch.object(s, 'read_sql_file', return_value='SELECT 1')
+    threads = []
+    put = reporting_queue.put
+    mocker.patch.object(reporting_queue, 'put', side_effect=lambda value: (
+        threads.append(threading.get_ident()), put(value)))
+
+    async_streams.AsyncStreamsExecutor(s).run(reporting_queue, (0,))
+
+    # a put on a shared queue may block, so it is done by the writer thread
+    assert len(reporting_queue.values) == 2
+    assert threading.get_ident() not in threads
+
+
+def test_run_stream_session(mocker, fake_connect, args, benchmark, reporting_queue):
+    conn = FakeConnection()
+    connect_mock = fake_connect(conn)
+    args.timeout = '0'
+    args.connection_mode = 'session'
+    s = Streams(args, benchmark)
+    mocker.patch.object(s, 'get_stream_sequence', return_value=(1, 2, 3))
+    mocker.patch.object(s, 'read_sql_file', return_value='SELECT 1')
+
+    async_streams.AsyncStreamsExecutor(s).run(reporting_queue, (0,))
+
+    assert connect_mock.call_count == 1
+    assert conn.executed == ['CLOSE ALL; RESET ALL'] * 3
+    assert len(reporting_queue.values) == 3
+    assert conn.closed
+
+
+def test_async_db_run_query_prepared(fake_connect):
+    conn = FakeConnection()
+    fake_connect(conn)
+    async_db = async_streams.AsyncDB(DSN, prepared_statements=True)
+
+    async def run_twice():
+        async with async_db.session(0) as session:
+            first = await async_db.run_query('SELECT 1', 0, session=session)
+            second = await async_db.run_query('SELECT 1', 0, session=session)
+        return first[0], second[0]
+
+    first, second = run(run_twice())
+
+    assert first.planning == 0.1
+    assert second.planning == 0
+    # the statement is planned by the EXPLAIN before its first execution
+    assert conn.statements == [
+        'CLOSE ALL; RESET ALL',
+        'PREPARE benchmark_query_1 AS \nSELECT 1\n',
+        'EXPLAIN (SUMMARY, FORMAT JSON) EXECUTE benchmark_query_1',
+        'EXECUTE benchmark_query_1',
+        'CLOSE ALL; RESET ALL',
+        'EXECUTE benchmark_query_1',
+    ]
+
+
+def test_async_db_run_query_prepared_without_planning_time(fake_connect):
+    conn = FakeConnection()
+    conn.explain_output = '[{"Plan": {}}]'
+    fake_connect(conn)
+    async_db = async_streams.AsyncDB(DSN, prepared_statements=True)
+
+    async def run_once():
+        async with async_db.session(0) as session:
+            return await async_db.run_query('SELECT 1', 0, session=session)
+
+    timing, _, _ = run(run_once())
+
+    assert timing.status == db.Status.OK
+    assert timing.planning is None
@@ -0,0 +1,115 @@
+import pytest
+
+from s64da_benchmark_toolkit import compare
+
+
+def write_results_csv(path, runtimes, status='OK'):
+    with open(path, 'w') as csv_file:
+        csv_file.write(';stream_id;query_id;timestamp_start;timestamp_stop;runtime;status\n')
+        for index, (stream_id, query_id, runtime) in enumerate(runtimes):
+            csv_file.write(f'{index};{stream_id};{query_id};1970-01-01;1970-01-01;{runtime};'
+                           f'{status}\n')
+    return str(path)
+
+
+def test_mann_whitney_p():
+    # exact: 2 of the 20 orderings of 3 and 3 values are as extreme
+    assert compare.mann_whitney_p([1, 2, 3], [4, 5, 6]) == pytest.approx(0.1)
+    assert compare.mann_whitney_p([1, 2, 3, 4], [5, 6, 7, 8]) == pytest.approx(2 / 70)
+    assert compare.mann_whitney_p([1, 3, 5, 7], [2, 4, 6, 8]) == pytest.approx(0.6857, abs=1e-4)
+    # ties use the normal approximation
+    assert compare.mann_whitney_p([1, 1, 1], [1, 1, 1]) == 1.0
+    assert compare.mann_whitney_p([1] * 10 + [2] * 10, [3] * 20) < 0.001
+
+
+def test_compare_samples():
+    regression = compare.compare_samples([1.0, 1.1, 0.9, 1.0], [2.0, 2.1, 1.9, 2.2], 'runtime')
+    assert regression['verdict'] == 'regression'
+    assert regression['change'] == pytest.approx(1.05)
+    assert regression['ci_low'] > 1
+
+    # fewer transactions per second are worse
+    tps = compare.compare_samples([100, 101, 99, 100], [50, 51, 49, 52], 'tps')
+    assert tps['verdict'] == 'regression'
+    assert tps['change'] == pytest.approx(0.495)
+
+    # three repetitions can not reach alpha=0.05, the bootstrap interval excludes 1
+    assert compare.compare_samples([1, 1.1, 0.9], [2, 2.1, 1.9], 'runtime')['verdict'] == \
+        'unchanged'
+    assert compare.compare_samples([1, 1.1, 0.9], [2, 2.1, 1.9], 'runtime',
+                                   test='bootstrap')['verdict'] == 'regression'
+
+    # single samples are judged by the threshold alone
+    untested = compare.compare_samples([2.0], [1.0], 'runtime')
+    assert (untested['verdict'], untested['p_value']) == ('improvement', None)
+    assert compare.compare_samples([1.0], [1.04], 'runtime')['verdict'] == 'unchanged'
+
+
+def test_compare_runs_pinned_versions(monkeypatch):
+    # Python 3.6 has no math.comb and pandas 1.0 no sort_values(key=...)
+    monkeypatch.delattr(compare.math, 'comb', raising=False)
+    sort_values = compare.pandas.DataFrame.sort_values
+
+    def sort_values_without_key(self, *args, **kwargs):
+        if 'key' in kwargs:
+            raise TypeError("sort_values() got an unexpected keyword argument 'key'")
+        return sort_values(self, *args, **kwargs)
+
+    monkeypatch.setattr(compare.pandas.DataFrame, 'sort_values', sort_values_without_key)
+    baseline = compare.pandas.DataFrame([
+        ('results', query_id, '1', 'runtime', 1.0 + 0.01 * repetition)
+        for repetition in range(4) for query_id in ('2', '10', '3')
+    ], columns=compare.SAMPLE_COLUMNS)
+    slower = baseline.assign(value=baseline['value'].where(
+        baseline['query_id'] != '3', baseline['value'] * 3))
+
+    comparisons = compare.compare_runs([('baseline', baseline), ('slower', slower)])
+
+    assert comparisons[['query_id', 'verdict']].values.tolist() == [
+        ['3', 'regression'], ['2', 'unchanged'], ['10', 'unchanged']]
+    assert comparisons.loc[0, 'p_value'] == pytest.approx(2 / 70)
+
+
+def test_load_htap_dir(tmp_path):
+    (tmp_path / 'olap.csv').write_text(
+        '2020-01-01 00:00:00.1, 0, 1, 5, OK, 1.50\n'
+        '2020-01-01 00:00:01.1, 0, 1, 6, TIMEOUT, 9.00\n')
+    (tmp_path / 'oltp.csv').write_text(
+        '2020-01-01 00:00:00.1, new_order, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0\n'
+        '2020-01-01 00:00:01.1, new_order, 10, 10, 0, 10, 10, 10, 10, 5, 1, 5, 9\n')
+
+    samples = compare.load_run(str(tmp_path))
+
+    assert samples.values.tolist() == [
+        ['olap', '5', '0', 'runtime', 1.5],
+        ['oltp', 'new_order', 'all', 'tps', 10.0],
+        ['oltp', 'new_order', 'all', 'latency', 5.0]
+    ]
+
+    with pytest.raises(ValueError):
+        compare.load_htap_dir(str(tmp_path / 'empty'))
+
+
+def test_main(tmp_path, capsys):
+    baseline = write_results_csv(tmp_path / 'baseline.csv', [
+        (stream_id, query_id, 1.0 + 0.01 * repetition)
+        for repetition in range(4) for stream_id in (1, 2) for query_id in (2, 10)])
+    same = write_results_csv(tmp_path / 'same.csv', [
+        (stream_id, query_id, 1.0 + 0.01 * repetition)
+        for repetition in range(4) for stream_id in (1, 2) for query_id in (2, 10)])
+    slower = write_results_csv(tmp_path / 'slower.csv', [
+        (stream_id, query_id, (2.0 if query_id == 10 else 1.0) + 0.01 * repetition)
+        for repetition in range(4) for stream_id in (1, 2) for query_id in (2, 10)])
+
+    assert compare.main([baseline, same]) == 0
+    csv_file = str(tmp_path / 'comparison.csv')
+    assert compare.main([baseline, same, slower, '--csv-file', csv_file]) == 1
+
+    output = capsys.readouterr().out
+    assert '2 regressions, 0 improvements, 6 unchanged' in output
+    comparisons = compare.pandas.read_csv(csv_file, sep=';')
+    assert comparisons[['run', 'query_id', 'stream_id', 'verdict']].values.tolist()[:2] == [
+        [slower, 10, 1, 'regression'], [slower, 10, 2, 'regression']]
+
+    assert compare.main([baseline, slower, '--pool-streams']) == 1
+    assert '1 regressions' in capsys.readouterr().out
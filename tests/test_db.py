@@ -1,4 +1,5 @@
 
+import os
 from unittest.mock import call
 
 import psycopg2
@@ -48,6 +49,26 @@ def test_db_apply_config(mocker):
     ])
 
 
+def test_db_get_unapplied_settings():
+    rows = [('work_mem', '65536', 'kB', '64MB', False), ('jit', 'on', None, 'on', False),
+            ('shared_buffers', '16384', '8kB', '128MB', True)]
+
+    assert db.DB.get_unapplied_settings({'work_mem': '64MB', 'jit': True}, rows) == {}
+    assert db.DB.get_unapplied_settings(
+        {'work_mem': '256MB', 'JIT': 'off', 'shared_buffers': '1GB', 'foo': 1}, rows) == {
+        'work_mem': 'is 64MB instead of 256MB', 'JIT': 'is on instead of off',
+        'shared_buffers': 'requires a restart', 'foo': 'is unknown'}
+
+
+def test_db_check_config(mocker):
+    mocker.patch.object(db.DB, 'CONFIG_RELOAD_TIMEOUT', 0)
+    mock_cursor = get_mocked_cursor(mocker)
+    mock_cursor.fetchall.return_value = [('shared_buffers', '16384', '8kB', '128MB', True)]
+
+    with pytest.raises(db.ConfigNotAppliedException, match='shared_buffers requires a restart'):
+        db.DB(DSN).check_config({'shared_buffers': '1GB'})
+
+
 def test_db_reset_config(mocker):
     mock_cursor = get_mocked_cursor(mocker)
     db.DB(DSN).reset_config()
@@ -64,6 +85,8 @@ def test_db_run_query_ok(no_plan, mocker):
 
     assert result.status == db.Status.OK
     assert (result.stop - result.start) > 0
+    assert result.first_row >= 0 and result.fetch >= 0
+    assert result.first_row + result.fetch <= result.stop - result.start
     assert ([], mock_cursor.fetchall()) == query_output
     mock_cursor.execute.assert_called_once_with('SELECT 1')
 
@@ -94,4 +117,142 @@ def test_get_explain_output_json_error(mocker):
     mocker_json = mocker.patch('json.dumps')
     mocker_json.side_effect = json.decoder.JSONDecodeError('Test invalid explain plan', '', 255)
     plan = db.DB(DSN).get_explain_output(mocker_conn, 'EXPLAIN JSON SELECT 1')
-    assert plan ==  f'Explain Output failed with a JSON Decode Error: Test invalid explain plan: line 1 column 256 (char 255)'
\ No newline at end of file
+    assert plan ==  f'Explain Output failed with a JSON Decode Error: Test invalid explain plan: line 1 column 256 (char 255)'
+
+def test_db_run_query_session(no_plan, mocker):
+    psycopg2_connect = mocker.patch('psycopg2.connect')
+    mock_cursor = psycopg2_connect.return_value.cursor.return_value
+    some_db = db.DB(DSN)
+
+    with some_db.session(0) as session:
+        first, _, _ = some_db.run_query('SELECT 1', 0, session=session)
+        second, _, _ = some_db.run_query('SELECT 2', 0, session=session)
+
+    psycopg2_connect.assert_called_once()
+    assert first.connect > 0
+    assert second.connect == 0
+    mock_cursor.execute.assert_has_calls([
+        call('DISCARD ALL'), call('SELECT 1'), call('DISCARD ALL'), call('SELECT 2')
+    ])
+
+
+def test_plan_capture_off():
+    plan_capture = db.PlanCapture()
+    assert plan_capture.lookup('SELECT 1') == (False, None)
+
+
+def test_plan_capture_once():
+    plan_capture = db.PlanCapture('once')
+    assert plan_capture.lookup('SELECT 1') == (True, None)
+    plan_capture.store('SELECT 1', 'plan')
+    assert plan_capture.lookup('SELECT 1') == (False, 'plan')
+    assert plan_capture.lookup('SELECT 2') == (True, None)
+
+
+def test_plan_capture_sample():
+    plan_capture = db.PlanCapture('sample', sample_interval=3)
+    assert [plan_capture.lookup('SELECT 1')[0] for _ in range(7)] == \
+        [True, False, False, True, False, False, True]
+
+
+def test_db_run_query_no_extra_explain(mocker):
+    mock_cursor = get_mocked_cursor(mocker)
+    db.DB(DSN).run_query('SELECT 1', 0)
+
+    mock_cursor.execute.assert_called_once_with('SELECT 1')
+
+
+def test_db_run_query_stream_to_csv(no_plan, mocker, tmp_path):
+    mock_conn = get_mocked_conn(mocker)
+    mock_cursor = mock_conn.cursor.return_value
+    mock_cursor.description = [('a',), ('b',)]
+    mock_cursor.fetchmany.side_effect = [[(1, 2), (3, 4)], [(5, 6)], []]
+    result_file = str(tmp_path / 'query_results' / '0_1.csv')
+
+    some_db = db.DB(DSN, result_mode='stream', fetch_batch_size=2)
+    result, query_output, _ = some_db.run_query('SELECT 1', 0, result_file=result_file)
+
+    assert result.status == db.Status.OK
+    assert query_output.path == result_file
+    assert query_output.num_rows == 3
+    with open(result_file) as csv_file:
+        content = csv_file.read()
+    assert content.split() == ['a,b', '1,2', '3,4', '5,6']
+    assert query_output.num_bytes == len(content.replace('\n', '\r\n'))
+    mock_conn.cursor.assert_any_call('result-stream-cursor')
+    mock_cursor.fetchmany.assert_called_with(2)
+
+
+def test_db_run_query_discard(no_plan, mocker):
+    mock_cursor = get_mocked_cursor(mocker)
+
+    def copy_expert(sql, sink):
+        sink.write(b'1\ta\n')
+        sink.write(b'2\tb\n')
+
+    mock_cursor.copy_expert.side_effect = copy_expert
+
+    result, query_output, _ = db.DB(DSN, result_mode='discard').run_query('SELECT 1;\n', 0)
+
+    assert result.status == db.Status.OK
+    assert query_output == db.SpilledResult(path=os.devnull, num_rows=2, num_bytes=8)
+    mock_cursor.copy_expert.assert_called_once()
+    assert mock_cursor.copy_expert.call_args[0][0] == 'COPY (\nSELECT 1\n) TO STDOUT'
+    mock_cursor.fetchall.assert_not_called()
+
+
+def test_db_run_query_prepared(no_plan, mocker):
+    psycopg2_connect = mocker.patch('psycopg2.connect')
+    mock_cursor = psycopg2_connect.return_value.cursor.return_value
+    mock_cursor.fetchone.return_value = [[{'Plan': {}, 'Planning Time': 250.0}]]
+    mock_cursor.description = [('a',)]
+    some_db = db.DB(DSN, prepared_statements=True)
+
+    with some_db.session(0) as session:
+        first, _, _ = some_db.run_query('SELECT 1;', 0, session=session)
+        second, _, _ = some_db.run_query('SELECT 1;', 0, session=session)
+
+    assert first.planning == 0.25
+    assert second.planning == 0
+    assert first.execution is not None and second.execution is not None
+    reset = call('CLOSE ALL; RESET ALL; DISCARD TEMP')
+    # the statement is planned by the EXPLAIN before its first execution
+    assert mock_cursor.execute.mock_calls == [
+        reset,
+        call('PREPARE benchmark_query_1 AS \nSELECT 1\n'),
+        call('EXPLAIN (SUMMARY, FORMAT JSON) EXECUTE benchmark_query_1'),
+        call('EXECUTE benchmark_query_1'),
+        reset,
+        call('EXECUTE benchmark_query_1'),
+    ]
+
+
+def test_db_run_query_prepared_without_planning_time(no_plan, mocker):
+    psycopg2_connect = mocker.patch('psycopg2.connect')
+    mock_cursor = psycopg2_connect.return_value.cursor.return_value
+    # before PG13 EXPLAIN (SUMMARY) EXECUTE does not report the planning time
+    mock_cursor.fetchone.return_value = [[{'Plan': {}}]]
+    mock_cursor.description = [('a',)]
+    some_db = db.DB(DSN, prepared_statements=True)
+
+    with some_db.session(0) as session:
+        timing, _, _ = some_db.run_query('SELECT 1;', 0, session=session)
+
+    assert timing.status == db.Status.OK
+    assert timing.planning is None
+
+
+def test_db_run_query_timeout_has_no_fetch_timing(no_plan, mocker):
+    mock_cursor = get_mocked_cursor(mocker)
+    mock_cursor.execute.side_effect = psycopg2.extensions.QueryCanceledError('Timeout')
+
+    result, _, _ = db.DB(DSN).run_query('SELECT 1', 0)
+
+    assert result.status == db.Status.TIMEOUT
+    assert (result.first_row, result.fetch) == (None, None)
+
+
+def test_estimate_wire_bytes():
+    assert db.estimate_wire_bytes(None) is None
+    # 7 byte row header, 4 byte length and the text of each value
+    assert db.estimate_wire_bytes((['a', 'b'], [(12, 'abc'), (None, 'x')])) == 7 + 6 + 7 + 7 + 4 + 5
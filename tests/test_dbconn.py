@@ -1,4 +1,4 @@
-
+import threading
 import time
 
 import psycopg2
@@ -41,3 +41,103 @@ def test_dbconn_connect_fail(nosleep, mocker):
             pass
 
     assert psycopg2_connect.call_count == num_retries
+
+
+def test_connect_backoff(mocker):
+    mocker.patch('psycopg2.connect', side_effect=psycopg2.Error('Just an error...'))
+    sleep_mock = mocker.patch('time.sleep')
+    mocker.patch('random.uniform', side_effect=lambda low, high: high)
+
+    conn, num_failed = dbconn.connect(DSN, num_retries=6, retry_wait=0.1, max_retry_wait=2)
+
+    assert conn is None
+    assert num_failed == 6
+    assert [call[0][0] for call in sleep_mock.call_args_list] == pytest.approx(
+        [0.1, 0.2, 0.4, 0.8, 1.6, 2.0])
+
+
+@pytest.fixture
+def pool(mocker):
+    mocker.patch('psycopg2.connect', side_effect=lambda *args, **kwargs: mocker.MagicMock(
+        closed=0, autocommit=True, notices=[]))
+    return dbconn.ConnectionPool(DSN, max_size=2)
+
+
+def test_pool_reuse(pool):
+    conn = pool.acquire()
+    pool.release(conn)
+
+    assert pool.acquire() is conn
+    conn.cursor.return_value.__enter__.return_value.execute.assert_called_once_with(
+        'DISCARD ALL')
+    stats = pool.stats()
+    assert stats['connects'] == 1
+    assert stats['reuses'] == 1
+    assert stats['connect_time_mean'] is not None
+
+
+def test_pool_discard_on_failed_reset(pool):
+    conn = pool.acquire()
+    conn.cursor.return_value.__enter__.return_value.execute.side_effect = psycopg2.Error()
+    pool.release(conn)
+
+    conn.close.assert_called_once()
+    assert pool.acquire() is not conn
+    assert pool.stats()['discarded'] == 1
+
+
+def test_pool_health_check(pool):
+    conn = pool.acquire()
+    pool.release(conn)
+    pool.health_check_interval = 0
+    conn.cursor.return_value.__enter__.return_value.execute.side_effect = psycopg2.Error()
+
+    assert pool.acquire() is not conn
+    conn.close.assert_called_once()
+
+
+def test_pool_health_check_outside_of_lock(pool):
+    conn = pool.acquire()
+    pool.release(conn)
+    pool.health_check_interval = 0
+    lock_free = []
+
+    def check_lock(sql):
+        # another thread can use the pool while the connection is checked
+        thread = threading.Thread(target=lambda: lock_free.append(
+            pool.condition.acquire(timeout=1) and pool.condition.release() is None))
+        thread.start()
+        thread.join()
+
+    conn.cursor.return_value.__enter__.return_value.execute.side_effect = check_lock
+
+    assert pool.acquire() is conn
+    assert lock_free == [True]
+
+
+def test_pool_max_size(pool):
+    first = pool.acquire()
+    pool.acquire()
+
+    assert pool.acquire(timeout=0.01) is None
+
+    pool.release(first)
+    assert pool.acquire(timeout=0.01) is first
+
+
+def test_dbconn_pooled(mocker):
+    psycopg2_connect = mocker.patch('psycopg2.connect')
+    mock_conn = psycopg2_connect.return_value
+    mock_conn.closed = 0
+
+    for _ in range(3):
+        with dbconn.DBConn(DSN, pooled=True) as conn:
+            assert conn.conn is mock_conn
+
+    psycopg2_connect.assert_called_once()
+    mock_conn.close.assert_not_called()
+    assert dbconn.get_pool(DSN) in dbconn.get_pools()
+
+    dbconn.close_pools()
+    mock_conn.close.assert_called_once()
+    assert dbconn.get_pools() == []
@@ -0,0 +1,180 @@
+import argparse
+import queue
+import threading
+import time
+
+from multiprocessing import Value
+
+import pytest
+
+from s64da_benchmark_toolkit import streams
+from s64da_benchmark_toolkit.db import Status, Timing
+from s64da_benchmark_toolkit.distributed import (
+    AUTHKEY_ENV, Agent, AgentJob, Coordinator, parse_address, read_authkey, split_range)
+
+AUTHKEY = 'secret'
+
+
+class ItemsJob(AgentJob):
+    def __init__(self, items):
+        self.items = items
+
+    def run(self, queue, stop):
+        for item in self.items:
+            queue.put(item)
+
+
+class FailingJob(AgentJob):
+    def run(self, queue, stop):
+        raise ValueError('job failed')
+
+
+class StoppedJob(AgentJob):
+    def run(self, queue, stop):
+        stop.wait(5)
+        queue.put('stopped')
+
+
+class CounterJob(AgentJob):
+    """Adds its increment to the shared counter and reports the total over all agents."""
+    def __init__(self, increment, expected_total):
+        self.increment = increment
+        self.expected_total = expected_total
+        self.total = None
+
+    def run(self, queue, stop):
+        deadline = time.time() + 5
+        while self.total != self.expected_total and time.time() < deadline:
+            time.sleep(0.01)
+        queue.put(self.total)
+
+    def take_sync_delta(self):
+        increment, self.increment = self.increment, 0.0
+        return increment
+
+    def apply_sync(self, value):
+        self.total = value
+
+
+@pytest.fixture
+def start_agents():
+    threads = []
+
+    def start(num_agents):
+        addresses = []
+        for _ in range(num_agents):
+            agent = Agent(('localhost', 0), AUTHKEY)
+            thread = threading.Thread(target=agent.serve, args=(1,), daemon=True)
+            thread.start()
+            threads.append(thread)
+            addresses.append(agent.address)
+        return addresses
+
+    yield start
+
+    for thread in threads:
+        thread.join(5)
+
+
+def test_parse_address():
+    assert parse_address('localhost:7370') == ('localhost', 7370)
+    assert parse_address('10.0.0.1:1') == ('10.0.0.1', 1)
+    with pytest.raises(ValueError):
+        parse_address('localhost')
+
+
+def test_read_authkey(monkeypatch, tmp_path):
+    monkeypatch.delenv(AUTHKEY_ENV, raising=False)
+    with pytest.raises(ValueError):
+        read_authkey()
+
+    monkeypatch.setenv(AUTHKEY_ENV, 'from-env')
+    key_file = tmp_path / 'authkey'
+    key_file.write_text('from-file\n')
+
+    assert read_authkey() == 'from-env'
+    assert read_authkey(authkey_file=str(key_file)) == 'from-file'
+    assert read_authkey('given', str(key_file)) == 'given'
+
+
+def test_split_range():
+    assert split_range(1, 5, 2) == [(1, 3), (4, 2)]
+    assert split_range(0, 4, 2) == [(0, 2), (2, 2)]
+    assert split_range(1, 1, 3) == [(1, 1), (2, 0), (2, 0)]
+
+
+def test_coordinator_gathers_items(start_agents):
+    addresses = start_agents(3)
+    results = queue.Queue()
+
+    Coordinator(addresses, AUTHKEY).run([
+        (address, ItemsJob([f'{idx}-{item}' for item in range(50)]))
+        for idx, address in enumerate(addresses)
+    ], results)
+
+    items = [results.get() for _ in range(results.qsize())]
+    assert sorted(items) == sorted(f'{idx}-{item}' for idx in range(3) for item in range(50))
+
+
+def test_coordinator_agent_failure(start_agents):
+    addresses = start_agents(2)
+
+    with pytest.raises(RuntimeError, match='job failed'):
+        Coordinator(addresses, AUTHKEY).run([
+            (addresses[0], ItemsJob([1])), (addresses[1], FailingJob())
+        ], queue.Queue())
+
+
+def test_coordinator_stop(start_agents):
+    addresses = start_agents(2)
+    results = queue.Queue()
+
+    coordinator = Coordinator(addresses, AUTHKEY)
+    coordinator.start([(address, StoppedJob()) for address in addresses], results)
+    coordinator.stop()
+    coordinator.join()
+    coordinator.check()
+
+    assert [results.get(), results.get()] == ['stopped', 'stopped']
+
+
+def test_coordinator_sync(start_agents):
+    addresses = start_agents(2)
+    results = queue.Queue()
+    shared_value = Value('d', 0)
+
+    Coordinator(addresses, AUTHKEY, shared_value).run([
+        (addresses[0], CounterJob(1.0, 3.0)), (addresses[1], CounterJob(2.0, 3.0))
+    ], results)
+
+    assert shared_value.value == 3.0
+    assert [results.get(), results.get()] == [3.0, 3.0]
+
+
+def test_run_streams_on_agents(mocker, start_agents):
+    mocker.patch('yaml.load', return_value={})
+    mocker.patch.object(streams.Streams, 'get_stream_sequence', return_value=[1, 2])
+    mocker.patch.object(streams.Streams, '_run_query', return_value=(
+        Timing(start=0.0, stop=1.0, status=Status.OK, connect=0.0), ([], []), None))
+    args = argparse.Namespace(
+        config=None, timeout='5min', dsn='postgresql://noone@nowhere:4321/nothing', streams=3,
+        stream_offset=1, output='print', csv_file='results.csv', scale_factor=None,
+        explain_analyze=False, use_server_side_cursors=False, check_correctness=False,
+        netdata_output_file=None, executor='pool', executor_processes=1,
+        connection_mode='query', plan_capture='off', plan_sample_interval=10,
+        result_mode='fetch', fetch_batch_size=10000, duration=None, warmup=0, repetitions=1,
+        arrival_rate=None, arrival_process='poisson', workers=None, scheduler='streams',
+        runtimes_csv=None, refresh=False, refresh_pairs=None, refresh_start=1,
+        generate_parameters=False, parameter_seed=0, prepared_statements=False, resume=None,
+        simulate=None, simulate_mean_runtime=1.0, simulate_time_scale=1.0, io_stats='off',
+        wait_event_interval=None,
+        agents=start_agents(2), agent_authkey=AUTHKEY, agent_authkey_file=None)
+    results = queue.Queue()
+
+    s = streams.Streams(args, streams.Benchmark(name='tpch', base_dir='foo/bar'))
+    s.run_streams(results)
+
+    query_metrics = [results.get() for _ in range(results.qsize())]
+    assert sorted((metric.stream_id, metric.query_id) for metric in query_metrics) == [
+        (1, 1), (1, 2), (2, 1), (2, 2), (3, 1), (3, 2)]
+
@@ -0,0 +1,50 @@
+import pytest
+
+from s64da_benchmark_toolkit import drivers
+
+
+def test_get_driver():
+    assert drivers.get_driver('psycopg2') is drivers.Psycopg2Driver
+
+    with pytest.raises(ValueError):
+        drivers.get_driver('odbc')
+
+
+def test_get_driver_psycopg_missing(mocker):
+    mocker.patch.object(drivers, 'psycopg', None)
+
+    with pytest.raises(ValueError, match='psycopg 3'):
+        drivers.get_driver('psycopg')
+
+
+def test_psycopg_copy_rows(mocker):
+    conn = mocker.MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.fetchall.return_value = [('id', 'int4'), ('price', 'numeric'), ('state', 'bpchar')]
+    copy = cursor.copy.return_value.__enter__.return_value
+
+    drivers.Psycopg3Driver.copy_rows(conn, 'item', [[1, 2.5, 'CA'], [2, None, 'NY']])
+
+    cursor.copy.assert_called_once_with('COPY item FROM STDIN (FORMAT BINARY)')
+    copy.set_types.assert_called_once_with(['int4', 'numeric', 'text'])
+    assert [call[0][0] for call in copy.write_row.call_args_list] == [
+        [1, drivers.Decimal('2.5'), 'CA'], [2, None, 'NY']]
+
+
+def test_text_copy_reader():
+    reader = drivers.TextCopyReader([[1, 'a\tb', None], [2, 'c\\d\n', 2.5]])
+
+    assert reader.read(4) == '1\ta\\'
+    assert reader.read() == 'tb\t\\N\n2\tc\\\\d\\n\t2.5\n'
+    assert reader.read(8192) == ''
+
+
+def test_psycopg2_copy_rows(mocker):
+    conn = mocker.MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    copied = []
+    cursor.copy_expert.side_effect = lambda sql, data_file: copied.append((sql, data_file.read()))
+
+    drivers.Psycopg2Driver.copy_rows(conn, 'item', [[1, None], [2, 'NY']], ['id', 'state'])
+
+    assert copied == [('COPY item (id, state) FROM STDIN', '1\t\\N\n2\tNY\n')]
@@ -0,0 +1,82 @@
+import os
+
+import pandas
+import pytest
+
+from s64da_benchmark_toolkit import events
+from s64da_benchmark_toolkit.db import Status, Timing
+from s64da_benchmark_toolkit.streams import Streams
+from tests.test_streams import args, benchmark
+
+
+def test_event_log_reader(tmp_path):
+    event_log = events.EventLog(str(tmp_path / 'run'))
+    reader = events.EventReader(event_log.path)
+    assert reader.read() == []
+
+    event_log.query_started(1, 3, 1)
+    with open(event_log.path, 'a') as events_file:
+        events_file.write('{"event": "fin')
+
+    read = reader.read()
+    assert [(e['event'], e['source'], e['stream_id'], e['query_id']) for e in read] == [
+        ('start', 'streams', 1, 3)]
+
+    with open(event_log.path, 'a') as events_file:
+        events_file.write('ish"}\n')
+    event_log.query_finished(1, 3, 1, 'OK', 2.5)
+
+    assert [e['event'] for e in reader.read()] == ['finish', 'finish']
+    assert reader.read() == []
+
+
+def test_event_summary():
+    summary = events.EventSummary()
+    summary.update([
+        {'event': 'start', 'source': 'streams', 'stream_id': 1, 'query_id': 10, 'iteration': 0,
+         'warmup': True},
+        {'event': 'start', 'source': 'streams', 'stream_id': 1, 'query_id': 10, 'iteration': 1},
+        {'event': 'start', 'source': 'streams', 'stream_id': 2, 'query_id': 2, 'iteration': 1},
+        {'event': 'finish', 'source': 'streams', 'stream_id': 1, 'query_id': 10, 'iteration': 1,
+         'status': 'OK', 'runtime': 1.0},
+        {'event': 'start', 'source': 'streams', 'stream_id': 1, 'query_id': 10, 'iteration': 2},
+        {'event': 'finish', 'source': 'streams', 'stream_id': 1, 'query_id': 10, 'iteration': 2,
+         'status': 'OK', 'runtime': 3.0},
+        {'event': 'finish', 'source': 'streams', 'stream_id': 3, 'query_id': 2, 'iteration': 1,
+         'status': 'TIMEOUT', 'runtime': 9.0}
+    ])
+
+    df = summary.to_dataframe()
+
+    assert df['query_id'].tolist() == [2, 10]
+    assert df[['running', 'ok', 'failed']].values.tolist() == [[1, 0, 1], [0, 2, 0]]
+    assert df.loc[1, 'mean'] == 2.0
+    assert df.loc[1, 'p95'] == pytest.approx(2.9)
+    assert pandas.isna(df.loc[0, 'median'])
+
+
+def test_run_query_logs_events(mocker, args, benchmark, tmp_path):
+    s = Streams(args, benchmark)
+    s.events = events.EventLog(str(tmp_path))
+    mocker.patch.object(s, 'get_query_sql', return_value='SELECT 1')
+    mocker.patch.object(s.db, 'run_query', return_value=(
+        Timing(start=1.0, stop=3.0, status=Status.TIMEOUT, connect=0.0), None, None))
+
+    s._run_query(0, 7, iteration=0)
+
+    logged = events.EventReader(s.events.path).read()
+    assert [(e['event'], e['query_id'], e['warmup']) for e in logged] == [
+        ('start', 7, True), ('finish', 7, True)]
+    assert (logged[1]['status'], logged[1]['runtime']) == ('TIMEOUT', 2.0)
+
+
+def test_find_latest_event_log(tmp_path):
+    assert events.find_latest_event_log(str(tmp_path)) is None
+
+    older = events.EventLog(str(tmp_path / 'runs' / '20200101-000000'))
+    newer = events.EventLog(str(tmp_path / 'runs' / '20200102-000000' / 'sweep0'))
+    older.query_started(0, 1, 1)
+    newer.query_started(0, 1, 1)
+    os.utime(older.path, (0, 0))
+
+    assert events.find_latest_event_log(str(tmp_path)) == newer.path
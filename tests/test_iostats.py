@@ -0,0 +1,87 @@
+import pytest
+
+from s64da_benchmark_toolkit import iostats
+from s64da_benchmark_toolkit.streams import Streams
+from tests.test_streams import args, benchmark, reporting_queue
+
+DSN = 'postgresql://postgres@nowhere:1234/foodb'
+
+
+@pytest.fixture
+def cursor(mocker):
+    psycopg2_connect = mocker.patch('psycopg2.connect')
+    return psycopg2_connect.return_value.cursor.return_value
+
+
+def test_delta_statements(cursor):
+    cursor.fetchone.side_effect = [
+        (1,), (8192,),
+        (100, 10, 0, 0), ('0/1000',),
+        (150, 30, 5, 7), ('0/3000',),
+        (8192,)
+    ]
+
+    with iostats.IOStats(DSN) as io_stats:
+        assert io_stats.source == iostats.STATEMENTS_SQL
+        before = io_stats.snapshot()
+        delta = io_stats.delta(before)
+
+    assert delta == {'shared_blks_hit': 50, 'shared_blks_read': 20, 'temp_blks_read': 5,
+                     'temp_blks_written': 7, 'wal_bytes': 8192}
+    cursor.execute.assert_called_with(iostats.WAL_DIFF_SQL, ('0/3000', '0/1000'))
+
+
+def test_delta_database(cursor):
+    cursor.fetchone.side_effect = [
+        None, (8192,),
+        (100, 10, None, 0), (None,),
+        (100, 12, None, 81920), (None,)
+    ]
+
+    with iostats.IOStats(DSN) as io_stats:
+        assert io_stats.source == iostats.DATABASE_SQL
+        delta = io_stats.delta(io_stats.snapshot())
+
+    assert delta == {'shared_blks_hit': 0, 'shared_blks_read': 2, 'temp_blks_read': None,
+                     'temp_blks_written': 10, 'wal_bytes': None}
+
+
+@pytest.fixture
+def fake_io_stats(mocker):
+    io_stats = mocker.patch('s64da_benchmark_toolkit.streams.IOStats').return_value \
+        .__enter__.return_value
+    snapshots = iter(range(100))
+    io_stats.snapshot.side_effect = lambda: next(snapshots)
+    io_stats.delta.side_effect = lambda before: {'shared_blks_read': next(snapshots) - before}
+    return io_stats
+
+
+def run_simulated_stream(mocker, args, benchmark, reporting_queue):
+    mocker.patch('yaml.load', return_value={})
+    mocker.patch.object(Streams, 'get_stream_sequence', return_value=[1, 2, 3])
+    mocker.patch.object(Streams, 'read_sql_file', return_value='SELECT 1')
+    args.timeout = '1min'
+    args.simulate = 'exponential'
+    args.simulate_time_scale = 0.001
+    args.warmup = 1
+
+    Streams(args, benchmark)._run_stream(reporting_queue, 1)
+    return reporting_queue.values
+
+
+def test_run_stream_io_stats_query(mocker, args, benchmark, reporting_queue, fake_io_stats):
+    args.io_stats = 'query'
+    metrics = run_simulated_stream(mocker, args, benchmark, reporting_queue)
+
+    assert [metric.io_stats for metric in metrics] == [{'shared_blks_read': 1}] * 3
+    assert metrics[0].dataframe['shared_blks_read'][0] == 1
+
+
+def test_run_stream_io_stats_stream(mocker, args, benchmark, reporting_queue, fake_io_stats):
+    args.io_stats = 'stream'
+    metrics = run_simulated_stream(mocker, args, benchmark, reporting_queue)
+
+    # one snapshot before the first query after the warm-up and one at the end
+    assert [metric.query_id for metric in metrics] == [1, 2, 3]
+    assert [metric.io_stats for metric in metrics] == [None, None, {'shared_blks_read': 1}]
+    assert fake_io_stats.snapshot.call_count == 1
@@ -0,0 +1,102 @@
+import os
+
+from datetime import date
+from decimal import Decimal
+
+from s64da_benchmark_toolkit import journal
+from s64da_benchmark_toolkit.db import Status, Timing
+from s64da_benchmark_toolkit.reporting import QueryMetric
+from s64da_benchmark_toolkit.streams import Streams
+from tests.test_streams import args, benchmark, reporting_queue
+
+# taken before tests/conftest.py points it to the temporary directory of each test
+make_run_dir = journal.RunJournal.make_run_dir
+
+
+def make_metric(stream_id, query_id, iteration=1, result=None):
+    return QueryMetric(stream_id=stream_id, query_id=query_id, iteration=iteration,
+                       timestamp_start=100.0, timestamp_stop=102.5, status='OK',
+                       result=result, plan='[{"Plan": {}}]', num_rows=1)
+
+
+def test_journal_round_trip(tmp_path):
+    run_journal = journal.RunJournal(str(tmp_path / 'run'))
+    run_journal.append(make_metric(1, 3, result=(['a', 'b'], [(Decimal('1.50'), date(1995, 3, 7))])))
+    run_journal.append(make_metric(1, 4, iteration=2))
+
+    loaded = run_journal.load()
+
+    assert [(m.stream_id, m.query_id, m.iteration) for m in loaded] == [(1, 3, 1), (1, 4, 2)]
+    assert loaded[0].timestamp_stop == make_metric(1, 3).timestamp_stop
+    assert loaded[0].num_rows == 1
+    # the result rows and plans are not journaled
+    assert (loaded[0].result, loaded[1].plan) == (None, None)
+    assert 'Decimal' not in open(run_journal.path).read()
+    assert journal.RunJournal.completed(loaded) == {(1, 3, 1), (1, 4, 2)}
+
+
+def test_journal_groups_syncs(mocker, tmp_path):
+    fsync_mock = mocker.patch('os.fsync')
+    mocker.patch('time.time', side_effect=[100.0, 100.0, 100.5, 101.0, 101.0, 101.2])
+    run_journal = journal.RunJournal(str(tmp_path))
+
+    for query_id in range(3):
+        run_journal.append(make_metric(0, query_id))
+
+    assert fsync_mock.call_count == 2
+    run_journal.sync()
+    assert fsync_mock.call_count == 3
+    assert len(run_journal.load()) == 3
+
+
+def test_make_run_dir(tmp_path):
+    run_dirs = [make_run_dir(str(tmp_path)) for _ in range(3)]
+
+    assert len(set(run_dirs)) == 3
+    assert all(os.path.isdir(run_dir) for run_dir in run_dirs)
+
+
+def test_journal_skips_incomplete_line(tmp_path):
+    run_journal = journal.RunJournal(str(tmp_path))
+    run_journal.append(make_metric(0, 1))
+    with open(run_journal.path, 'a') as journal_file:
+        journal_file.write('{"stream_id": 0, "query_')
+
+    assert len(run_journal.load()) == 1
+
+
+def test_journaled_queue(tmp_path, reporting_queue):
+    run_journal = journal.RunJournal(str(tmp_path))
+    queue = journal.JournaledQueue(reporting_queue, run_journal)
+
+    queue.put(make_metric(0, 1))
+
+    assert len(reporting_queue.values) == 1
+    assert len(run_journal.load()) == 1
+
+
+def test_run_stream_skips_completed(mocker, args, benchmark, reporting_queue):
+    s = Streams(args, benchmark)
+    s.completed = {(0, 1, 1)}
+    mocker.patch.object(s, 'get_stream_sequence', return_value=(1, 2))
+    run_query_mock = mocker.patch.object(s, '_run_query', return_value=(
+        Timing(start=1.0, stop=2.0, status=Status.OK, connect=0.0), None, None))
+
+    s._run_stream(reporting_queue, 0)
+
+    run_query_mock.assert_called_once_with(0, 2, None, 1)
+    assert [m.query_id for m in reporting_queue.values] == [2]
+
+
+def test_run_resume(mocker, tmp_path, args, benchmark):
+    journal.RunJournal(str(tmp_path)).append(make_metric(0, 1))
+    args.resume = str(tmp_path)
+    s = Streams(args, benchmark)
+    reporting_mock = mocker.patch.object(s, 'reporting')
+    run_streams_mock = mocker.patch.object(s, 'run_streams')
+
+    s.run()
+
+    assert s.completed == {(0, 1, 1)}
+    assert run_streams_mock.call_args[0][0].journal.path == str(tmp_path / 'journal.jsonl')
+    assert [m.query_id for m in reporting_mock.resumed_metrics] == [1]
@@ -0,0 +1,54 @@
+import json
+
+from perf import runner
+from perf.cases import CASES, Case
+
+
+def test_case_names_unique():
+    names = [case.name for case in CASES]
+
+    assert len(names) == len(set(names))
+
+
+def test_measure():
+    case = Case('list', lambda: 1000, lambda size: [0] * size, 1000)
+
+    result = runner.measure(case, repeats=2)
+
+    assert result['ops_per_sec'] > 0
+    # a list of 1000 pointers
+    assert result['peak_kib'] >= 1000 * 8 / 1024
+
+
+def test_compare():
+    baseline = {
+        'fast': {'ops_per_sec': 100.0, 'peak_kib': 1000.0},
+        'small': {'ops_per_sec': 100.0, 'peak_kib': 1.0}
+    }
+    results = {
+        'fast': {'ops_per_sec': 70.0, 'peak_kib': 1300.0},
+        'small': {'ops_per_sec': 90.0, 'peak_kib': 10.0},
+        'new': {'ops_per_sec': 1.0, 'peak_kib': 1.0}
+    }
+
+    regressions = runner.compare(results, baseline, 0.2)
+
+    assert regressions == ['fast: 70.0 ops/s, baseline 100.0 ops/s',
+                           'fast: 1300.0 KiB peak, baseline 1000.0 KiB']
+
+
+def test_main_baseline(mocker, tmp_path):
+    baseline_file = str(tmp_path / 'baseline.json')
+    mocker.patch.object(runner, 'CASES', [Case('noop', lambda: None, lambda _: None, 1)])
+    measure_mock = mocker.patch.object(
+        runner, 'measure', return_value={'ops_per_sec': 100.0, 'peak_kib': 1.0})
+
+    assert runner.main(['--baseline', baseline_file, '--save-baseline']) == 0
+    with open(baseline_file) as baseline:
+        assert json.load(baseline) == {'noop': {'ops_per_sec': 100.0, 'peak_kib': 1.0}}
+
+    assert runner.main(['--baseline', baseline_file]) == 0
+
+    measure_mock.return_value = {'ops_per_sec': 50.0, 'peak_kib': 1.0}
+    assert runner.main(['--baseline', baseline_file]) == 1
+    assert runner.main(['--baseline', baseline_file, '--filter', 'other']) == 0
@@ -0,0 +1,122 @@
+import queue
+
+import pytest
+
+from s64da_benchmark_toolkit import reporting
+from tests.test_streams import args, benchmark
+
+
+def make_metric(stream_id, query_id, iteration, start, stop, status='OK'):
+    return reporting.QueryMetric(
+        stream_id=stream_id, query_id=query_id, iteration=iteration, timestamp_start=start,
+        timestamp_stop=stop, status=status, result=None, plan=None)
+
+
+@pytest.fixture
+def duration_report(args, benchmark):
+    args.output = 'print'
+    args.duration = 60
+    report = reporting.Reporting(benchmark, args, {})
+    report.df = reporting.pandas.concat([metric.dataframe for metric in (
+        make_metric(0, 1, 1, 1000, 1010),
+        make_metric(0, 2, 1, 1010, 1020),
+        make_metric(0, 3, 1, 1020, 1020, 'IGNORED'),
+        make_metric(0, 1, 2, 1020, 1030),
+        make_metric(0, 2, 2, 1030, 1036, 'TIMEOUT'),
+    )]).reset_index(drop=True)
+    return report
+
+
+def test_queries_per_hour(duration_report):
+    # three OK queries within 36 seconds
+    assert duration_report.get_queries_per_hour() == pytest.approx(300)
+
+
+def test_iteration_stats(duration_report):
+    stats = duration_report.get_iteration_stats()
+
+    assert list(stats['iteration']) == [1, 2]
+    assert list(stats['seconds']) == [20, 16]
+    assert list(stats['complete']) == [True, False]
+
+
+def test_stats_without_refresh_stream(duration_report):
+    duration_report.df = reporting.pandas.concat([duration_report.df] + [
+        metric.dataframe for metric in (
+            make_metric(reporting.REFRESH_STREAM_ID, 'RF1', 1, 1000, 1005),
+            make_metric(reporting.REFRESH_STREAM_ID, 'RF2', 1, 1005, 1008))
+    ]).reset_index(drop=True)
+
+    stats = duration_report.get_iteration_stats()
+    summary = duration_report.get_query_summary()
+
+    assert list(stats['stream_id']) == [0, 0]
+    assert list(summary['query_id']) == [1, 2]
+
+
+def test_bootstrap_ci_deterministic():
+    samples = [1.0, 1.2, 0.9, 1.1, 5.0]
+
+    ci_low, ci_high = reporting.Reporting.bootstrap_ci(samples)
+
+    assert (ci_low, ci_high) == reporting.Reporting.bootstrap_ci(samples)
+    assert ci_low <= 1.1 <= ci_high
+
+
+def test_query_summary(args, benchmark):
+    args.output = 'print'
+    report = reporting.Reporting(benchmark, args, {})
+    report.df = reporting.pandas.concat([metric.dataframe for metric in (
+        make_metric(0, 10, 1, 0, 3),
+        make_metric(0, 2, 1, 3, 4),
+        make_metric(0, 10, 2, 4, 6),
+        make_metric(0, 2, 2, 6, 9, 'TIMEOUT'),
+        make_metric(0, 10, 3, 9, 13),
+    )]).reset_index(drop=True)
+
+    summary = report.get_query_summary()
+
+    assert list(summary['query_id']) == [2, 10]
+    assert list(summary['samples']) == [1, 3]
+    assert list(summary['median']) == [1, 3]
+    assert summary['std'][1] == pytest.approx(1)
+
+
+def test_metric_columns():
+    metric_columns = reporting.MetricColumns(chunk_rows=2)
+    metrics = [make_metric(0, query_id, 1, query_id, query_id + 0.5) for query_id in range(5)]
+    metrics[1].num_rows = 7
+
+    for metric in metrics:
+        metric_columns.append(metric)
+    assert len(metric_columns.chunks) == 2
+    # the chunks are typed as they are built
+    assert [str(metric_columns.chunks[0][column].dtype)
+            for column in ('timestamp_start', 'runtime', 'query_id', 'rows')] == [
+        'datetime64[ns]', 'float64', 'int64', 'object']
+
+    df = metric_columns.to_dataframe()
+
+    assert list(df.index) == [0, 1, 2, 3, 4]
+    assert list(df['query_id']) == [0, 1, 2, 3, 4]
+    assert list(df['runtime']) == [0.5] * 5
+    assert list(df['rows']) == [None, 7, None, None, None]
+    assert str(df['timestamp_start'].dtype) == 'datetime64[ns]'
+    assert list(reporting.MetricColumns().to_dataframe().columns) == \
+        list(reporting.QueryMetric.dataframe_columns)
+
+
+def test_run_report_resumed(args, benchmark, mocker):
+    args.output = 'print'
+    args.scale_factor = None
+    report = reporting.Reporting(benchmark, args, {})
+    save_plan_mock = mocker.patch.object(report, '_save_explain_plan')
+    report.resumed_metrics = [make_metric(0, 1, 1, 0, 1)]
+    reporting_queue = queue.Queue()
+    reporting_queue.put(make_metric(0, 2, 1, 1, 3))
+
+    report.run_report(reporting_queue)
+
+    assert list(report.df['query_id']) == [1, 2]
+    # the plans of the resumed queries were saved by the report of the interrupted run
+    assert save_plan_mock.call_count == 1
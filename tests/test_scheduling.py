@@ -0,0 +1,173 @@
+import queue
+
+import pytest
+
+from s64da_benchmark_toolkit import scheduling
+from s64da_benchmark_toolkit.db import Status, Timing
+from s64da_benchmark_toolkit.streams import Streams
+from tests.test_streams import args, benchmark, reporting_queue
+
+
+class WorkQueue:
+    def __init__(self, items=()):
+        self.items = list(items)
+
+    def put(self, item, timeout=None):
+        self.items.append(item)
+
+    def get(self):
+        return self.items.pop(0)
+
+
+class FullWorkQueue:
+    def put(self, item, timeout=None):
+        raise queue.Full
+
+
+class Workers:
+    def __init__(self, error=None):
+        self.error = error
+
+    def ready(self):
+        return self.error is not None
+
+    def get(self):
+        if self.error:
+            raise self.error
+
+
+def test_arrival_process_fixed():
+    arrival_process = scheduling.ArrivalProcess(30, 'fixed')
+
+    assert [arrival_process.next_interval() for _ in range(3)] == [2, 2, 2]
+
+
+def test_arrival_process_poisson():
+    arrival_process = scheduling.ArrivalProcess(60, 'poisson', seed=42)
+    intervals = [arrival_process.next_interval() for _ in range(10000)]
+
+    assert sum(intervals) / len(intervals) == pytest.approx(1, rel=0.05)
+
+
+def test_arrival_process_invalid():
+    with pytest.raises(ValueError):
+        scheduling.ArrivalProcess(0)
+
+
+@pytest.fixture
+def streams(mocker, args, benchmark):
+    args.streams = 2
+    s = Streams(args, benchmark)
+    s.config['ignore'] = [4]
+    mocker.patch.object(s, 'get_stream_sequence', side_effect=lambda stream_id: {
+        1: (1, 2, 4), 2: (3, 1)}[stream_id])
+    return s
+
+
+def test_get_queries(streams, reporting_queue):
+    executor = scheduling.WorkQueueExecutor(streams, 2)
+
+    assert executor.get_queries(reporting_queue) == [(1, 1), (2, 3), (1, 2), (2, 1)]
+    assert [(m.stream_id, m.query_id, m.status) for m in reporting_queue.values] == [
+        (1, 4, 'IGNORED')]
+
+
+def test_dispatch(mocker, streams):
+    sleep_mock = mocker.patch('time.sleep')
+    work_queue = WorkQueue()
+    executor = scheduling.WorkQueueExecutor(
+        streams, 2, scheduling.ArrivalProcess(60, 'fixed'))
+
+    executor.dispatch(work_queue, [(1, 1), (2, 3)], Workers())
+
+    assert [(item.stream_id, item.query_id) for item in work_queue.items] == [(1, 1), (2, 3)]
+    assert work_queue.items[1].release_time - work_queue.items[0].release_time == 1
+    assert sleep_mock.call_count == 2
+
+
+def test_dispatch_closed_loop(mocker, streams):
+    sleep_mock = mocker.patch('time.sleep')
+    work_queue = WorkQueue()
+    executor = scheduling.WorkQueueExecutor(streams, 2)
+
+    executor.dispatch(work_queue, [(1, 1), (2, 3)], Workers())
+
+    assert [item.release_time for item in work_queue.items] == [None, None]
+    assert sleep_mock.call_count == 0
+
+
+def test_dispatch_stops_at_deadline(mocker, streams):
+    mocker.patch('time.time', side_effect=[100.0, 101.0, 102.0, 103.0])
+    streams.duration = 10
+    streams.deadline = 102.5
+    work_queue = WorkQueue()
+
+    # a put may block on a busy queue past the deadline, the query is not dispatched anymore
+    scheduling.WorkQueueExecutor(streams, 2).dispatch(work_queue, [(1, 1), (2, 3)], Workers())
+
+    assert [(item.stream_id, item.query_id) for item in work_queue.items] == [(1, 1)]
+
+
+def test_run_fails_with_workers(mocker, streams, reporting_queue):
+    manager = mocker.patch('s64da_benchmark_toolkit.scheduling.Manager')
+    manager.return_value.__enter__.return_value.Queue.return_value = FullWorkQueue()
+    pool = mocker.patch('s64da_benchmark_toolkit.scheduling.Pool')
+    pool.return_value.__enter__.return_value.starmap_async.return_value = Workers(
+        ValueError('worker failed'))
+
+    # a full queue with dead workers does not block the run forever
+    with pytest.raises(ValueError, match='worker failed'):
+        scheduling.WorkQueueExecutor(streams, 2).run(reporting_queue)
+
+
+def test_run_worker(mocker, streams, reporting_queue):
+    mocker.patch('time.time', return_value=105.0)
+    run_query_mock = mocker.patch.object(streams, '_run_query', return_value=(
+        Timing(start=105.0, stop=107.0, status=Status.OK, connect=0.1), None, None))
+    work_queue = WorkQueue([
+        scheduling.WorkItem(1, 1, 1, 100.0), scheduling.WorkItem(2, 3, 1, 103.0), None])
+
+    scheduling.WorkQueueExecutor(streams, 1)._run_worker(reporting_queue, work_queue, 0)
+
+    assert run_query_mock.call_count == 2
+    assert [metric.queue_wait for metric in reporting_queue.values] == [5.0, 2.0]
+
+
+def test_run_worker_closed_loop(mocker, streams, reporting_queue):
+    mocker.patch.object(streams, '_run_query', return_value=(
+        Timing(start=105.0, stop=107.0, status=Status.OK, connect=0.1), None, None))
+    work_queue = WorkQueue([scheduling.WorkItem(1, 1, 1, None), None])
+
+    scheduling.WorkQueueExecutor(streams, 1)._run_worker(reporting_queue, work_queue, 0)
+
+    assert [metric.queue_wait for metric in reporting_queue.values] == [None]
+
+
+def test_load_expected_runtimes(tmp_path):
+    csv_file = tmp_path / 'results.csv'
+    csv_file.write_text(
+        ';stream_id;query_id;runtime;status\n'
+        '0;1;1;2.0;OK\n'
+        '1;1;1;4.0;OK\n'
+        '2;1;2;9.0;TIMEOUT\n'
+        '3;1;3;1.0;OK\n')
+
+    assert scheduling.load_expected_runtimes(str(csv_file)) == {'1': 3.0, '3': 1.0}
+
+
+def test_order_queries():
+    queries = [(1, 1), (2, 3), (1, 2), (2, 1)]
+    runtimes = {'1': 3.0, '3': 1.0}
+
+    assert scheduling.order_queries(queries, 'fifo') == queries
+    assert scheduling.order_queries(queries, 'longest-first', runtimes) == [
+        (1, 2), (1, 1), (2, 1), (2, 3)]
+    assert scheduling.order_queries(queries, 'shortest-first', runtimes) == [
+        (2, 3), (1, 1), (2, 1), (1, 2)]
+
+
+def test_get_queries_longest_first(streams, reporting_queue):
+    executor = scheduling.WorkQueueExecutor(
+        streams, 2, policy='longest-first', expected_runtimes={'1': 1.0, '2': 5.0, '3': 3.0})
+
+    assert executor.get_queries(reporting_queue) == [(1, 2), (2, 3), (1, 1), (2, 1)]
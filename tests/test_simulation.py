@@ -0,0 +1,124 @@
+import os
+
+import pytest
+
+from s64da_benchmark_toolkit import simulation
+from s64da_benchmark_toolkit.db import SpilledResult, Status
+from s64da_benchmark_toolkit.streams import Streams
+from tests.test_streams import args, benchmark, reporting_queue
+
+DSN = 'postgresql://postgres@nowhere:1234/foodb'
+
+
+@pytest.fixture
+def runtimes_csv(tmp_path):
+    csv_file = tmp_path / 'results.csv'
+    csv_file.write_text(
+        'stream_id;query_id;runtime;status\n'
+        '1;1;2.5;OK\n'
+        '2;1;3.5;TIMEOUT\n'
+        '1;2;0.0;IGNORED\n')
+    return str(csv_file)
+
+
+@pytest.fixture
+def results_dir(tmp_path):
+    (tmp_path / '1.csv').write_text('a,b\n1,x\n2,y\n')
+    return str(tmp_path)
+
+
+def test_load_replay(runtimes_csv):
+    assert simulation.load_replay(runtimes_csv) == {'1': [(2.5, 'OK'), (3.5, 'TIMEOUT')]}
+
+
+def test_replay_requires_csv():
+    with pytest.raises(ValueError):
+        simulation.SimulatedDB('replay', DSN)
+
+
+def test_draw_runtime_replay(runtimes_csv):
+    db = simulation.SimulatedDB('replay', DSN, runtimes_csv=runtimes_csv)
+    draws = {db.draw_runtime(stream_id, 1, 1) for stream_id in range(20)}
+
+    assert draws == {(2.5, 'OK'), (3.5, 'TIMEOUT')}
+    assert db.draw_runtime(1, 1, 1) == db.draw_runtime(1, 1, 1)
+    # queries missing in the CSV are sampled
+    assert db.draw_runtime(1, 3, 1)[1] == 'OK'
+
+
+@pytest.mark.parametrize('distribution', ['exponential', 'lognormal'])
+def test_draw_runtime_distribution(distribution):
+    db = simulation.SimulatedDB(distribution, DSN, mean_runtime=2.0)
+    runtimes = [db.draw_runtime(1, 1, iteration)[0] for iteration in range(20000)]
+
+    assert sum(runtimes) / len(runtimes) == pytest.approx(2.0, rel=0.05)
+
+
+def test_simulate_query_fetch(mocker, results_dir):
+    sleep_mock = mocker.patch('time.sleep')
+    db = simulation.SimulatedDB('exponential', DSN, time_scale=0.5, results_dir=results_dir)
+    mocker.patch.object(db, 'draw_runtime', return_value=(3.0, 'OK'))
+
+    timing, query_result, plan = db.simulate_query(1, 1)
+
+    sleep_mock.assert_called_once_with(1.5)
+    assert timing.status == Status.OK
+    assert timing.first_row is not None
+    assert query_result == (['a', 'b'], [('1', 'x'), ('2', 'y')])
+    assert plan is None
+    assert db.simulate_query(1, 2)[1] == ([], [])
+
+
+def test_simulate_query_timeout(mocker, results_dir):
+    mocker.patch('time.sleep')
+    db = simulation.SimulatedDB('exponential', DSN, results_dir=results_dir)
+    mocker.patch.object(db, 'draw_runtime', return_value=(3.0, 'TIMEOUT'))
+
+    timing, query_result, _ = db.simulate_query(1, 1)
+
+    assert timing.status == Status.TIMEOUT
+    assert query_result is None
+
+
+def test_simulate_query_stream(mocker, tmp_path, results_dir):
+    mocker.patch('time.sleep')
+    db = simulation.SimulatedDB('exponential', DSN, result_mode='stream', results_dir=results_dir)
+    result_file = str(tmp_path / 'query_results' / '1_1.csv')
+
+    _, query_result, _ = db.simulate_query(1, 1, result_file=result_file)
+
+    assert query_result == SpilledResult(path=result_file, num_rows=2,
+                                         num_bytes=os.path.getsize(result_file))
+
+
+def test_run_streams_simulated(mocker, args, benchmark, reporting_queue):
+    mocker.patch('yaml.load', return_value={})
+    mocker.patch.object(Streams, 'get_stream_sequence', return_value=[1, 2])
+    mocker.patch.object(Streams, 'read_sql_file', return_value='SELECT 1')
+    args.streams = 3
+    args.timeout = '1min'
+    args.executor = 'asyncio'
+    args.connection_mode = 'session'
+    args.simulate = 'exponential'
+    args.simulate_time_scale = 0.001
+
+    s = Streams(args, benchmark)
+    s.run_streams(reporting_queue)
+
+    assert sorted((metric.stream_id, metric.query_id) for metric in reporting_queue.values) == [
+        (1, 1), (1, 2), (2, 1), (2, 2), (3, 1), (3, 2)]
+    assert all(metric.status == 'OK' for metric in reporting_queue.values)
+
+
+def test_run_stream_simulated(mocker, args, benchmark, reporting_queue):
+    mocker.patch('yaml.load', return_value={})
+    mocker.patch.object(Streams, 'get_stream_sequence', return_value=[1, 2])
+    mocker.patch.object(Streams, 'read_sql_file', return_value='SELECT 1')
+    args.timeout = '1min'
+    args.simulate = 'lognormal'
+    args.simulate_time_scale = 0.001
+
+    s = Streams(args, benchmark)
+    s._run_stream(reporting_queue, 0)
+
+    assert [metric.query_id for metric in reporting_queue.values] == [1, 2]
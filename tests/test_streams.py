@@ -1,7 +1,12 @@
 
+import argparse
+import threading
+
 import pytest
 from tests.test_db import no_plan
 from s64da_benchmark_toolkit import streams
+from s64da_benchmark_toolkit.db import ConfigNotAppliedException, SpilledResult, Status, Timing
+from s64da_benchmark_toolkit.journal import RunJournal
 
 
 @pytest.fixture
@@ -19,6 +24,36 @@ def args():
         use_server_side_cursors = False
         check_correctness = False
         netdata_output_file = 'foobar.dat'
+        executor = 'pool'
+        executor_processes = 1
+        connection_mode = 'query'
+        plan_capture = 'off'
+        plan_sample_interval = 10
+        result_mode = 'fetch'
+        fetch_batch_size = 10000
+        duration = None
+        warmup = 0
+        repetitions = 1
+        arrival_rate = None
+        arrival_process = 'poisson'
+        workers = None
+        scheduler = 'streams'
+        runtimes_csv = None
+        refresh = False
+        refresh_pairs = None
+        refresh_start = 1
+        generate_parameters = False
+        parameter_seed = 0
+        prepared_statements = False
+        resume = None
+        agents = None
+        agent_authkey = 'secret'
+        agent_authkey_file = None
+        simulate = None
+        simulate_mean_runtime = 1.0
+        simulate_time_scale = 1.0
+        io_stats = 'off'
+        wait_event_interval = None
 
     return DefaultArgs
 
@@ -148,6 +183,20 @@ def test_run_multiple_streams(mocker, args, benchmark, reporting_queue):
     pool_mock_obj.starmap.assert_called_once_with(s._run_stream, stream_ids)
 
 
+def test_run_streams_asyncio(mocker, args, benchmark, reporting_queue):
+    executor_mock = mocker.patch('s64da_benchmark_toolkit.streams.AsyncStreamsExecutor',
+                                 autospec=True)
+
+    args.streams = 2
+    args.executor = 'asyncio'
+    args.executor_processes = 2
+    s = streams.Streams(args, benchmark)
+    s.run_streams(reporting_queue)
+
+    executor_mock.assert_called_once_with(s, 2)
+    executor_mock.return_value.run.assert_called_once_with(reporting_queue, (1, 2))
+
+
 def test_run_stream(no_plan, mocker, args, benchmark, reporting_queue):
     psycopg2_connect = mocker.patch('psycopg2.connect')
     mock_conn = psycopg2_connect.return_value
@@ -173,6 +222,60 @@ def test_run_stream(no_plan, mocker, args, benchmark, reporting_queue):
     assert all([sid == test_stream_id for sid in reporting_queue.stream_ids])
 
 
+def test_run_stream_session(no_plan, mocker, args, benchmark, reporting_queue):
+    psycopg2_connect = mocker.patch('psycopg2.connect')
+    mock_cursor = psycopg2_connect.return_value.cursor.return_value
+
+    test_sequence = (1, 2, 3)
+    args.connection_mode = 'session'
+    s = streams.Streams(args, benchmark)
+    mocker.patch.object(s, 'get_stream_sequence', return_value=test_sequence, autospec=True)
+    mocker.patch.object(s, 'read_sql_file', return_value='SELECT 1')
+
+    s._run_stream(reporting_queue, 0)
+
+    psycopg2_connect.assert_called_once()
+    mock_cursor.execute.assert_has_calls([mocker.call('DISCARD ALL'), mocker.call('SELECT 1')] * 3)
+    assert len(reporting_queue.values) == len(test_sequence)
+
+
+def test_run_stream_deferred_plans(mocker, args, benchmark, reporting_queue):
+    mocker.patch('psycopg2.connect')
+    get_explain_output = mocker.patch('s64da_benchmark_toolkit.db.DB.get_explain_output',
+                                      return_value='[{"Plan": {}}]')
+
+    args.plan_capture = 'deferred'
+    s = streams.Streams(args, benchmark)
+    mocker.patch.object(s, 'get_stream_sequence', return_value=(1, 2, 1), autospec=True)
+    mocker.patch.object(s, 'read_sql_file', side_effect=lambda query_id: f'SELECT {query_id}')
+
+    s._run_stream(reporting_queue, 0)
+
+    # each distinct query is explained once, after all queries of the stream ran
+    assert get_explain_output.call_count == 2
+    assert [metric.plan for metric in reporting_queue.values] == ['[{"Plan": {}}]'] * 3
+
+
+def test_make_query_metric_latency_breakdown():
+    timing = Timing(start=1.0, stop=2.0, status=Status.OK, connect=0.1, first_row=0.7, fetch=0.2)
+
+    metric = streams.Streams.make_query_metric(0, 1, timing, (['a'], [(1,), (22,)]), None, 0)
+
+    assert (metric.num_rows, metric.num_bytes) == (2, 25)
+    assert (metric.time_to_first_row, metric.fetch_time) == (0.7, 0.2)
+
+
+def test_make_query_metric_spilled_result():
+    timing = Timing(start=1.0, stop=2.0, status=Status.OK, connect=0.1)
+    query_result = SpilledResult(path='results/query_results/0_1.csv', num_rows=3, num_bytes=42)
+
+    metric = streams.Streams.make_query_metric(0, 1, timing, query_result, None, 0)
+
+    assert metric.result is None
+    assert metric.result_file == 'results/query_results/0_1.csv'
+    assert (metric.num_rows, metric.num_bytes) == (3, 42)
+
+
 def test_run(mocker, args, benchmark):
     s = streams.Streams(args, benchmark)
     mocker.patch.object(s, 'reporting')
@@ -184,6 +287,40 @@ def test_run(mocker, args, benchmark):
     run_streams_mock.assert_called_once()
 
 
+def test_run_asyncio_without_manager(mocker, args, benchmark):
+    args.executor = 'asyncio'
+    s = streams.Streams(args, benchmark)
+    mocker.patch.object(s, 'reporting')
+    mocker.patch.object(s, 'db', autospec=True)
+    mocker.patch.object(s, 'run_streams')
+    manager_mock = mocker.patch('s64da_benchmark_toolkit.streams.Manager')
+    s.run()
+
+    # all streams run in this process, the reporting queue is not shared
+    manager_mock.assert_not_called()
+
+    s.refresh = True
+    s.run()
+
+    manager_mock.assert_called_once()
+
+
+def test_run_config_not_applied(mocker, args, benchmark):
+    s = streams.Streams(args, benchmark)
+    s.config['dbconfig'] = {'shared_buffers': '1GB'}
+    mocker.patch.object(s, 'reporting')
+    db_mock = mocker.patch.object(s, 'db', autospec=True)
+    db_mock.check_config.side_effect = ConfigNotAppliedException(
+        {'shared_buffers': 'requires a restart'})
+    run_streams_mock = mocker.patch.object(s, 'run_streams')
+
+    with pytest.raises(ConfigNotAppliedException):
+        s.run()
+
+    run_streams_mock.assert_not_called()
+    assert db_mock.reset_config.call_count == 2
+
+
 def test_run_keyboard_interrupt(mocker, args, benchmark):
     s = streams.Streams(args, benchmark)
     db_mock = mocker.patch.object(s, 'db', autospec=True)
@@ -201,3 +338,151 @@ def test_parse_timeout(args, benchmark):
     assert obj.parse_timeout('1111') == 1
     assert obj.parse_timeout('1h') == 3600
     assert obj.parse_timeout('1foo') == 0
+
+
+def test_iterate_stream_once(args, benchmark):
+    s = streams.Streams(args, benchmark)
+
+    assert list(s.iterate_stream((3, 1))) == [(1, 1, 3), (1, 2, 1)]
+
+
+def test_iterate_stream_duration(mocker, args, benchmark):
+    s = streams.Streams(args, benchmark)
+    s.deadline = 100
+    mocker.patch('time.time', side_effect=[10, 20, 30, 40, 100])
+
+    assert list(s.iterate_stream((3, 1))) == [(1, 1, 3), (1, 2, 1), (2, 1, 3), (2, 2, 1)]
+
+
+def test_iterate_stream_duration_all_ignored(args, benchmark):
+    s = streams.Streams(args, benchmark)
+    s.config['ignore'] = [3, 1]
+    s.deadline = float('inf')
+
+    assert list(s.iterate_stream((3, 1))) == [(1, 1, 3), (1, 2, 1)]
+
+
+def test_iterate_stream_warmup_repetitions(args, benchmark):
+    args.warmup = 1
+    args.repetitions = 2
+    s = streams.Streams(args, benchmark)
+
+    assert list(s.iterate_stream((3, 1))) == [
+        (0, 1, 3), (0, 2, 1), (1, 1, 3), (1, 2, 1), (2, 1, 3), (2, 2, 1)]
+
+
+def test_run_stream_warmup_not_reported(mocker, args, benchmark, reporting_queue):
+    args.warmup = 2
+    s = streams.Streams(args, benchmark)
+    s.config['ignore'] = [4]
+    mocker.patch.object(s, 'get_stream_sequence', return_value=(1, 4))
+    run_query_mock = mocker.patch.object(s, '_run_query', return_value=(
+        Timing(start=1.0, stop=2.0, status=Status.OK, connect=0.0), None, None))
+
+    s._run_stream(reporting_queue, 0)
+
+    assert run_query_mock.call_count == 3
+    assert [(m.query_id, m.iteration) for m in reporting_queue.values] == [(1, 1), (4, 1)]
+
+
+def test_run_streams_refresh_failed(mocker, args, benchmark, reporting_queue):
+    args.refresh = True
+    s = streams.Streams(args, benchmark)
+    mocker.patch.object(s, 'make_refresh_stream')
+    process_mock = mocker.patch('s64da_benchmark_toolkit.streams.Process')
+    process_mock.return_value.exitcode = 1
+    mocker.patch.object(s, '_run_query_streams')
+
+    with pytest.raises(RuntimeError, match='exit code 1'):
+        s.run_streams(reporting_queue)
+
+    process_mock.return_value.join.assert_called_once()
+
+
+def test_make_refresh_stream(args, benchmark):
+    s = streams.Streams(args, streams.Benchmark(name='tpch', base_dir='benchmarks/tpch'))
+    s.completed = {('refresh', 'RF1', 1)}
+    refresh_stream = s.make_refresh_stream()
+
+    assert type(refresh_stream).__name__ == 'RefreshStream'
+    assert refresh_stream.num_pairs == 1
+    assert refresh_stream.completed == {('refresh', 'RF1', 1)}
+
+
+def test_make_refresh_stream_missing(args):
+    s = streams.Streams(args, streams.Benchmark(name='ssb', base_dir='benchmarks/ssb'))
+
+    with pytest.raises(ValueError):
+        s.make_refresh_stream()
+
+
+def test_get_query_sql_generated_parameters(args):
+    args.generate_parameters = True
+    args.scale_factor = 10
+    s = streams.Streams(args, streams.Benchmark(name='tpch', base_dir='benchmarks/tpch'))
+
+    sql = s.get_query_sql(3, 15)
+
+    assert sql == s.get_query_sql(3, 15)
+    assert sql != s.get_query_sql(4, 15)
+    assert 'revenue3' in sql and '$' not in sql
+
+
+def test_make_agent_assignments(mocker, args, benchmark):
+    mocker.patch('yaml.load', return_value={})
+    args = argparse.Namespace(**{
+        key: value for key, value in vars(args).items() if not key.startswith('__')})
+    args.streams = 5
+    args.arrival_rate = 10.0
+    args.workers = 4
+    args.refresh = True
+    args.agents = [('host1', 1), ('host2', 2)]
+
+    s = streams.Streams(args, benchmark)
+    assignments = s.make_agent_assignments()
+
+    assert [address for address, _ in assignments] == args.agents
+    jobs = [job for _, job in assignments]
+    assert [(job.args.stream_offset, job.args.streams) for job in jobs] == [(1, 3), (4, 2)]
+    assert [job.args.arrival_rate for job in jobs] == [6.0, 4.0]
+    assert [job.args.workers for job in jobs] == [2, 2]
+    assert not any(job.args.refresh or job.args.agents for job in jobs)
+
+
+def test_iterate_stream_stopped(args, benchmark):
+    s = streams.Streams(args, benchmark)
+    s.stop = threading.Event()
+    s.stop.set()
+
+    assert list(s.iterate_stream((1, 2))) == []
+
+
+def test_agent_job_run(mocker, args, benchmark, reporting_queue):
+    make_run_dir = mocker.spy(RunJournal, 'make_run_dir')
+    stopped = []
+
+    def run_query_streams(s, queue):
+        # the stop of the agent reaches the streams while they run
+        s.stop.wait(5)
+        stopped.append((s.is_over(), s.journal, s.events))
+
+    mocker.patch.object(streams.Streams, '_run_query_streams', autospec=True,
+                        side_effect=run_query_streams)
+    stop = threading.Event()
+    stop.set()
+
+    streams.StreamsAgentJob(args, benchmark, set()).run(reporting_queue, stop)
+
+    # the coordinator keeps the run directory
+    assert stopped == [(True, None, None)]
+    assert make_run_dir.call_count == 0
+
+
+def test_get_query_sql_wait_event_tag(args):
+    args.wait_event_interval = 0.1
+    s = streams.Streams(args, streams.Benchmark(name='tpch', base_dir='benchmarks/tpch'))
+
+    sql = s.get_query_sql(3, 15)
+
+    assert sql.startswith('/* s64da stream=3 query=15 */\n')
+    assert 'revenue3' in sql
@@ -0,0 +1,131 @@
+import argparse
+
+import pandas
+import pytest
+
+from s64da_benchmark_toolkit import sweep
+from s64da_benchmark_toolkit.db import ConfigNotAppliedException
+from s64da_benchmark_toolkit.journal import RunJournal
+from s64da_benchmark_toolkit.streams import Benchmark
+from tests.test_streams import args
+
+GRID = {'work_mem': ['64MB', '256MB'], 'jit': ['on', 'off'], 'max_parallel_workers': [0, 2, 4]}
+
+
+def make_df(runtimes, statuses=None):
+    return pandas.DataFrame({
+        'query_id': [query_id for query_id, _ in runtimes],
+        'runtime': [runtime for _, runtime in runtimes],
+        'status': statuses or ['OK'] * len(runtimes)
+    })
+
+
+def test_load_grid(tmp_path):
+    sweep_file = tmp_path / 'sweep.yaml'
+    sweep_file.write_text('work_mem: [64MB, 256MB]\njit: off\n')
+
+    assert sweep.load_grid(str(sweep_file)) == {'work_mem': ['64MB', '256MB'], 'jit': [False]}
+
+    sweep_file.write_text('- work_mem\n')
+    with pytest.raises(ValueError):
+        sweep.load_grid(str(sweep_file))
+
+
+def test_grid_configs():
+    configs = sweep.make_configs(GRID)
+
+    assert len(configs) == 12
+    assert configs[0] == {'work_mem': '64MB', 'jit': 'on', 'max_parallel_workers': 0}
+    assert configs[-1] == {'work_mem': '256MB', 'jit': 'off', 'max_parallel_workers': 4}
+    assert sweep.make_configs(GRID, budget=3) == configs[:3]
+
+
+def test_random_configs():
+    configs = sweep.make_configs(GRID, 'random', budget=5, seed=1)
+
+    assert len(configs) == 5
+    assert all(config in sweep.grid_configs(GRID) for config in configs)
+    assert len({sweep.config_label(config) for config in configs}) == 5
+    assert configs == sweep.make_configs(GRID, 'random', budget=5, seed=1)
+    assert len(sweep.make_configs(GRID, 'random', budget=100)) == 12
+
+
+def test_summarize():
+    runs = [
+        ({'jit': 'on'}, make_df([(1, 2.0), (1, 4.0), (2, 1.0), (10, 5.0)])),
+        ({'jit': 'off'}, make_df([(1, 1.0), (2, 2.0), (10, 1.0)], ['OK', 'OK', 'ERROR']))
+    ]
+
+    per_query, overall = sweep.summarize(runs)
+
+    assert per_query.to_dict('records') == [
+        {'query_id': 1, 'best_config': 'jit=off', 'best_median': 1.0, 'worst_median': 3.0,
+         'speedup': 3.0},
+        {'query_id': 2, 'best_config': 'jit=on', 'best_median': 1.0, 'worst_median': 2.0,
+         'speedup': 2.0},
+        {'query_id': 10, 'best_config': 'jit=on', 'best_median': 5.0, 'worst_median': 5.0,
+         'speedup': 1.0}
+    ]
+    # query 10 failed with jit=off and is not ranked
+    assert overall.to_dict('records') == [
+        {'config': 'jit=off', 'queries_ok': 2, 'total_median': 3.0},
+        {'config': 'jit=on', 'queries_ok': 3, 'total_median': 4.0}
+    ]
+
+
+def test_run(mocker, args, tmp_path):
+    sweep_file = tmp_path / 'sweep.yaml'
+    sweep_file.write_text('work_mem: [64MB, 256MB]\n')
+    args = argparse.Namespace(**{
+        key: value for key, value in vars(args).items() if not key.startswith('__')})
+    args.csv_file = str(tmp_path / 'results.csv')
+    args.sweep = str(sweep_file)
+    args.sweep_search = 'grid'
+    args.sweep_budget = None
+    args.sweep_seed = 0
+    mocker.patch('yaml.load', side_effect=[{'work_mem': ['64MB', '256MB']},
+                                           {'dbconfig': {'jit': 'off'}}, {}])
+    dbconfigs = []
+
+    def run(streams):
+        dbconfigs.append(streams.config['dbconfig'])
+        streams.reporting.df = make_df([(1, float(len(dbconfigs)))])
+
+    mocker.patch('s64da_benchmark_toolkit.streams.Streams.run', autospec=True, side_effect=run)
+
+    s = sweep.Sweep(args, Benchmark(name='tpch', base_dir='benchmarks/tpch'))
+    s.run()
+
+    assert dbconfigs == [{'jit': 'off', 'work_mem': '64MB'}, {'work_mem': '256MB'}]
+    assert (tmp_path / 'results_sweep0.csv').exists()
+    assert (tmp_path / 'results_sweep_queries.csv').read_text().splitlines() == [
+        'query_id;best_config;best_median;worst_median;speedup', '1;work_mem=64MB;1.0;2.0;2.0']
+
+
+def test_run_skips_unapplied_configs(mocker, args, tmp_path):
+    sweep_file = tmp_path / 'sweep.yaml'
+    sweep_file.write_text('shared_buffers: [1GB, 2GB]\n')
+    args = argparse.Namespace(**{
+        key: value for key, value in vars(args).items() if not key.startswith('__')})
+    args.csv_file = str(tmp_path / 'results.csv')
+    args.sweep = str(sweep_file)
+    args.sweep_search = 'grid'
+    args.sweep_budget = None
+    args.sweep_seed = 0
+    mocker.patch('yaml.load', side_effect=[{'shared_buffers': ['1GB', '2GB']}, {}, {}])
+    make_run_dir = mocker.spy(RunJournal, 'make_run_dir')
+
+    def run(streams):
+        if streams.config['dbconfig'] == {'shared_buffers': '1GB'}:
+            raise ConfigNotAppliedException({'shared_buffers': 'requires a restart'})
+        streams.reporting.df = make_df([(1, 1.0)])
+
+    mocker.patch('s64da_benchmark_toolkit.streams.Streams.run', autospec=True, side_effect=run)
+
+    s = sweep.Sweep(args, Benchmark(name='tpch', base_dir='benchmarks/tpch'))
+    s.run()
+
+    # one run directory for the sweep, the configurations are journaled below it
+    assert make_run_dir.call_count == 1
+    assert (tmp_path / 'results_sweep.csv').read_text().splitlines() == [
+        'config;queries_ok;total_median', 'shared_buffers=2GB;1;1.0']
@@ -0,0 +1,89 @@
+from collections import Counter
+
+import pytest
+
+from s64da_benchmark_toolkit import waitevents
+
+DSN = 'postgresql://postgres@nowhere:1234/foodb'
+
+
+@pytest.fixture
+def cursor(mocker):
+    psycopg2_connect = mocker.patch('psycopg2.connect')
+    return psycopg2_connect.return_value.cursor.return_value
+
+
+def test_tag_query():
+    sql = waitevents.tag_query('SELECT 1', 3, 15)
+
+    assert waitevents.parse_tag(sql) == ('3', '15')
+    assert waitevents.parse_tag('SELECT 1') is None
+    assert waitevents.parse_tag(None) is None
+
+
+def test_count():
+    counts = Counter()
+    tagged = waitevents.tag_query('SELECT 1', 0, 1)
+
+    waitevents.WaitEventSampler.count(counts, [
+        (tagged, 'IO', 'DataFileRead'),
+        (tagged, 'IO', 'DataFileRead'),
+        (tagged, None, None),
+        ('SELECT 1', 'Lock', 'relation')
+    ])
+
+    assert counts == {('0', '1', 'IO:DataFileRead'): 2, ('0', '1', waitevents.CPU): 1}
+
+
+def test_run(mocker, cursor):
+    sampler = waitevents.WaitEventSampler(DSN, 0.5)
+    tagged = waitevents.tag_query('SELECT 1', 0, 1)
+    cursor.fetchone.return_value = (130000,)
+
+    def fetchall():
+        sampler.stop_event.set()
+        return [(tagged, 'IPC', 'BgWorkerShutdown'), (tagged, None, None)]
+
+    cursor.fetchall.side_effect = fetchall
+
+    sampler.run()
+
+    assert 'activity.leader_pid' in cursor.execute.call_args[0][0]
+    frame = sampler.make_frame(sampler.results.get(timeout=1))
+    assert frame.to_dict('records') == [
+        {'stream_id': '0', 'query_id': '1', 'wait_event': 'IPC:BgWorkerShutdown', 'samples': 1,
+         'seconds': 0.5},
+        {'stream_id': '0', 'query_id': '1', 'wait_event': 'CPU', 'samples': 1, 'seconds': 0.5}
+    ]
+
+
+def test_summarize():
+    sampler = waitevents.WaitEventSampler(DSN, 0.1)
+    frame = sampler.make_frame({
+        ('1', '10', 'CPU'): 10,
+        ('1', '2', 'CPU'): 1,
+        ('2', '2', 'CPU'): 2,
+        ('2', '2', 'IO:DataFileRead'): 9,
+        ('2', '2', 'Lock:relation'): 4
+    })
+
+    assert list(zip(frame['stream_id'], frame['query_id'])) == [
+        ('1', '2'), ('1', '10'), ('2', '2'), ('2', '2'), ('2', '2')]
+
+    summary = waitevents.summarize(frame, top=2)
+
+    assert summary['query_id'].tolist() == ['2', '2', '10']
+    assert summary['wait_event'].tolist() == ['IO:DataFileRead', 'Lock:relation', 'CPU']
+    assert summary['seconds'].tolist() == pytest.approx([0.9, 0.4, 1.0])
+    assert summary['share'].tolist() == pytest.approx([0.5625, 0.25, 1.0])
+
+
+def test_report(tmp_path, capsys):
+    frame = waitevents.WaitEventSampler(DSN, 0.1).make_frame({('1', '2', 'CPU'): 1})
+    csv_file = str(tmp_path / 'results.csv')
+
+    waitevents.report(frame, ['csv', 'print'], csv_file)
+
+    assert 'CPU' in capsys.readouterr().out
+    assert (tmp_path / 'results_wait_events.csv').read_text().splitlines() == [
+        'stream_id;query_id;wait_event;samples;seconds', '1;2;CPU;1;0.1']